@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+WaterBroker Chain Watcher - Follows WaterPurchased / PumpActivated logs by block range
+One eth_getLogs per poll replaces one blocking receipt wait per customer
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from web3 import Web3
+
+WATER_PURCHASED = bytes(Web3.keccak(text="WaterPurchased(address,uint256,bytes32)"))
+PUMP_ACTIVATED = bytes(Web3.keccak(text="PumpActivated(bytes32,uint256)"))
+
+
+def pump_id_keys(pump_id):
+    """bytes32 forms a pump id may take on chain
+
+    The web UI sends formatBytes32String("PUMP001"); the SMS receiver sends
+    keccak("PUMP001"). Pending payments are matched against both.
+    """
+    padded = pump_id.encode()[:32].ljust(32, b'\0')
+    return {padded, bytes(Web3.keccak(text=pump_id))}
+
+
+def pump_id_label(pump_id_bytes):
+    """Readable pump id for padded ASCII ids, hex for hashed ones"""
+    stripped = pump_id_bytes.rstrip(b'\0')
+    if stripped and all(32 <= b < 127 for b in stripped):
+        return stripped.decode()
+    return '0x' + pump_id_bytes.hex()
+
+
+def decode_log(log):
+    """Decode a WaterBroker log into a plain dict, or None for other events"""
+    topics = [bytes(t) for t in log['topics']]
+    data = bytes(log['data'])
+    base = {
+        'block_number': log['blockNumber'],
+        'tx_hash': '0x' + bytes(log['transactionHash']).hex(),
+        'log_index': log['logIndex']
+    }
+
+    if topics[0] == WATER_PURCHASED:
+        pump_id = data[32:64]
+        return {
+            **base,
+            'event': 'WaterPurchased',
+            'user': Web3.to_checksum_address(topics[1][-20:]),
+            'credits': int.from_bytes(data[0:32], 'big'),
+            'pump_id_bytes': pump_id,
+            'pump_id': pump_id_label(pump_id)
+        }
+
+    if topics[0] == PUMP_ACTIVATED:
+        return {
+            **base,
+            'event': 'PumpActivated',
+            'pump_id_bytes': topics[1],
+            'pump_id': pump_id_label(topics[1]),
+            'liters': int.from_bytes(data[0:32], 'big')
+        }
+
+    return None
+
+
+def decode_purchase(tx_receipt, contract_address):
+    """WaterPurchased event in a transaction receipt, credits summed, or None
+
+    contract_address must be checksummed; logs from other contracts are ignored.
+    """
+    purchases = [
+        decode_log(log)
+        for log in tx_receipt['logs']
+        if log['address'] == contract_address
+        and log['topics'] and bytes(log['topics'][0]) == WATER_PURCHASED
+    ]
+    if not purchases:
+        return None
+
+    purchase = purchases[0]
+    purchase['credits'] = sum(
+        p['credits'] for p in purchases if p['pump_id_bytes'] == purchase['pump_id_bytes']
+    )
+    return purchase
+
+
+class WaterBrokerWatcher:
+    def __init__(self, w3, contract_address, poll_interval=2.0, confirmations=1,
+                 start_block=None, max_block_range=500, pending_ttl=900, unmatched_limit=1024):
+        self.w3 = w3
+        self.contract_address = Web3.to_checksum_address(contract_address)
+        self.poll_interval = poll_interval
+        self.confirmations = confirmations
+        self.max_block_range = max_block_range
+        self.pending_ttl = pending_ttl
+        self.next_block = start_block
+
+        self.lock = threading.Lock()
+        # pump id bytes32 -> list of pending payments, oldest first
+        self.pending = {}
+        # tx hash -> recent WaterPurchased event nobody was waiting for yet,
+        # e.g. a send that was mined before its payment called expect()
+        self.unmatched = OrderedDict()
+        self.unmatched_limit = unmatched_limit
+        self.activation_listeners = []
+
+        self.running = False
+        self.thread = None
+
+    def expect(self, pump_id, on_match, tx_hash=None, on_expire=None, **context):
+        """Wait (without blocking) for a WaterPurchased event for pump_id
+
+        on_match(payment, event) fires from the watcher thread. When tx_hash
+        is known the event must come from that transaction, or from one of
+        its fee-bumped replacements (see add_tx_hash). If that transaction's
+        event was already seen, on_match fires before expect() returns.
+        """
+        payment = {
+            'pump_id': pump_id,
+            'tx_hashes': {tx_hash.lower()} if tx_hash else set(),
+            'on_match': on_match,
+            'on_expire': on_expire,
+            'deadline': time.time() + self.pending_ttl,
+            **context
+        }
+        with self.lock:
+            event = self.unmatched.pop(tx_hash.lower(), None) if tx_hash else None
+            if event is None:
+                for key in pump_id_keys(pump_id):
+                    self.pending.setdefault(key, []).append(payment)
+        if event:
+            self._settle(payment, event)
+        return payment
+
+    def cancel(self, payment):
+        """Stop waiting for a payment returned by expect(); no-op once matched"""
+        with self.lock:
+            self._remove(payment)
+
+    def add_tx_hash(self, old_tx_hash, new_tx_hash):
+        """Also accept new_tx_hash for a payment whose tx was re-sent with higher fees
+
+        The old hash is kept: whichever version gets mined settles the payment.
+        """
+        settled = None
+        with self.lock:
+            event = self.unmatched.get(new_tx_hash.lower())
+            for payments in list(self.pending.values()):
+                for payment in payments:
+                    if old_tx_hash.lower() in payment['tx_hashes']:
+                        payment['tx_hashes'].add(new_tx_hash.lower())
+                        if event and settled is None:
+                            # The replacement was mined before we heard about it
+                            settled = payment
+            if settled:
+                self.unmatched.pop(new_tx_hash.lower())
+                self._remove(settled)
+        if settled:
+            self._settle(settled, event)
+    
+    def on_pump_activated(self, listener):
+        """listener(event) for every PumpActivated log"""
+        self.activation_listeners.append(listener)
+
+    def pending_count(self):
+        with self.lock:
+            return len({id(p) for payments in self.pending.values() for p in payments})
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="waterbroker-watcher")
+        self.thread.daemon = True
+        self.thread.start()
+        print(f"👀 Watching WaterBroker {self.contract_address} for payments")
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(self.poll_interval + 1)
+
+    def poll_once(self):
+        """Fetch and dispatch logs for all newly confirmed blocks"""
+        head = self.w3.eth.block_number - (self.confirmations - 1)
+        if self.next_block is None:
+            self.next_block = head
+        if head < self.next_block:
+            return 0
+
+        dispatched = 0
+        while self.next_block <= head:
+            to_block = min(head, self.next_block + self.max_block_range - 1)
+            logs = self.w3.eth.get_logs({
+                'address': self.contract_address,
+                'fromBlock': self.next_block,
+                'toBlock': to_block,
+                'topics': [[Web3.to_hex(WATER_PURCHASED), Web3.to_hex(PUMP_ACTIVATED)]]
+            })
+            for log in logs:
+                event = decode_log(log)
+                if event:
+                    self._dispatch(event)
+                    dispatched += 1
+            self.next_block = to_block + 1
+
+        self._expire()
+        return dispatched
+
+    def _dispatch(self, event):
+        if event['event'] == 'PumpActivated':
+            for listener in self.activation_listeners:
+                self._call(listener, event)
+            return
+
+        payment = self._match(event)
+        if payment:
+            self._settle(payment, event)
+
+    def _settle(self, payment, event):
+        print(f"⛓️ Payment confirmed on chain for {payment['pump_id']}: {event['tx_hash'][:12]}...")
+        self._call(payment['on_match'], payment, event)
+
+    def _match(self, event):
+        """Take the pending payment this event settles, if any"""
+        with self.lock:
+            candidates = self.pending.get(event['pump_id_bytes'], [])
+            payment = next((p for p in candidates if event['tx_hash'] in p['tx_hashes']), None)
+            if payment is None:
+                payment = next((p for p in candidates if not p['tx_hashes']), None)
+            if payment is None:
+                # Kept briefly, so a payment that registers its hash late still settles
+                self.unmatched[event['tx_hash']] = event
+                while len(self.unmatched) > self.unmatched_limit:
+                    self.unmatched.popitem(last=False)
+                return None
+            self._remove(payment)
+        return payment
+
+    def _remove(self, payment):
+        for key in pump_id_keys(payment['pump_id']):
+            payments = [p for p in self.pending.get(key, []) if p is not payment]
+            if payments:
+                self.pending[key] = payments
+            else:
+                self.pending.pop(key, None)
+
+    def _expire(self):
+        now = time.time()
+        with self.lock:
+            expired = {
+                id(p): p
+                for payments in self.pending.values()
+                for p in payments
+                if p['deadline'] <= now
+            }
+            for payment in expired.values():
+                self._remove(payment)
+
+        for payment in expired.values():
+            print(f"⏰ No on-chain payment seen for {payment['pump_id']}")
+            if payment['on_expire']:
+                self._call(payment['on_expire'], payment)
+
+    def _call(self, callback, *args):
+        try:
+            callback(*args)
+        except Exception as e:
+            print(f"❌ Watcher callback error: {e}")
+
+    def _run(self):
+        while self.running:
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"❌ Chain watcher error: {e}")
+            time.sleep(self.poll_interval)
+
+
+if __name__ == "__main__":
+    # Local check: npx hardhat node, deploy WaterBroker, then
+    # python chain_watcher.py http://127.0.0.1:8545 <contract address>
+    rpc_url = sys.argv[1] if len(sys.argv) > 1 else 'http://127.0.0.1:8545'
+    contract = sys.argv[2]
+
+    watcher = WaterBrokerWatcher(Web3(Web3.HTTPProvider(rpc_url)), contract, poll_interval=1)
+    watcher.on_pump_activated(lambda e: print(f"🚰 PumpActivated {e['pump_id']}: {e['liters']}L"))
+    watcher.expect('PUMP001', lambda p, e: print(f"💧 WaterPurchased {e['pump_id']} by {e['user']}"))
+    watcher.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        watcher.stop()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+DKG Batch Benchmark - Per-event vs batched Knowledge Asset publishing
+Runs against a local stub DKG node: python dkg_batch_benchmark.py [events] [latency]
+"""
+
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from real_dkg_agent import RealDKGAgent
+from stub_dkg_node import StubDKGNode
+
+
+def make_assets(agent, count):
+    return [
+        agent.create_water_knowledge_asset(
+            {"pump_id": f"PUMP{i % 10:03d}", "liters_dispensed": 10},
+            {"amount": 5000, "currency": "BIF", "tx_hash": f"0x{i:064x}"},
+            {"source": "benchmark"}
+        )
+        for i in range(count)
+    ]
+
+
+def run(agent, assets, workers):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(agent.publish_to_dkg, assets))
+    elapsed = time.perf_counter() - start
+
+    failed = sum(1 for r in results if not r["success"])
+    return elapsed, failed
+
+
+def benchmark(events=500, latency=0.05, workers=25, window=0.5):
+    node = StubDKGNode(latency=latency).start()
+    try:
+        print(f"🧪 {events} events, {latency * 1000:.0f} ms node latency, {workers} workers")
+
+        agent = RealDKGAgent(node.url)
+        assets = make_assets(agent, events)
+        elapsed, failed = run(agent, assets, workers)
+        per_event_requests = node.requests
+        print(f"📤 Per-event: {events / elapsed:8.1f} events/s, "
+              f"{per_event_requests} node requests, {failed} failed")
+
+        node.requests = 0
+        batched = RealDKGAgent(node.url)
+        batched.enable_batching(window_seconds=window, max_batch_size=workers)
+        assets = make_assets(batched, events)
+        elapsed, failed = run(batched, assets, workers)
+        batched.batcher.stop()
+        print(f"📦 Batched:   {events / elapsed:8.1f} events/s, "
+              f"{node.requests} node requests, {failed} failed")
+
+        if node.requests:
+            print(f"📉 Node round-trips cut {per_event_requests / node.requests:.1f}x")
+    finally:
+        node.stop()
+
+
+if __name__ == "__main__":
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    benchmark(events, latency)
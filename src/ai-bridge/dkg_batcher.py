@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+DKG Batcher - Coalesces Knowledge Assets into collection publishes
+Assets submitted within one window are sent to the DKG node in a single request
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+
+
+class DKGBatcher:
+    def __init__(self, dkg_agent, window_seconds=2.0, max_batch_size=25):
+        self.dkg_agent = dkg_agent
+        self.window_seconds = window_seconds
+        self.max_batch_size = max_batch_size
+
+        self.pending = []
+        self.condition = threading.Condition()
+        self.running = True
+
+        # Counters for monitoring how much coalescing we get
+        self.batches_published = 0
+        self.assets_published = 0
+
+        self.thread = threading.Thread(target=self._run, name="dkg-batcher")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, knowledge_asset):
+        """Queue an asset; the Future resolves to its per-event publish result"""
+        future = Future()
+        with self.condition:
+            self.pending.append((knowledge_asset, future))
+            self.condition.notify()
+        return future
+
+    def flush(self):
+        """Publish whatever is pending now instead of waiting for the window"""
+        with self.condition:
+            batch = self.pending
+            self.pending = []
+        if batch:
+            self._publish(batch)
+
+    def stop(self):
+        """Stop the batching thread and publish anything left"""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join()
+        self.flush()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.pending:
+                    self.condition.wait()
+                if not self.running:
+                    return
+
+                # The window opens when the first asset of a batch arrives
+                deadline = time.monotonic() + self.window_seconds
+                while self.running and len(self.pending) < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+
+                batch = self.pending[:self.max_batch_size]
+                self.pending = self.pending[self.max_batch_size:]
+
+            self._publish(batch)
+
+    def _publish(self, batch):
+        assets = [asset for asset, _ in batch]
+        try:
+            result = self.dkg_agent.publish_collection_to_dkg(assets)
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+
+        if result["success"]:
+            self.batches_published += 1
+            self.assets_published += len(batch)
+
+        for asset, future in batch:
+            if result["success"]:
+                future.set_result({
+                    "success": True,
+                    "ual": result["uals"][asset["eventId"]],
+                    "tokenId": result["tokenId"],
+                    "collectionUal": result["ual"]
+                })
+            else:
+                future.set_result({"success": False, "error": result["error"]})
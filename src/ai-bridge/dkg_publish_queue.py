@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+DKG Publish Queue - Durable background publishing for Knowledge Assets
+Jobs are persisted in SQLite and drained by a bounded pool of worker threads
+"""
+
+import json
+import queue
+import threading
+
+# Job lifecycle: queued -> publishing -> published | failed
+QUEUED = 'queued'
+PUBLISHING = 'publishing'
+PUBLISHED = 'published'
+FAILED = 'failed'
+
+
+class DKGPublishQueue:
+    def __init__(self, store, handler, workers=4, max_attempts=3, retry_delay=2.0):
+        """handler(payload) -> {"success": bool, "ual": ..., "error": ...}"""
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        self.threads = []
+        self.running = False
+
+        self.init_db()
+
+    def init_db(self):
+        """Create the durable job table"""
+        self.store.execute('''
+            CREATE TABLE IF NOT EXISTS publish_jobs (
+                event_id TEXT PRIMARY KEY,
+                payload TEXT,
+                status TEXT,
+                attempts INTEGER DEFAULT 0,
+                ual TEXT,
+                error TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self.store.execute(
+            'CREATE INDEX IF NOT EXISTS idx_publish_jobs_status ON publish_jobs (status)'
+        )
+
+    def start(self):
+        """Start worker threads and recover jobs left over from a restart"""
+        if self.running:
+            return
+
+        self.running = True
+        recovered = self.recover()
+        if recovered:
+            print(f"♻️ Recovered {recovered} pending DKG publish jobs")
+
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"dkg-publish-{i}")
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+        print(f"🧵 DKG publish queue running with {self.workers} workers")
+
+    def stop(self, timeout=10):
+        """Stop workers after the jobs already taken are finished"""
+        self.running = False
+        for _ in self.threads:
+            self.jobs.put(None)
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+    def recover(self):
+        """Re-enqueue jobs that were queued or mid-publish when the process stopped
+
+        Runs from start(), before any worker exists, so a job still marked
+        publishing was abandoned by the previous process and is queued again.
+        """
+        with self.lock:
+            self.store.execute(
+                'UPDATE publish_jobs SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE status = ?',
+                (QUEUED, PUBLISHING)
+            )
+            rows = self.store.query(
+                'SELECT event_id FROM publish_jobs WHERE status = ? ORDER BY created_at',
+                (QUEUED,)
+            )
+        for (event_id,) in rows:
+            self.jobs.put(event_id)
+        return len(rows)
+
+    def submit(self, event_id, payload):
+        """Persist a job and hand it to the workers; returns immediately"""
+        with self.lock:
+            self.store.execute('''
+                INSERT OR IGNORE INTO publish_jobs (event_id, payload, status)
+                VALUES (?, ?, ?)
+            ''', (event_id, json.dumps(payload), QUEUED))
+        self.jobs.put(event_id)
+        return {"event_id": event_id, "status": QUEUED}
+
+    def status(self, event_id):
+        """Current state of a job, or None if the event is unknown"""
+        with self.lock:
+            row = self.store.execute('''
+                SELECT status, attempts, ual, error, created_at, updated_at
+                FROM publish_jobs WHERE event_id = ?
+            ''', (event_id,)).fetchone()
+        if not row:
+            return None
+
+        return {
+            "event_id": event_id,
+            "status": row[0],
+            "attempts": row[1],
+            "ual": row[2],
+            "error": row[3],
+            "created_at": row[4],
+            "updated_at": row[5]
+        }
+
+    def depth(self):
+        """Number of jobs waiting for a worker"""
+        return self.jobs.qsize()
+
+    def _update(self, event_id, status, **fields):
+        columns = ["status = ?", "updated_at = CURRENT_TIMESTAMP"]
+        values = [status]
+        for name, value in fields.items():
+            columns.append(f"{name} = ?")
+            values.append(value)
+        values.append(event_id)
+
+        with self.lock:
+            self.store.execute(
+                f"UPDATE publish_jobs SET {', '.join(columns)} WHERE event_id = ?",
+                values
+            )
+
+    def _claim(self, event_id):
+        """Move a queued job to publishing; returns its payload and attempt count
+
+        Only a queued job can be claimed. The same event_id may sit in the
+        queue twice (a repeated submit, or recovery plus a submit), and the
+        second copy must not publish a job another worker already holds.
+        """
+        with self.lock:
+            claimed = self.store.execute('''
+                UPDATE publish_jobs SET status = ?, attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE event_id = ? AND status = ?
+            ''', (PUBLISHING, event_id, QUEUED)).rowcount
+            if not claimed:
+                return None, 0
+
+            row = self.store.execute(
+                'SELECT payload, attempts FROM publish_jobs WHERE event_id = ?',
+                (event_id,)
+            ).fetchone()
+        return json.loads(row[0]), row[1]
+
+    def _worker(self):
+        while self.running:
+            event_id = self.jobs.get()
+            if event_id is None:
+                break
+
+            try:
+                payload, attempts = self._claim(event_id)
+                if payload is None:
+                    continue
+
+                try:
+                    result = self.handler(payload)
+                except Exception as e:
+                    result = {"success": False, "error": str(e)}
+
+                if result.get("success"):
+                    self._update(event_id, PUBLISHED, ual=result.get("ual"), error=None)
+                    print(f"✅ Published {event_id}: {result.get('ual')}")
+                elif attempts < self.max_attempts:
+                    self._update(event_id, QUEUED, error=result.get("error"))
+                    print(f"🔁 Retrying {event_id} ({attempts}/{self.max_attempts}): {result.get('error')}")
+                    self._retry_later(event_id, attempts)
+                else:
+                    self._update(event_id, FAILED, error=result.get("error"))
+                    print(f"❌ Publish failed for {event_id}: {result.get('error')}")
+            finally:
+                self.jobs.task_done()
+
+    def _retry_later(self, event_id, attempts):
+        """Re-enqueue after a backoff without holding the worker"""
+        timer = threading.Timer(self.retry_delay * attempts, self.jobs.put, args=(event_id,))
+        timer.daemon = True
+        timer.start()
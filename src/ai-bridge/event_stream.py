@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Event Stream - Server-Sent Events push channel for the web UIs
+Bridges publish SMS / blockchain / DKG events once; every open kiosk receives them
+"""
+
+import json
+import os
+import queue
+import threading
+import weakref
+from collections import deque
+
+from flask import Response, request, stream_with_context
+
+# Live broadcasters, so a worker can end every stream when it is told to stop
+_broadcasters = weakref.WeakSet()
+
+
+def close_all():
+    """End every open stream in this process (graceful shutdown)"""
+    for broadcaster in list(_broadcasters):
+        broadcaster.close()
+
+
+class EventBroadcaster:
+    def __init__(self, max_queue=100, heartbeat=15, max_clients=None, history=200, overflow_retry=10):
+        """
+        max_clients: streams held open at once (each holds a server thread);
+            default SSE_MAX_CLIENTS, unset means no limit
+        history: recent events replayed to a client reconnecting with Last-Event-ID
+        overflow_retry: seconds a client turned away at the limit waits to reconnect
+        """
+        self.max_queue = max_queue
+        self.heartbeat = heartbeat
+        self.max_clients = max_clients
+        self.overflow_retry = overflow_retry
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.next_id = 0
+        self.history = deque(maxlen=history)
+        self.closed = False
+        self.turned_away = 0
+        _broadcasters.add(self)
+
+    def publish(self, event_type, data):
+        """Send an event to every connected client; slow clients drop events"""
+        with self.lock:
+            self.next_id += 1
+            message = self.format(event_type, data, self.next_id)
+            self.history.append((self.next_id, message))
+            subscribers = list(self.subscribers)
+
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                pass
+
+    def subscriber_count(self):
+        with self.lock:
+            return len(self.subscribers)
+
+    def client_limit(self):
+        if self.max_clients is not None:
+            return self.max_clients
+        limit = os.environ.get('SSE_MAX_CLIENTS')
+        return int(limit) if limit else None
+
+    def close(self):
+        """End open streams and refuse new ones, so shutdown isn't held up by idle kiosks"""
+        with self.lock:
+            self.closed = True
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(None)
+            except queue.Full:
+                # A full queue is drained within one get(); the closed flag ends it then
+                pass
+
+    @staticmethod
+    def format(event_type, data, event_id=None):
+        lines = []
+        if event_id is not None:
+            lines.append(f"id: {event_id}")
+        lines.append(f"event: {event_type}")
+        lines.append(f"data: {json.dumps(data, default=str)}")
+        return "\n".join(lines) + "\n\n"
+
+    def stream(self, initial=(), last_event_id=None):
+        """Generator of SSE frames; initial is a list of (event_type, data) snapshots
+
+        At the client limit the stream sends the snapshots and any missed
+        events, then ends: EventSource reconnects after the retry hint, so an
+        extra kiosk polls instead of holding a thread.
+        """
+        subscriber = queue.Queue(self.max_queue)
+        with self.lock:
+            limit = self.client_limit()
+            live = not self.closed and (limit is None or len(self.subscribers) < limit)
+            if live:
+                self.subscribers.add(subscriber)
+            else:
+                self.turned_away += 1
+            missed = [message for event_id, message in self.history
+                      if last_event_id is not None and event_id > last_event_id]
+
+        try:
+            # Tell EventSource how long to wait before reconnecting
+            yield "retry: 3000\n\n" if live else f"retry: {int(self.overflow_retry * 1000)}\n\n"
+            for event_type, data in initial:
+                yield self.format(event_type, data)
+            for message in missed:
+                yield message
+            if not live:
+                return
+
+            while not self.closed:
+                try:
+                    message = subscriber.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    # Comment frame keeps proxies and idle Wi-Fi links from closing us
+                    yield ": keepalive\n\n"
+                    continue
+                if message is None:
+                    return
+                yield message
+        finally:
+            with self.lock:
+                self.subscribers.discard(subscriber)
+
+    def response(self, initial=()):
+        """Flask response streaming events to one client"""
+        try:
+            last_event_id = int(request.headers.get('Last-Event-ID', ''))
+        except ValueError:
+            last_event_id = None
+        return Response(
+            stream_with_context(self.stream(initial, last_event_id)),
+            mimetype='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            }
+        )
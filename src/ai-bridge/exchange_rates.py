@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Exchange Rates - Local currency to ETH rates shared by every bridge
+TTL cache refreshed in the background from a file or feed; exact Decimal/wei maths
+"""
+
+import json
+import os
+import threading
+import time
+from decimal import ROUND_CEILING, ROUND_DOWN, Context, Decimal
+
+from http_client import get_http_client
+
+WEI_PER_ETH = Decimal(10) ** 18
+MIN_PAYMENT_ETH = Decimal('0.001')
+
+# Fallback when no source is configured (1 unit of currency = N ETH)
+DEFAULT_RATES = {
+    'BIF': '0.000000347',  # Burundi Francs
+    'USD': '0.0004',       # US Dollars
+    'RWF': '0.000000312',  # Rwanda Francs
+    'KES': '0.0000065',    # Kenya Shillings
+}
+
+# Enough digits that amount * rate * 10**18 is never rounded before we choose to
+EXACT = Context(prec=60)
+
+
+def parse_rates(payload):
+    """{"BIF": "0.000000347", ...} or {"rates": {...}} -> {currency: Decimal}"""
+    rates = payload.get('rates', payload)
+    parsed = {}
+    for currency, rate in rates.items():
+        # str() first so JSON floats keep their printed digits
+        value = Decimal(str(rate))
+        if value <= 0:
+            raise ValueError(f"Rate for {currency} must be positive")
+        parsed[currency.upper()] = value
+    if not parsed:
+        raise ValueError("No rates in payload")
+    return parsed
+
+
+class StaticRateSource:
+    def __init__(self, rates=None):
+        self.rates = parse_rates(rates or DEFAULT_RATES)
+        self.name = 'static'
+
+    def fetch(self):
+        return self.rates
+
+
+class FileRateSource:
+    def __init__(self, path):
+        self.path = path
+        self.name = f"file:{path}"
+        self.mtime = None
+        self.rates = None
+
+    def fetch(self):
+        """Re-read the file only when it changed on disk"""
+        mtime = os.stat(self.path).st_mtime
+        if self.rates is None or mtime != self.mtime:
+            with open(self.path) as f:
+                self.rates = parse_rates(json.load(f))
+            self.mtime = mtime
+        return self.rates
+
+
+class HTTPRateSource:
+    def __init__(self, url, http_client=None):
+        self.url = url
+        self.name = f"feed:{url}"
+        self.http = http_client or get_http_client()
+
+    def fetch(self):
+        response = self.http.get(self.url)
+        response.raise_for_status()
+        return parse_rates(response.json())
+
+
+class RateSnapshot:
+    """One immutable set of rates with everything validation needs precomputed"""
+
+    def __init__(self, rates, min_payment_eth, fetched_at):
+        self.rates = rates
+        self.fetched_at = fetched_at
+        self.min_wei = int(EXACT.multiply(min_payment_eth, WEI_PER_ETH))
+        self.wei_per_unit = {c: EXACT.multiply(rate, WEI_PER_ETH) for c, rate in rates.items()}
+        # Smallest whole amount of each currency that clears the minimum
+        self.minimums = {
+            c: (Decimal(self.min_wei) / wei).to_integral_value(ROUND_CEILING)
+            for c, wei in self.wei_per_unit.items()
+        }
+
+
+class RateProvider:
+    def __init__(self, source=None, ttl=300, refresh_interval=None, min_payment_eth=MIN_PAYMENT_ETH):
+        """ttl: seconds before rates count as stale; stale rates are still served
+        while one background refresh runs (stale-while-revalidate)"""
+        self.source = source or StaticRateSource()
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval or ttl / 2
+        self.min_payment_eth = Decimal(str(min_payment_eth))
+
+        self.lock = threading.Lock()
+        self.refreshing = False
+        self.snapshot = None
+        self.last_error = None
+        self.refreshes = 0
+
+        self.running = False
+        self.thread = None
+
+        self.refresh()
+        if self.snapshot is None:
+            # Never start without rates; fall back to the built-in table
+            print(f"⚠️ No rates from {self.source.name}, using defaults: {self.last_error}")
+            self._swap(StaticRateSource().fetch())
+
+    def refresh(self):
+        """Fetch from the source and swap in a new snapshot; keeps the old one on error"""
+        try:
+            rates = self.source.fetch()
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"❌ Exchange rate refresh failed ({self.source.name}): {e}")
+            return False
+        finally:
+            with self.lock:
+                self.refreshing = False
+
+        if self.snapshot is None or rates != self.snapshot.rates:
+            print(f"💱 Rates updated from {self.source.name}: {len(rates)} currencies")
+        self._swap(rates)
+        self.last_error = None
+        return True
+
+    def current(self):
+        """The live snapshot; kicks off a background refresh if it is stale"""
+        snapshot = self.snapshot
+        if time.monotonic() - snapshot.fetched_at > self.ttl:
+            self._revalidate()
+        return snapshot
+
+    def rate(self, currency):
+        """ETH per unit of currency as a Decimal, or None if unsupported"""
+        return self.current().rates.get(currency)
+
+    def currencies(self):
+        return list(self.current().rates)
+
+    def to_eth(self, amount, currency):
+        """Exact ETH value of amount; Decimal('0') for unsupported currencies"""
+        rate = self.current().rates.get(currency)
+        if rate is None:
+            return Decimal(0)
+        return EXACT.multiply(Decimal(amount), rate)
+
+    def to_wei(self, amount, currency):
+        """Wei value of amount, rounded down to a whole wei"""
+        wei_per_unit = self.current().wei_per_unit.get(currency)
+        if wei_per_unit is None:
+            return 0
+        return int(EXACT.multiply(Decimal(amount), wei_per_unit).to_integral_value(ROUND_DOWN))
+
+    def minimum(self, currency):
+        """Smallest amount of currency accepted, or None if unsupported"""
+        return self.current().minimums.get(currency)
+
+    def validate(self, amount, currency):
+        """(is_valid, message) - two dict lookups and a compare"""
+        snapshot = self.current()
+        minimum = snapshot.minimums.get(currency)
+        if minimum is None:
+            return False, f"Unsupported currency: {currency}. Use {', '.join(snapshot.rates)}"
+        if Decimal(amount) < minimum:
+            return False, f"Minimum payment: {self.min_payment_eth} ETH ({minimum} {currency})"
+        return True, "Valid payment"
+
+    def status(self):
+        snapshot = self.snapshot
+        age = time.monotonic() - snapshot.fetched_at
+        return {
+            'source': self.source.name,
+            'rates': {c: f"{r:f}" for c, r in snapshot.rates.items()},
+            'minimums': {c: str(m) for c, m in snapshot.minimums.items()},
+            'age_seconds': round(age, 1),
+            'stale': age > self.ttl,
+            'refreshes': self.refreshes,
+            'last_error': self.last_error
+        }
+
+    def start(self):
+        if self.running:
+            return self
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="rate-refresh")
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+
+    def _swap(self, rates):
+        self.snapshot = RateSnapshot(dict(rates), self.min_payment_eth, time.monotonic())
+        self.refreshes += 1
+
+    def _revalidate(self):
+        with self.lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+        thread = threading.Thread(target=self.refresh, name="rate-revalidate")
+        thread.daemon = True
+        thread.start()
+
+    def _run(self):
+        while self.running:
+            time.sleep(self.refresh_interval)
+            with self.lock:
+                if self.refreshing:
+                    continue
+                self.refreshing = True
+            self.refresh()
+
+
+_default_provider = None
+_default_lock = threading.Lock()
+
+
+def get_rate_provider():
+    """Process-wide provider: RATES_URL feed, else RATES_FILE, else built-in rates"""
+    global _default_provider
+    if _default_provider is None:
+        with _default_lock:
+            if _default_provider is None:
+                url = os.environ.get('RATES_URL')
+                path = os.environ.get('RATES_FILE', os.path.join(os.path.dirname(__file__), 'rates.json'))
+                if url:
+                    source = HTTPRateSource(url)
+                elif os.path.exists(path):
+                    source = FileRateSource(path)
+                else:
+                    source = StaticRateSource()
+                _default_provider = RateProvider(
+                    source,
+                    ttl=float(os.environ.get('RATES_TTL', 300)),
+                    refresh_interval=float(os.environ.get('RATES_REFRESH', 60))
+                ).start()
+    return _default_provider
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Shared HTTP Client - Pooled keep-alive sessions for all outbound bridge calls
+Timeouts, retry with backoff + jitter, and per-host latency / pool reuse metrics
+"""
+
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Responses worth retrying: throttling and transient upstream failures
+RETRY_STATUSES = {429, 502, 503, 504}
+
+# Methods that are safe to send twice; others (POST, PATCH) are retried only
+# when the connection failed before the request went out
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE', 'TRACE'}
+
+
+class HTTPClient:
+    def __init__(self, connect_timeout=3.05, read_timeout=10.0, retries=2,
+                 backoff=0.5, max_backoff=8.0, pool_connections=10, pool_maxsize=20):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        # Imported here so bridges that never call out do not load requests at startup
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.exceptions import ConnectTimeoutError
+        self.retryable_errors = (requests.ConnectionError, requests.Timeout)
+        # Refused or timed-out connects (NewConnectionError subclasses this)
+        self.connect_errors = ConnectTimeoutError
+
+        # One pool per host, connections kept alive between calls
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=0
+        )
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+        self.lock = threading.Lock()
+        self.host_stats = {}
+
+    def request(self, method, url, retries=None, timeout=None, idempotent=None, **kwargs):
+        """Send a request; retries on connection errors, timeouts and RETRY_STATUSES
+
+        A non-idempotent request (POST, PATCH, unless idempotent=True) is
+        retried only if it never reached the server: a read timeout or a 502
+        may follow a request the upstream already acted on.
+        """
+        retries = self.retries if retries is None else retries
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        timeout = timeout or (self.connect_timeout, self.read_timeout)
+        host = urlsplit(url).netloc
+
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except self.retryable_errors as e:
+                self._record(host, time.perf_counter() - start, error=True)
+                if attempt >= retries or not (idempotent or self._not_sent(e)):
+                    raise
+            else:
+                self._record(host, time.perf_counter() - start,
+                             error=response.status_code >= 500)
+                if response.status_code not in RETRY_STATUSES or attempt >= retries or not idempotent:
+                    return response
+
+            attempt += 1
+            self._record_retry(host)
+            time.sleep(self._backoff_delay(attempt))
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def _not_sent(self, error):
+        """True when the connection failed, so the server never saw the request"""
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, self.connect_errors)
+
+    def _backoff_delay(self, attempt):
+        """Exponential backoff with full jitter"""
+        ceiling = min(self.max_backoff, self.backoff * (2 ** (attempt - 1)))
+        return random.uniform(0, ceiling)
+
+    def _stats(self, host):
+        stats = self.host_stats.get(host)
+        if stats is None:
+            stats = self.host_stats[host] = {
+                "requests": 0,
+                "errors": 0,
+                "retries": 0,
+                "latency_total": 0.0,
+                "latency_max": 0.0
+            }
+        return stats
+
+    def _record(self, host, elapsed, error=False):
+        with self.lock:
+            stats = self._stats(host)
+            stats["requests"] += 1
+            stats["latency_total"] += elapsed
+            stats["latency_max"] = max(stats["latency_max"], elapsed)
+            if error:
+                stats["errors"] += 1
+
+    def _record_retry(self, host):
+        with self.lock:
+            self._stats(host)["retries"] += 1
+
+    def metrics(self):
+        """Per-host latency and connection pool reuse"""
+        hosts = {}
+        with self.lock:
+            for host, stats in self.host_stats.items():
+                hosts[host] = {
+                    "requests": stats["requests"],
+                    "errors": stats["errors"],
+                    "retries": stats["retries"],
+                    "latency_avg_ms": round(1000 * stats["latency_total"] / max(stats["requests"], 1), 2),
+                    "latency_max_ms": round(1000 * stats["latency_max"], 2)
+                }
+
+        # urllib3 counts new sockets and requests per host pool
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = pool.host if pool.port in (None, 80, 443) else f"{pool.host}:{pool.port}"
+            entry = hosts.setdefault(host, {})
+            entry["connections_opened"] = entry.get("connections_opened", 0) + pool.num_connections
+            entry["requests_sent"] = entry.get("requests_sent", 0) + pool.num_requests
+
+        for entry in hosts.values():
+            if entry.get("requests_sent"):
+                reused = entry["requests_sent"] - entry["connections_opened"]
+                entry["connection_reuse"] = round(max(reused, 0) / entry["requests_sent"], 3)
+
+        return hosts
+
+    def close(self):
+        self.session.close()
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def get_http_client():
+    """Process-wide client, configured from HTTP_* environment variables"""
+    global _default_client
+    if _default_client is None:
+        with _default_lock:
+            if _default_client is None:
+                _default_client = HTTPClient(
+                    connect_timeout=float(os.environ.get('HTTP_CONNECT_TIMEOUT', 3.05)),
+                    read_timeout=float(os.environ.get('HTTP_READ_TIMEOUT', 10)),
+                    retries=int(os.environ.get('HTTP_RETRIES', 2)),
+                    pool_maxsize=int(os.environ.get('HTTP_POOL_SIZE', 20))
+                )
+    return _default_client
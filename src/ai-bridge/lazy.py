@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Lazy - Clients built on first use instead of at import or startup
+web3 alone takes seconds to import on a Raspberry Pi; a bridge must not pay that to boot
+"""
+
+import threading
+
+
+class lazy_property:
+    """functools.cached_property, except only one thread runs the factory
+
+    The value lands in the instance __dict__, so later reads are plain
+    attribute lookups, and assigning the attribute (e.g. a stub) still works.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.name = factory.__name__
+        self.__doc__ = factory.__doc__
+        self.lock = threading.Lock()
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        try:
+            return instance.__dict__[self.name]
+        except KeyError:
+            pass
+        with self.lock:
+            if self.name not in instance.__dict__:
+                instance.__dict__[self.name] = self.factory(instance)
+        return instance.__dict__[self.name]
+
+
+def web3_client(url):
+    """Web3 over HTTP; web3 (and eth_account under it) is imported here, not by callers"""
+    from web3 import Web3
+    return Web3(Web3.HTTPProvider(url))
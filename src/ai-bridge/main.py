@@ -4,22 +4,26 @@ MajiSafe AI Bridge - SMS Payment Processor
 Receives SMS payments from ESP32, validates, processes blockchain, activates pump
 """
 
-import asyncio
-import sqlite3
-from web3 import Web3
-import requests
 import json
 import os
-from flask import Flask, request, jsonify
-import re
+from flask import Blueprint, Flask, request, jsonify
 from datetime import datetime
 
-app = Flask(__name__)
+from http_client import get_http_client
+from lazy import lazy_property, web3_client
+from storage import SQLiteStore
+from exchange_rates import get_rate_provider
+from sms_parser import parse_payment
+from pump_dispatcher import get_pump_dispatcher
+from metrics import SMS_TOTAL, get_metrics, instrument, stage_timer
+
+bp = Blueprint('main', __name__)
+
+stage = stage_timer('main')
 
 class MajiSafeAI:
     def __init__(self):
-        # Blockchain setup
-        self.w3 = Web3(Web3.HTTPProvider('https://sepolia.base.org'))
+        # Blockchain setup (the Web3 client is built on first use)
         self.contract_address = '0x4933781A5DDC86bdF9c9C9795647e763E0429E28'
         self.contract_abi = [
             "function buyWater(bytes32 pumpId) payable",
@@ -27,20 +31,21 @@ class MajiSafeAI:
             "event WaterPurchased(address indexed user, uint256 credits, bytes32 pumpId)"
         ]
         
-        # Payment rates (Burundi Francs to ETH)
-        self.exchange_rates = {
-            'BIF': 0.000000347,  # 1 BIF = 0.000000347 ETH (example rate)
-            'USD': 0.0004,       # 1 USD = 0.0004 ETH
-        }
+        # Payment rates (local currency to ETH), refreshed in the background
+        self.exchange_rates = get_rate_provider()
         
         self.init_db()
         print("🤖 MajiSafe AI Bridge Started")
         print("💧 Ready to process SMS payments from rural Africa")
     
+    @lazy_property
+    def w3(self):
+        return web3_client(os.environ.get('RPC_URL', 'https://sepolia.base.org'))
+    
     def init_db(self):
         """Initialize payment database"""
-        self.conn = sqlite3.connect('payments.db', check_same_thread=False)
-        self.conn.execute('''
+        self.db = SQLiteStore('payments.db')
+        self.db.execute('''
             CREATE TABLE IF NOT EXISTS sms_payments (
                 id INTEGER PRIMARY KEY,
                 phone_number TEXT,
@@ -52,39 +57,26 @@ class MajiSafeAI:
                 timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
             )
         ''')
-        self.conn.commit()
     
     def parse_sms_payment(self, sms_text, phone_number):
         """Parse SMS: 'PAY 1000 BIF PUMP001' or 'PAY 5 USD PUMP001'"""
-        try:
-            # Extract payment info using regex
-            pattern = r'PAY\s+(\d+)\s+(\w+)\s+(\w+)'
-            match = re.search(pattern, sms_text.upper())
-            
-            if not match:
-                return None
-                
-            amount = float(match.group(1))
-            currency = match.group(2)
-            pump_id = match.group(3)
-            
-            return {
-                'phone': phone_number,
-                'amount': amount,
-                'currency': currency,
-                'pump_id': pump_id,
-                'eth_equivalent': amount * self.exchange_rates.get(currency, 0)
-            }
-        except Exception as e:
-            print(f"❌ SMS parsing error: {e}")
+        command = parse_payment(sms_text)
+        if not command:
             return None
+        
+        return {
+            'phone': phone_number,
+            'amount': command.amount,
+            'currency': command.currency,
+            'pump_id': command.pump_id,
+            'eth_equivalent': self.exchange_rates.to_eth(command.amount, command.currency)
+        }
     
     def validate_payment(self, payment_data):
         """Validate payment amount and pump ID"""
-        min_payment_eth = 0.001  # Minimum 0.001 ETH
-        
-        if payment_data['eth_equivalent'] < min_payment_eth:
-            return False, f"Insufficient payment. Minimum: {min_payment_eth} ETH"
+        is_valid, message = self.exchange_rates.validate(payment_data['amount'], payment_data['currency'])
+        if not is_valid:
+            return False, message
         
         if not payment_data['pump_id'].startswith('PUMP'):
             return False, "Invalid pump ID"
@@ -112,29 +104,38 @@ class MajiSafeAI:
             return False, str(e)
     
     def send_pump_activation(self, pump_id, duration=10):
-        """Send activation command back to ESP32"""
-        try:
-            # In real implementation, send HTTP request to ESP32
-            esp32_ip = "192.168.1.100"  # ESP32 IP address
-            activation_url = f"http://{esp32_ip}/activate"
-            
-            payload = {
-                'pump_id': pump_id,
-                'duration': duration,
-                'command': 'ACTIVATE'
-            }
-            
-            # For demo, just print the command
-            print(f"🚰 Sending activation to {pump_id}: {duration} seconds")
-            print(f"📡 Command sent to ESP32: {payload}")
-            
-            return True
-            
-        except Exception as e:
-            print(f"❌ Pump activation error: {e}")
-            return False
+        """Send activation command to the pump's ESP32 and wait for its ack"""
+        print(f"🚰 Sending activation to {pump_id}: {duration} seconds")
+        
+        result = get_pump_dispatcher().activate(pump_id, duration)
+        if result['acked']:
+            print(f"📡 ESP32 acked {result['command_id']} in {result['latency_ms']}ms")
+        else:
+            print(f"❌ Pump activation error: {result['error']}")
+        
+        return result['acked']
+
+# Global AI instance, built by create_app() in each worker process
+ai_bridge = None
 
-@app.route('/sms-payment', methods=['POST'])
+def create_app():
+    global ai_bridge
+    if ai_bridge is None:
+        ai_bridge = MajiSafeAI()
+    app = Flask(__name__)
+    app.register_blueprint(bp)
+    get_metrics().gauge('majisafe_pump_commands', 'Pump dispatcher counters (sent, acked, retries, ...)',
+                        lambda: {name: value for name, value in get_pump_dispatcher().stats().items()
+                                 if isinstance(value, int) and name != 'pumps'}, ('kind',))
+    return instrument(app, 'main')
+
+def shutdown():
+    """Commit queued payment rows and stop pump dispatch before the process exits"""
+    if ai_bridge:
+        ai_bridge.db.close()
+        get_pump_dispatcher().close()
+
+@bp.route('/sms-payment', methods=['POST'])
 def handle_sms_payment():
     """Receive SMS payment from ESP32"""
     try:
@@ -145,31 +146,39 @@ def handle_sms_payment():
         print(f"📱 SMS Payment received from {phone_number}: {sms_text}")
         
         # Parse SMS payment
-        payment_data = ai_bridge.parse_sms_payment(sms_text, phone_number)
+        with stage('parse'):
+            payment_data = ai_bridge.parse_sms_payment(sms_text, phone_number)
         if not payment_data:
+            SMS_TOTAL.inc(bridge='main', outcome='invalid_format')
             return jsonify({'status': 'error', 'message': 'Invalid SMS format'}), 400
         
         # Validate payment
-        is_valid, message = ai_bridge.validate_payment(payment_data)
+        with stage('validate'):
+            is_valid, message = ai_bridge.validate_payment(payment_data)
         if not is_valid:
+            SMS_TOTAL.inc(bridge='main', outcome='rejected')
             print(f"❌ Payment validation failed: {message}")
             return jsonify({'status': 'error', 'message': message}), 400
         
         # Process blockchain transaction
-        success, tx_hash = ai_bridge.process_blockchain_transaction(payment_data)
+        with stage('chain'):
+            success, tx_hash = ai_bridge.process_blockchain_transaction(payment_data)
         if not success:
+            SMS_TOTAL.inc(bridge='main', outcome='chain_failed')
             return jsonify({'status': 'error', 'message': tx_hash}), 500
         
         # Log payment
-        ai_bridge.conn.execute('''
-            INSERT INTO sms_payments (phone_number, amount, currency, pump_id, status, blockchain_tx)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (phone_number, payment_data['amount'], payment_data['currency'], 
-              payment_data['pump_id'], 'confirmed', tx_hash))
-        ai_bridge.conn.commit()
+        with stage('log'):
+            ai_bridge.db.insert('''
+                INSERT INTO sms_payments (phone_number, amount, currency, pump_id, status, blockchain_tx)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (phone_number, payment_data['amount'], payment_data['currency'], 
+                  payment_data['pump_id'], 'confirmed', tx_hash))
         
         # Activate pump
-        pump_activated = ai_bridge.send_pump_activation(payment_data['pump_id'])
+        with stage('pump'):
+            pump_activated = ai_bridge.send_pump_activation(payment_data['pump_id'])
+        SMS_TOTAL.inc(bridge='main', outcome='accepted' if pump_activated else 'pump_failed')
         
         response = {
             'status': 'success',
@@ -182,25 +191,27 @@ def handle_sms_payment():
         return jsonify(response)
         
     except Exception as e:
+        SMS_TOTAL.inc(bridge='main', outcome='error')
         print(f"❌ Error processing SMS payment: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
-@app.route('/status', methods=['GET'])
+@bp.route('/status', methods=['GET'])
 def get_status():
     """Get AI Bridge status"""
     return jsonify({
         'status': 'online',
         'service': 'MajiSafe AI Bridge',
         'blockchain': 'Base Sepolia',
-        'contract': ai_bridge.contract_address
+        'contract': ai_bridge.contract_address,
+        'http': get_http_client().metrics(),
+        'pumps': get_pump_dispatcher().stats()
     })
 
 if __name__ == "__main__":
-    ai_bridge = MajiSafeAI()
-    
     print("🚀 Starting MajiSafe AI Bridge Server...")
     print("📱 Listening for SMS payments from ESP32...")
     print("🔗 Connected to Base Sepolia blockchain")
     print("💧 Ready to activate water pumps!")
     
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    from serve import main
+    main('main')
@@ -4,43 +4,48 @@ MajiSafe AI Bridge - SMS Payment Processor
 Receives SMS from ESP32, processes payments, activates pumps
 """
 
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, request, jsonify
 from flask_cors import CORS
-from web3 import Web3
-import sqlite3
-import re
 from datetime import datetime
+import os
+import time
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for web UI communication
+bp = Blueprint('majisafe_ai', __name__)
 
-from metamask_only import MetaMaskOnly
+from lazy import lazy_property, web3_client
+from storage import SQLiteStore, keyset_page, normalize_timestamp
+from event_stream import EventBroadcaster
+from payment_sessions import PaymentSessionStore
+from payment_confirmation import SUCCESS, make_confirmer
+from exchange_rates import get_rate_provider
+from sms_parser import HELP_TEXT, parse_cached, parse_payment
+from sms_dedup import SMSDeduplicator
+from metrics import SMS_STAGE_SECONDS, SMS_TOTAL, get_metrics, instrument, stage_timer
 
 class MajiSafeAI:
     def __init__(self):
-        # Use MOONBASE ALPHA (same as web UI)
-        self.w3 = Web3(Web3.HTTPProvider('https://rpc.api.moonbase.moonbeam.network'))
+        # Use MOONBASE ALPHA (same as web UI); w3 is built on first use
         self.contract_address = '0x4933781A5DDC86bdF9c9C9795647e763E0429E28'
         
-        # MetaMask-only automation
-        self.metamask_only = None
+        # Settles each SMS payment on a web UI callback, chain event or operator
+        # action (PAYMENT_CONFIRMATION picks the backend); nothing blocks on it
+        self.confirmer = make_confirmer(w3=lambda: self.w3, contract_address=self.contract_address)
         
-        # Currency exchange rates (for validation only)
-        self.rates = {
-            'BIF': 0.000000347,  # Burundi Francs
-            'USD': 0.0004,       # US Dollars
-            'RWF': 0.000000312,  # Rwanda Francs
-            'KES': 0.0000065,    # Kenya Shillings
-        }
+        # Currency exchange rates (for validation only), refreshed in the background
+        self.rates = get_rate_provider()
         
         self.init_db()
         print("🤖 MajiSafe AI Bridge Ready")
         print("🔗 Using Base Sepolia (same as web UI)")
-        print("🦊 Will auto-confirm MetaMask when you click Buy Water")
+        print(f"🦊 Payments confirmed by: {self.confirmer.source}")
+    
+    @lazy_property
+    def w3(self):
+        return web3_client(os.environ.get('RPC_URL', 'https://rpc.api.moonbase.moonbeam.network'))
     
     def init_db(self):
-        self.conn = sqlite3.connect('majisafe_payments.db', check_same_thread=False)
-        self.conn.execute('''
+        self.db = SQLiteStore('majisafe_payments.db')
+        self.db.execute('''
             CREATE TABLE IF NOT EXISTS sms_payments (
                 id INTEGER PRIMARY KEY,
                 phone TEXT,
@@ -54,176 +59,342 @@ class MajiSafeAI:
                 timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
             )
         ''')
-        self.conn.commit()
+        
+        # Dashboard queries seek newest-first, optionally narrowed by one filter
+        for name, columns in (
+            ('idx_sms_payments_timestamp', 'timestamp, id'),
+            ('idx_sms_payments_pump', 'pump_id, timestamp, id'),
+            ('idx_sms_payments_phone', 'phone, timestamp, id'),
+            ('idx_sms_payments_status', 'status, timestamp, id'),
+            ('idx_sms_payments_tx', 'tx_hash'),
+        ):
+            self.db.execute(f'CREATE INDEX IF NOT EXISTS {name} ON sms_payments ({columns})')
+        
+        # Gateway retries and re-delivered SMS are answered from here, not re-processed
+        self.dedup = SMSDeduplicator(self.db)
     
     def parse_payment_sms(self, message):
         """Parse: PAY 5000 BIF PUMP001"""
-        try:
-            parts = message.upper().strip().split()
-            if len(parts) != 4 or parts[0] != 'PAY':
-                return None
-            
-            amount = float(parts[1])
-            currency = parts[2]
-            pump_id = parts[3]
-            
-            # Convert to ETH
-            eth_amount = amount * self.rates.get(currency, 0)
-            
-            return {
-                'amount': amount,
-                'currency': currency,
-                'pump_id': pump_id,
-                'eth_amount': eth_amount
-            }
-        except Exception as e:
-            print(f"❌ SMS parse error: {e}")
+        command = parse_payment(message)
+        if not command:
             return None
+        
+        return {
+            'amount': command.amount,
+            'currency': command.currency,
+            'pump_id': command.pump_id,
+            # Convert to ETH
+            'eth_amount': self.rates.to_eth(command.amount, command.currency)
+        }
     
     def validate_payment(self, payment_data):
         """Validate payment amount and pump ID"""
-        min_eth = 0.001  # Minimum payment
-        
-        if payment_data['eth_amount'] < min_eth:
-            return False, f"Minimum payment: {min_eth} ETH ({int(min_eth / self.rates.get(payment_data['currency'], 1))} {payment_data['currency']})"
+        is_valid, message = self.rates.validate(payment_data['amount'], payment_data['currency'])
+        if not is_valid:
+            return False, message
         
         if not payment_data['pump_id'].startswith('PUMP'):
             return False, "Invalid pump ID format"
         
         return True, "Valid payment"
     
-    def process_blockchain_payment(self, payment_data):
-        """Process payment with MetaMask-only automation"""
-        try:
-            print(f"🦊 Starting MetaMask automation for: {payment_data['amount']} {payment_data['currency']}")
-            print("👤 Please open http://localhost:8000 and click 'Buy Water'")
-            
-            # Initialize MetaMask automation if not already done
-            if not self.metamask_only:
-                self.metamask_only = MetaMaskOnly()
-            
-            # Wait for user to click Buy Water, then auto-confirm MetaMask
-            result = self.metamask_only.wait_for_metamask_and_confirm(
-                payment_data.get('phone', ''),
-                f"PAY {payment_data['amount']} {payment_data['currency']} {payment_data['pump_id']}"
-            )
-            
-            if result['status'] == 'success':
-                print(f"✅ MetaMask confirmation successful!")
-                return True, result.get('tx_hash', 'metamask_confirmed')
-            else:
-                print(f"❌ MetaMask confirmation failed: {result['message']}")
-                return False, result['message']
-            
-        except Exception as e:
-            print(f"❌ MetaMask automation error: {e}")
-            return False, str(e)
+    def await_confirmation(self, session, message, row):
+        """Start waiting for the session's payment; returns a Future at once
+
+        row is the insert Future of the SMS's sms_payments row, which gets the outcome.
+        """
+        future = self.confirmer.request(session['pump_id'], session['phone'],
+                                        session=session, message=message, row=row)
+        future.add_done_callback(payment_settled)
+        return future
+
+# Global AI instance, built by create_app() in the worker process
+ai = None
+
+def create_app():
+    global ai
+    if ai is None:
+        ai = MajiSafeAI()
+    app = Flask(__name__)
+    CORS(app)  # Enable CORS for web UI communication
+    app.register_blueprint(bp)
+    
+    metrics = get_metrics()
+    metrics.gauge('majisafe_pending_payments', 'SMS payments waiting for blockchain confirmation',
+                  lambda: len(sessions.active()))
+    metrics.gauge('majisafe_sse_clients', 'Open Server-Sent Events streams',
+                  lambda: {'majisafe_ai': events.subscriber_count()}, ('bridge',))
+    metrics.gauge('majisafe_payment_confirmations', 'SMS payment confirmations by result',
+                  lambda: {k: v for k, v in ai.confirmer.stats().items() if k != 'backend'}, ('result',))
+    return instrument(app, 'majisafe_ai')
 
-# Global AI instance
-ai = MajiSafeAI()
+def shutdown():
+    """End SSE streams, cancel waiting confirmations and commit queued SMS rows before exit"""
+    events.close()
+    if ai:
+        ai.confirmer.close()
+        ai.db.close()
 
-# Track current SMS payment
-current_sms_payment = {
+# Push channel for web UIs (replaces /sms-status polling)
+events = EventBroadcaster()
+
+# Pending SMS payments, per pump and per phone
+sessions = PaymentSessionStore(ttl=600)
+
+stage = stage_timer('majisafe_ai')
+
+def outcome(name):
+    SMS_TOTAL.inc(bridge='majisafe_ai', outcome=name)
+
+# Shape returned when no payment is pending
+IDLE_STATUS = {
     'payment_received': False,
     'phone': '',
     'amount': '',
     'blockchain_confirmed': False
 }
 
-@app.route('/sms-status', methods=['GET'])
+@bp.route('/sms-status', methods=['GET'])
 def get_sms_status():
-    """Get current SMS payment status for web UI"""
-    print(f"🌐 Web UI checking SMS status: {current_sms_payment}")
-    return jsonify(current_sms_payment)
+    """Most recent pending SMS payment (single-pump web UI)"""
+    return jsonify(sessions.newest() or IDLE_STATUS)
 
-@app.route('/test', methods=['GET'])
+@bp.route('/sms-status/<pump_id>', methods=['GET'])
+def get_pump_sms_status(pump_id):
+    """Pending SMS payment for one pump, plus how many customers are queued"""
+    pump_id = pump_id.upper()
+    session = sessions.get(pump_id)
+    queued = sum(1 for s in sessions.active() if s['pump_id'] == pump_id)
+    return jsonify({**(session or IDLE_STATUS), 'pump_id': pump_id, 'queued': queued})
+
+@bp.route('/events', methods=['GET'])
+def event_stream():
+    """Server-Sent Events: sms_received, blockchain_confirmed"""
+    return events.response(initial=[('sms_status', sessions.newest() or IDLE_STATUS)])
+
+@bp.route('/test', methods=['GET'])
 def test_connection():
     """Test endpoint for web UI"""
     return jsonify({'status': 'AI Bridge online', 'message': 'Connection working'})
 
-@app.route('/blockchain-confirmed', methods=['POST'])
+@bp.route('/blockchain-confirmed', methods=['POST'])
 def blockchain_confirmed():
     """Web UI notifies that blockchain transaction is confirmed"""
-    global current_sms_payment
     data = request.json
+    pump_id = (data.get('pump_id') or '').upper()
+    phone = data.get('phone')
     
     print(f"✅ Blockchain confirmed: {data.get('tx_hash')}")
     
-    # Reset payment status for next SMS
-    current_sms_payment = {
-        'payment_received': False,
-        'phone': '',
-        'amount': '',
-        'blockchain_confirmed': True
-    }
+    # Older UIs send only tx_hash: close the most recent payment
+    if not pump_id and not phone:
+        newest = sessions.newest()
+        pump_id = newest['pump_id'] if newest else None
+    
+    # Resolves the payment's future; payment_settled closes the session
+    result = ai.confirmer.confirm(pump_id=pump_id, phone=phone, tx_hash=data.get('tx_hash'),
+                                  request_id=data.get('confirmation_id'), source='web_ui')
+    if not result:
+        return jsonify({'status': 'error', 'message': 'No pending payment for this pump'}), 404
     
-    return jsonify({'status': 'confirmed'})
+    return jsonify({'status': 'confirmed', 'pump_id': result['pump_id']})
+
+def record_outcome(row, result):
+    """Write the confirmation result onto the SMS's sms_payments row, once it is committed"""
+    status = 'confirmed' if result['status'] == SUCCESS else result['status']
+    tx_hash = result['tx_hash'].lower() if result['tx_hash'] else None
+    
+    def update(inserted):
+        if inserted.exception() is None:
+            ai.db.insert('UPDATE sms_payments SET status = ?, tx_hash = ? WHERE id = ?',
+                         (status, tx_hash, inserted.result()))
+    row.add_done_callback(update)
+
+def payment_settled(future):
+    """Confirmation backend callback, from whichever thread resolved the payment"""
+    result = future.result()
+    session = future.request['session']
+    record_outcome(future.request['row'], result)
+    
+    if result['status'] != SUCCESS:
+        sessions.cancel(session)
+        print(f"⏰ Payment for {result['pump_id']} not confirmed ({result['status']}): {result['message']}")
+        events.publish(f"payment_{result['status']}", {
+            'pump_id': result['pump_id'],
+            'phone': result['phone'],
+            'message': result['message']
+        })
+        return
+    
+    sessions.confirm(session=session, tx_hash=result['tx_hash'])
+    # SMS accepted -> payment confirmed (web UI, chain or operator)
+    SMS_STAGE_SECONDS.observe(time.time() - session['opened_at'], bridge='majisafe_ai', stage='chain')
+    events.publish('blockchain_confirmed', {
+        'tx_hash': result['tx_hash'],
+        'pump_id': result['pump_id'],
+        'phone': result['phone'],
+        'source': result['source']
+    })
+
+@bp.route('/confirmations', methods=['GET'])
+def list_confirmations():
+    """Payments waiting for confirmation, for an operator"""
+    waiting = [{k: v for k, v in r.items() if k not in ('session', 'watch', 'row')}
+               for r in ai.confirmer.waiting()]
+    return jsonify({**ai.confirmer.stats(), 'waiting': waiting})
 
-@app.route('/process-sms', methods=['POST'])
+@bp.route('/confirmations/<request_id>', methods=['POST'])
+def operator_confirmation(request_id):
+    """Operator settles a payment by hand
+
+    Body: {"action": "confirm", "tx_hash"?} or {"action": "reject", "reason"?}
+    """
+    data = request.get_json(silent=True) or {}
+    if data.get('action') == 'confirm':
+        result = ai.confirmer.confirm(request_id=request_id, tx_hash=data.get('tx_hash'), source='operator')
+    elif data.get('action') == 'reject':
+        result = ai.confirmer.reject(data.get('reason') or 'Rejected by operator',
+                                     request_id=request_id, source='operator')
+    else:
+        return jsonify({'status': 'error', 'message': 'action must be confirm or reject'}), 400
+    
+    if not result:
+        return jsonify({'status': 'error', 'message': 'No pending payment with this id'}), 404
+    return jsonify(result)
+
+def answer_command(command, phone):
+    """Reply to the non-payment SMS commands"""
+    if command.command == 'HELP':
+        return {'status': 'success', 'command': 'HELP', 'message': HELP_TEXT}
+    
+    if command.command == 'STATUS':
+        session = sessions.get(command.pump_id) if command.pump_id else sessions.for_phone(phone)
+        if not session:
+            return {'status': 'success', 'command': 'STATUS', 'message': 'No pending payment'}
+        return {
+            'status': 'success',
+            'command': 'STATUS',
+            'pump_id': session['pump_id'],
+            'message': f"{session['amount']} for {session['pump_id']} waiting for blockchain confirmation"
+        }
+    
+    # BAL: confirmed payments only (uses the phone index on sms_payments)
+    rows = ai.db.query(
+        "SELECT currency, SUM(amount) FROM sms_payments WHERE phone = ? AND status = 'confirmed' "
+        "GROUP BY currency",
+        (phone,)
+    )
+    balances = {currency: total for currency, total in rows}
+    paid = ', '.join(f"{total:g} {currency}" for currency, total in balances.items())
+    return {
+        'status': 'success',
+        'command': 'BAL',
+        'balances': balances,
+        'message': f"Total paid: {paid}" if paid else 'No payments from this phone yet'
+    }
+
+@bp.route('/process-sms', methods=['POST'])
 def process_sms():
-    """Main SMS processing endpoint"""
+    """Main SMS processing endpoint
+
+    Optional message_id / sent_at from the gateway make retries exact;
+    without them the same SMS within the dedup window counts as a retry.
+    """
+    dedup_key = None
     try:
-        global current_sms_payment
-        
         data = request.json
         phone = data.get('phone', '')
         message = data.get('message', '')
         
         print(f"\n📱 SMS from {phone}: {message}")
         
+        # BAL / STATUS / HELP are answered directly; only PAY goes on
+        with stage('parse'):
+            command = parse_cached(message)
+        if command and command.command != 'PAY':
+            outcome('command')
+            return jsonify(answer_command(command, phone))
+        
         # Parse payment SMS
-        payment_data = ai.parse_payment_sms(message)
+        with stage('convert'):
+            payment_data = ai.parse_payment_sms(message)
         if not payment_data:
+            outcome('invalid_format')
             return jsonify({
                 'status': 'error',
                 'message': 'Invalid format. Send: PAY [amount] [currency] [pump]\nExample: PAY 5000 BIF PUMP001'
             })
         
+        # A retried POST of the same SMS gets the first response back
+        with stage('dedup'):
+            dedup_key, duplicate = ai.dedup.claim(phone, message, data.get('message_id') or data.get('sent_at'))
+        if duplicate:
+            outcome('duplicate')
+            print(f"🔁 Duplicate SMS from {phone} - answered from cache")
+            return jsonify(duplicate)
+        
         print(f"💰 Parsed: {payment_data['amount']} {payment_data['currency']} = {payment_data['eth_amount']} ETH")
         
         # Validate payment
-        is_valid, validation_msg = ai.validate_payment(payment_data)
+        with stage('validate'):
+            is_valid, validation_msg = ai.validate_payment(payment_data)
         if not is_valid:
+            outcome('rejected')
             print(f"❌ Validation failed: {validation_msg}")
-            return jsonify({
+            response = {
                 'status': 'error',
                 'message': validation_msg
-            })
+            }
+            ai.dedup.complete(dedup_key, response)
+            return jsonify(response)
         
-        # Set SMS payment received status for web UI
-        current_sms_payment = {
-            'payment_received': True,
-            'phone': phone,
-            'amount': f"{payment_data['amount']} {payment_data['currency']}",
-            'blockchain_confirmed': False
-        }
+        # Log SMS payment (queued; commit time is in majisafe_db_commit_seconds).
+        # It stays pending_blockchain until the confirmation settles it
+        with stage('log'):
+            row = ai.db.insert('''
+                INSERT INTO sms_payments (phone, sms_content, amount, currency, pump_id, eth_amount, tx_hash, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (phone, message, payment_data['amount'], payment_data['currency'],
+                  payment_data['pump_id'], payment_data['eth_amount'], None, 'pending_blockchain'))
+        
+        # Open a pending session for this pump; other pumps are unaffected
+        with stage('session'):
+            session = sessions.open(payment_data['pump_id'], phone,
+                                    payment_data['amount'], payment_data['currency'])
+            confirmation = ai.await_confirmation(session, message, row)
+            events.publish('sms_received', {
+                'phone': phone,
+                'amount': payment_data['amount'],
+                'currency': payment_data['currency'],
+                'pump_id': payment_data['pump_id']
+            })
         
         print(f"✅ SMS payment received - web UI button will activate")
         print(f"👤 User must now click 'Purchase Water' in web UI")
         
-        # Log SMS payment
-        ai.conn.execute('''
-            INSERT INTO sms_payments (phone, sms_content, amount, currency, pump_id, eth_amount, tx_hash, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (phone, message, payment_data['amount'], payment_data['currency'],
-              payment_data['pump_id'], payment_data['eth_amount'], 'sms_received', 'pending_blockchain'))
-        ai.conn.commit()
-        
-        return jsonify({
+        response = {
             'status': 'success',
             'message': 'SMS payment received - activate web UI button',
             'phone': phone,
-            'amount': f"{payment_data['amount']} {payment_data['currency']}"
-        })
+            'pump_id': payment_data['pump_id'],
+            'amount': f"{payment_data['amount']} {payment_data['currency']}",
+            'confirmation_id': confirmation.request['request_id']
+        }
+        ai.dedup.complete(dedup_key, response)
+        outcome('accepted')
+        return jsonify(response)
         
     except Exception as e:
+        outcome('error')
         print(f"❌ Processing error: {e}")
+        if dedup_key:
+            ai.dedup.release(dedup_key)
         return jsonify({
             'status': 'error',
             'message': 'System error. Please try again.'
         })
 
-@app.route('/status', methods=['GET'])
+@bp.route('/status', methods=['GET'])
 def status():
     """Health check endpoint"""
     return jsonify({
@@ -231,22 +402,47 @@ def status():
         'service': 'MajiSafe AI Bridge',
         'blockchain': 'Base Sepolia',
         'contract': ai.contract_address,
-        'supported_currencies': list(ai.rates.keys())
+        'supported_currencies': ai.rates.currencies(),
+        'pending_payments': len(sessions.active()),
+        'confirmations': ai.confirmer.stats(),
+        'sms_dedup': ai.dedup.stats()
     })
 
-@app.route('/payments', methods=['GET'])
+@bp.route('/rates', methods=['GET'])
+def rates():
+    """Current exchange rates, minimum amounts and cache age"""
+    return jsonify(ai.rates.status())
+
+@bp.route('/payments', methods=['GET'])
 def get_payments():
-    """Get recent payments for monitoring"""
+    """Get recent payments for monitoring
+    
+    Query params: limit, cursor (from next_cursor), pump, phone, status, since, until
+    """
     try:
-        cursor = ai.conn.execute('''
-            SELECT phone, amount, currency, pump_id, tx_hash, status, timestamp 
-            FROM sms_payments 
-            ORDER BY timestamp DESC 
-            LIMIT 10
-        ''')
+        args = request.args
+        limit = min(max(int(args.get('limit', 10)), 1), 200)
+        
+        filters = []
+        if args.get('pump'):
+            filters.append(('pump_id = ?', args['pump'].upper()))
+        if args.get('phone'):
+            filters.append(('phone = ?', args['phone']))
+        if args.get('status'):
+            filters.append(('status = ?', args['status']))
+        if args.get('since'):
+            filters.append(('timestamp >= ?', normalize_timestamp(args['since'])))
+        if args.get('until'):
+            filters.append(('timestamp < ?', normalize_timestamp(args['until'])))
+        
+        rows, next_cursor = keyset_page(
+            ai.db,
+            'phone, amount, currency, pump_id, tx_hash, status, timestamp',
+            'sms_payments', filters, args.get('cursor'), limit
+        )
         
         payments = []
-        for row in cursor.fetchall():
+        for row in rows:
             payments.append({
                 'phone': row[0],
                 'amount': row[1],
@@ -257,8 +453,10 @@ def get_payments():
                 'timestamp': row[6]
             })
         
-        return jsonify({'payments': payments})
+        return jsonify({'payments': payments, 'next_cursor': next_cursor})
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)})
 
@@ -268,4 +466,5 @@ if __name__ == "__main__":
     print("💧 Converting crypto to clean water")
     print("🌍 Serving rural Africa")
     
-    app.run(host='0.0.0.0', port=5001, debug=True)
+    from serve import main
+    main('majisafe_ai')
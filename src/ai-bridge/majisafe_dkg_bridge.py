@@ -4,24 +4,48 @@ MajiSafe DKG Bridge - Enhanced AI Agent with OriginTrail Integration
 Processes SMS payments and creates verifiable Knowledge Assets
 """
 
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, request, jsonify
 from flask_cors import CORS
-import sqlite3
 from datetime import datetime
 import json
+import os
 
 from real_dkg_agent import RealDKGAgent
 from dkg_agent_simple import MCPToolsAgent
+from dkg_publish_queue import DKGPublishQueue
+from http_client import get_http_client
+from pump_dispatcher import get_pump_dispatcher
+from storage import SQLiteStore, keyset_page, normalize_timestamp
+from event_stream import EventBroadcaster
+from telemetry_store import RESOLUTIONS, TelemetryStore
+from metrics import SMS_TOTAL, get_metrics, instrument, stage_timer
 
-app = Flask(__name__)
-CORS(app)
+bp = Blueprint('majisafe_dkg_bridge', __name__)
+
+stage = stage_timer('dkg_bridge')
 
 class MajiSafeDKGBridge:
     def __init__(self):
         self.dkg_agent = RealDKGAgent()
         self.mcp_tools = MCPToolsAgent()
+        self.events = EventBroadcaster()
         self.init_db()
         
+        # Optional batching: coalesce busy-pump events into collection publishes
+        publish_workers = 4
+        batch_window = float(os.environ.get('DKG_BATCH_WINDOW', 0))
+        if batch_window > 0:
+            batch_size = int(os.environ.get('DKG_BATCH_SIZE', 25))
+            self.dkg_agent.enable_batching(batch_window, batch_size)
+            # Each worker waits on its batch, so a full batch needs that many workers
+            publish_workers = batch_size
+        
+        # Knowledge Asset publishing runs off the request thread
+        self.publish_queue = DKGPublishQueue(
+            self.db, self.publish_water_event, workers=publish_workers
+        )
+        self.publish_queue.start()
+        
         print("🌊 MajiSafe DKG Bridge Ready")
         print("🔗 Real OriginTrail DKG Integration")
         print("🌙 Using NeuroWeb Network")
@@ -29,8 +53,8 @@ class MajiSafeDKGBridge:
     
     def init_db(self):
         """Initialize database with DKG tracking"""
-        self.conn = sqlite3.connect('majisafe_dkg.db', check_same_thread=False)
-        self.conn.execute('''
+        self.db = SQLiteStore('majisafe_dkg.db')
+        self.db.execute('''
             CREATE TABLE IF NOT EXISTS water_events (
                 id INTEGER PRIMARY KEY,
                 event_id TEXT UNIQUE,
@@ -45,28 +69,56 @@ class MajiSafeDKGBridge:
                 timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
             )
         ''')
-        self.conn.commit()
+        
+        # event_id is already UNIQUE; these cover the dashboard and UAL lookups
+        for name, columns in (
+            ('idx_water_events_timestamp', 'timestamp, id'),
+            ('idx_water_events_pump', 'pump_id, timestamp, id'),
+            ('idx_water_events_ual', 'ual'),
+            ('idx_water_events_tx', 'tx_hash'),
+        ):
+            self.db.execute(f'CREATE INDEX IF NOT EXISTS {name} ON water_events ({columns})')
+        
+        # Flow-sensor time series; completions carry the measured liters per event
+        self.telemetry = TelemetryStore(self.db)
+        
+        # MQTT pumps publish readings on pumps/<id>/telemetry instead of POST /telemetry
+        self.pumps = None
+        if os.environ.get('PUMP_TRANSPORT') == 'mqtt':
+            self.pumps = get_pump_dispatcher()
+            self.pumps.on_telemetry(self.on_pump_telemetry)
+    
+    def on_pump_telemetry(self, pump_id, reading):
+        """One MQTT reading; the pump is the one in the topic"""
+        try:
+            self.telemetry.ingest(pump_id, [reading])
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"❌ Invalid telemetry from {pump_id}: {e}")
     
     def process_sms_payment(self, sms_data):
         """Enhanced SMS processing with DKG integration"""
         try:
             # Step 1: Validate payment using MCP tools
-            validation = self.mcp_tools.tools["validate_payment"](sms_data)
+            with stage("validate"):
+                validation = self.mcp_tools.tools["validate_payment"](sms_data)
             if not validation["valid"]:
+                SMS_TOTAL.inc(bridge="dkg_bridge", outcome="invalid")
                 return {"success": False, "error": "Invalid payment"}
             
             # Step 2: Control pump via IoT
-            pump_result = self.mcp_tools.tools["control_pump"](
-                sms_data["pump_id"], 
-                sms_data.get("duration", 10)
-            )
+            with stage("pump"):
+                pump_result = self.mcp_tools.tools["control_pump"](
+                    sms_data["pump_id"], 
+                    sms_data.get("duration", 10)
+                )
             
             # Step 3: Create audit log
-            audit_log = self.mcp_tools.tools["create_audit_log"]({
-                "sms": sms_data,
-                "validation": validation,
-                "pump_control": pump_result
-            })
+            with stage("audit_log"):
+                audit_log = self.mcp_tools.tools["create_audit_log"]({
+                    "sms": sms_data,
+                    "validation": validation,
+                    "pump_control": pump_result
+                })
             
             # Step 4: Create Knowledge Asset
             pump_data = {
@@ -82,46 +134,82 @@ class MajiSafeDKGBridge:
                 "sender_address": sms_data.get("sender")
             }
             
-            knowledge_asset = self.dkg_agent.create_water_knowledge_asset(
-                pump_data, payment_data, audit_log
-            )
+            with stage("create_asset"):
+                knowledge_asset = self.dkg_agent.create_water_knowledge_asset(
+                    pump_data, payment_data, audit_log
+                )
             
-            # Step 5: Publish to DKG
-            dkg_result = self.dkg_agent.publish_to_dkg(knowledge_asset)
+            # Step 5: Queue publish + anchoring; the pump is already running
+            with stage("enqueue_publish"):
+                job = self.publish_queue.submit(knowledge_asset["eventId"], {
+                    "knowledge_asset": knowledge_asset,
+                    "tx_hash": payment_data.get("tx_hash")
+                })
             
-            if dkg_result["success"]:
-                # Step 6: Anchor to blockchain
-                anchor_data = self.dkg_agent.anchor_to_blockchain(
-                    dkg_result["ual"], 
-                    payment_data.get("tx_hash")
-                )
-                
-                # Step 7: Store in database
-                self.store_water_event(knowledge_asset, dkg_result, anchor_data)
-                
-                return {
-                    "success": True,
-                    "event_id": knowledge_asset["eventId"],
-                    "ual": dkg_result["ual"],
-                    "verification_hash": knowledge_asset["verificationHash"],
-                    "anchor": anchor_data
-                }
-            else:
-                return {"success": False, "error": dkg_result["error"]}
+            self.events.publish("sms_received", {
+                "event_id": knowledge_asset["eventId"],
+                "phone": sms_data.get("phone"),
+                "amount": sms_data["amount"],
+                "currency": sms_data["currency"],
+                "pump_id": sms_data["pump_id"]
+            })
+            
+            SMS_TOTAL.inc(bridge="dkg_bridge", outcome="accepted")
+            return {
+                "success": True,
+                "event_id": knowledge_asset["eventId"],
+                "status": job["status"],
+                "verification_hash": knowledge_asset["verificationHash"],
+                "pump_control": pump_result
+            }
                 
         except Exception as e:
+            SMS_TOTAL.inc(bridge="dkg_bridge", outcome="error")
             return {"success": False, "error": str(e)}
     
+    def publish_water_event(self, job):
+        """Background job: publish to DKG, anchor, and store the event"""
+        knowledge_asset = job["knowledge_asset"]
+        
+        # Step 6: Publish to DKG
+        with stage("dkg_publish"):
+            dkg_result = self.dkg_agent.publish_to_dkg(knowledge_asset)
+        if not dkg_result["success"]:
+            return dkg_result
+        
+        # Step 7: Anchor to blockchain
+        with stage("anchor"):
+            anchor_data = self.dkg_agent.anchor_to_blockchain(
+                dkg_result["ual"], 
+                job.get("tx_hash")
+            )
+        
+        # Step 8: Store in database (wait for the group commit before marking published)
+        with stage("store"):
+            self.store_water_event(knowledge_asset, dkg_result, anchor_data).result()
+        
+        self.events.publish("asset_published", {
+            "event_id": knowledge_asset["eventId"],
+            "pump_id": knowledge_asset["pumpId"],
+            "ual": dkg_result["ual"],
+            "verification_hash": knowledge_asset["verificationHash"]
+        })
+        
+        return {"success": True, "ual": dkg_result["ual"], "anchor": anchor_data}
+    
     def store_water_event(self, knowledge_asset, dkg_result, anchor_data):
         """Store water dispensing event with DKG references"""
-        self.conn.execute('''
-            INSERT INTO water_events 
+        # Measured liters win if the pump already reported its completion
+        return self.db.insert('''
+            INSERT OR IGNORE INTO water_events 
             (event_id, pump_id, liters_dispensed, payment_amount, payment_currency, 
              tx_hash, ual, dkg_token_id, verification_hash)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            VALUES (?, ?, COALESCE((SELECT liters FROM pump_completions WHERE event_id = ?), ?),
+                    ?, ?, ?, ?, ?, ?)
         ''', (
             knowledge_asset["eventId"],
-            knowledge_asset["location"]["name"],
+            knowledge_asset["pumpId"],
+            knowledge_asset["eventId"],
             knowledge_asset["waterDispensed"]["value"],
             knowledge_asset["payment"]["amount"],
             knowledge_asset["payment"]["currency"],
@@ -130,12 +218,39 @@ class MajiSafeDKGBridge:
             dkg_result["tokenId"],
             knowledge_asset["verificationHash"]
         ))
-        self.conn.commit()
 
-# Global bridge instance
-bridge = MajiSafeDKGBridge()
+# Global bridge instance, built by create_app() in the worker process
+bridge = None
+
+def create_app():
+    global bridge
+    if bridge is None:
+        bridge = MajiSafeDKGBridge()
+    app = Flask(__name__)
+    CORS(app)
+    app.register_blueprint(bp)
+    
+    metrics = get_metrics()
+    metrics.gauge('majisafe_dkg_publish_queue', 'DKG publish jobs waiting for a worker',
+                  bridge.publish_queue.depth)
+    metrics.gauge('majisafe_sse_clients', 'Open Server-Sent Events streams',
+                  lambda: {'dkg_bridge': bridge.events.subscriber_count()}, ('bridge',))
+    return instrument(app, 'dkg_bridge')
+
+def shutdown():
+    """End SSE streams, finish publishes already taken, seal telemetry and commit before exit
 
-@app.route('/process-sms', methods=['POST'])
+    Jobs still queued stay in publish_jobs and are recovered on the next start.
+    """
+    if bridge:
+        bridge.events.close()
+        bridge.publish_queue.stop()
+        if bridge.pumps:
+            bridge.pumps.close()
+        bridge.telemetry.flush()
+        bridge.db.close()
+
+@bp.route('/process-sms', methods=['POST'])
 def process_sms():
     """Enhanced SMS processing endpoint"""
     try:
@@ -144,8 +259,8 @@ def process_sms():
         
         if result["success"]:
             print(f"✅ Water event created: {result['event_id']}")
-            print(f"🔗 DKG UAL: {result['ual']}")
-            return jsonify(result)
+            print(f"📤 DKG publish {result['status']}")
+            return jsonify(result), 202
         else:
             print(f"❌ Processing failed: {result['error']}")
             return jsonify(result), 400
@@ -153,20 +268,127 @@ def process_sms():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
-@app.route('/knowledge-assets', methods=['GET'])
+@bp.route('/telemetry', methods=['POST'])
+def ingest_telemetry():
+    """Batched flow-sensor readings
+    
+    Body: {"pump_id", "readings": [{"timestamp" | "age_ms", "liters"}, ...]}
+    or a list of such batches for several pumps
+    """
+    try:
+        data = request.json
+        batches = data if isinstance(data, list) else [data]
+        # Every batch is checked before any is stored: a 400 stores nothing
+        prepared = [bridge.telemetry.prepare(batch['pump_id'], batch.get('readings', []))
+                    for batch in batches]
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid telemetry: {e}"}), 400
+    stored = sum(bridge.telemetry.ingest_points(pump_id, points) for pump_id, points in prepared)
+    return jsonify({"stored": stored}), 202
+
+@bp.route('/pump-completion', methods=['POST'])
+def pump_completion():
+    """Sent by the ESP32 when the pump stops: measured liters for the event"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "JSON body required"}), 400
+    pump_id = data.get('pump_id', '')
+    liters = data.get('liters_dispensed')
+    if not pump_id or liters is None:
+        return jsonify({"error": "pump_id and liters_dispensed are required"}), 400
+    
+    # Per-second samples, when the firmware sends them, go into the time series
+    readings = data.get('readings') or [{"age_ms": 0, "liters": liters}]
+    try:
+        bridge.telemetry.ingest(pump_id, readings)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid telemetry: {e}"}), 400
+    
+    event_id = data.get('event_id')
+    if event_id:
+        bridge.telemetry.record_completion(pump_id, event_id, liters, data.get('duration_seconds'))
+        # The event row may not exist yet; store_water_event picks the value up then
+        bridge.db.insert('UPDATE water_events SET liters_dispensed = ? WHERE event_id = ?', (liters, event_id))
+    
+    return jsonify({"status": "recorded", "pump_id": pump_id.upper(), "event_id": event_id})
+
+def time_range(args, default_seconds=86400):
+    """since/until query params as epoch seconds (numbers or ISO datetimes)"""
+    def parse(value, default):
+        if not value:
+            return default
+        try:
+            return float(value)
+        except ValueError:
+            return datetime.fromisoformat(value.rstrip('Z')).timestamp()
+    
+    until = parse(args.get('until'), datetime.now().timestamp())
+    return parse(args.get('since'), until - default_seconds), until
+
+@bp.route('/telemetry/liters', methods=['GET'])
+def liters_dispensed():
+    """Liters dispensed per pump from the rollups
+    
+    Query params: since, until, pump
+    """
+    try:
+        since, until = time_range(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    totals = bridge.telemetry.total_liters(since, until, request.args.get('pump'))
+    return jsonify({"since": since, "until": until, "liters": totals})
+
+@bp.route('/telemetry/<pump_id>/liters', methods=['GET'])
+def pump_liters_series(pump_id):
+    """Liters per minute/hour/day bucket for one pump
+    
+    Query params: resolution (minute, hour, day), since, until
+    """
+    resolution = request.args.get('resolution', 'hour')
+    if resolution not in RESOLUTIONS:
+        return jsonify({"error": f"resolution must be one of {', '.join(RESOLUTIONS)}"}), 400
+    try:
+        since, until = time_range(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    series = bridge.telemetry.liters_series(pump_id, since, until, resolution)
+    return jsonify({
+        "pump_id": pump_id.upper(),
+        "resolution": resolution,
+        "series": [{"bucket": bucket, "liters": liters} for bucket, liters in series]
+    })
+
+@bp.route('/knowledge-assets', methods=['GET'])
 def get_knowledge_assets():
-    """Get all water dispensing Knowledge Assets"""
+    """Get water dispensing Knowledge Assets, newest first
+    
+    Query params: limit, cursor (from next_cursor), pump, currency, since, until
+    """
     try:
-        cursor = bridge.conn.execute('''
-            SELECT event_id, pump_id, liters_dispensed, payment_amount, 
-                   payment_currency, ual, verification_hash, timestamp
-            FROM water_events 
-            ORDER BY timestamp DESC 
-            LIMIT 50
-        ''')
+        args = request.args
+        limit = min(max(int(args.get('limit', 50)), 1), 200)
+        
+        filters = []
+        if args.get('pump'):
+            filters.append(("pump_id = ?", args['pump'].upper()))
+        if args.get('currency'):
+            filters.append(("payment_currency = ?", args['currency'].upper()))
+        if args.get('since'):
+            filters.append(("timestamp >= ?", normalize_timestamp(args['since'])))
+        if args.get('until'):
+            filters.append(("timestamp < ?", normalize_timestamp(args['until'])))
+        
+        rows, next_cursor = keyset_page(
+            bridge.db,
+            "event_id, pump_id, liters_dispensed, payment_amount, "
+            "payment_currency, ual, verification_hash, timestamp",
+            "water_events", filters, args.get('cursor'), limit
+        )
         
         assets = []
-        for row in cursor.fetchall():
+        for row in rows:
             assets.append({
                 "eventId": row[0],
                 "pumpId": row[1],
@@ -178,12 +400,27 @@ def get_knowledge_assets():
                 "timestamp": row[7]
             })
         
-        return jsonify({"assets": assets})
+        return jsonify({"assets": assets, "next_cursor": next_cursor})
         
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/verify-asset/<ual>', methods=['GET'])
+@bp.route('/event-status/<event_id>', methods=['GET'])
+def event_status(event_id):
+    """Publishing status of a water event's Knowledge Asset"""
+    job = bridge.publish_queue.status(event_id)
+    if not job:
+        return jsonify({"error": "Unknown event"}), 404
+    return jsonify(job)
+
+@bp.route('/events', methods=['GET'])
+def event_stream():
+    """Server-Sent Events: sms_received, asset_published"""
+    return bridge.events.response()
+
+@bp.route('/verify-asset/<ual>', methods=['GET'])
 def verify_asset(ual):
     """Verify Knowledge Asset integrity"""
     try:
@@ -197,7 +434,7 @@ def verify_asset(ual):
     except Exception as e:
         return jsonify({"verified": False, "error": str(e)}), 500
 
-@app.route('/status', methods=['GET'])
+@bp.route('/status', methods=['GET'])
 def status():
     """Enhanced status with DKG connectivity"""
     return jsonify({
@@ -206,7 +443,10 @@ def status():
         "blockchain": "Moonbase Alpha",
         "dkg_node": bridge.dkg_agent.dkg_node_url,
         "mcp_tools": list(bridge.mcp_tools.tools.keys()),
-        "knowledge_assets_created": bridge.conn.execute("SELECT COUNT(*) FROM water_events").fetchone()[0]
+        "publish_queue_depth": bridge.publish_queue.depth(),
+        "http": get_http_client().metrics(),
+        "telemetry": bridge.telemetry.stats(),
+        "knowledge_assets_created": bridge.db.query("SELECT COUNT(*) FROM water_events")[0][0]
     })
 
 if __name__ == "__main__":
@@ -214,4 +454,5 @@ if __name__ == "__main__":
     print("🌊 Creating verifiable water Knowledge Assets")
     print("🔗 OriginTrail DKG integration active")
     
-    app.run(host='0.0.0.0', port=5002, debug=True)
+    from serve import main
+    main('majisafe_dkg_bridge')
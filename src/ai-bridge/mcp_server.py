@@ -1,46 +1,353 @@
 #!/usr/bin/env python3
-"""MCP Server for MajiSafe Water Management"""
+"""
+MCP Server for MajiSafe Water Management
+Tools answer from the payment/event stores, the chain and the DKG agent without
+blocking the event loop, so an agent can keep many tool calls in flight
+"""
 
 from mcp.server import Server
+from mcp.server.stdio import stdio_server
 from mcp.types import Tool, TextContent
+import asyncio
 import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from web3 import Web3
+from web3.exceptions import TransactionNotFound
+
+from chain_watcher import decode_purchase, pump_id_keys
+from real_dkg_agent import RealDKGAgent
+from storage import SQLiteStore, keyset_page, normalize_timestamp
 
 server = Server("majisafe-water")
 
+
+class ChainReceipts:
+    """WaterBroker purchases by tx hash; one chain round trip per transaction"""
+
+    def __init__(self, w3, contract_address, run, confirmations=1, retry_after=5, capacity=10000):
+        """
+        run: coroutine function running a blocking call off the event loop
+        retry_after: seconds before an unknown or unconfirmed tx is fetched again
+        """
+        self.w3 = w3
+        self.contract_address = Web3.to_checksum_address(contract_address)
+        self.run = run
+        self.confirmations = confirmations
+        self.retry_after = retry_after
+        self.capacity = capacity
+
+        # tx_hash -> (expires_at, purchase, error); settled transactions never expire
+        self.results = OrderedDict()
+        # tx_hash -> Task, so concurrent tool calls share one lookup
+        self.inflight = {}
+        self.lookups = 0
+
+    async def purchase(self, tx_hash):
+        """(purchase, None) for a confirmed WaterBroker purchase, else (None, error)"""
+        tx_hash = tx_hash.lower()
+        cached = self.results.get(tx_hash)
+        if cached and cached[0] > time.time():
+            self.results.move_to_end(tx_hash)
+            return cached[1], cached[2]
+
+        task = self.inflight.get(tx_hash)
+        if task is None:
+            task = self.inflight[tx_hash] = asyncio.ensure_future(self._fetch(tx_hash))
+            task.add_done_callback(lambda _: self.inflight.pop(tx_hash, None))
+        return await asyncio.shield(task)
+
+    async def _fetch(self, tx_hash):
+        self.lookups += 1
+        settled = True
+        try:
+            purchase, error = await self.run(self._lookup, tx_hash)
+        except TransactionNotFound:
+            purchase, error, settled = None, "Transaction not found on chain", False
+        if error == "Transaction not confirmed yet":
+            settled = False
+
+        expires_at = float('inf') if settled else time.time() + self.retry_after
+        self.results[tx_hash] = (expires_at, purchase, error)
+        while len(self.results) > self.capacity:
+            self.results.popitem(last=False)
+        return purchase, error
+
+    def _lookup(self, tx_hash):
+        receipt = self.w3.eth.get_transaction_receipt(tx_hash)
+        if receipt['status'] != 1:
+            return None, "Transaction reverted"
+        if self.w3.eth.block_number - receipt['blockNumber'] + 1 < self.confirmations:
+            return None, "Transaction not confirmed yet"
+        purchase = decode_purchase(receipt, self.contract_address)
+        if not purchase:
+            return None, "Transaction is not a WaterBroker purchase"
+        purchase['pump_id_bytes'] = '0x' + purchase['pump_id_bytes'].hex()
+        return purchase, None
+
+
+class MajiSafeTools:
+    def __init__(self, payments_db, events_db, w3, contract_address, dkg_agent, workers=16):
+        self.payments = SQLiteStore(payments_db)
+        self.events = SQLiteStore(events_db)
+        self.dkg_agent = dkg_agent
+        # Web3, requests and SQLite are blocking; they run here, never on the loop
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mcp-tool")
+        self.receipts = ChainReceipts(w3, contract_address, self.run)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            payments_db=os.environ.get('PAYMENTS_DB', 'majisafe_payments.db'),
+            events_db=os.environ.get('WATER_EVENTS_DB', 'majisafe_dkg.db'),
+            w3=Web3(Web3.HTTPProvider(os.environ.get('RPC_URL', 'https://sepolia.base.org'))),
+            contract_address=os.environ.get('WATER_BROKER_ADDRESS', '0x4933781A5DDC86bdF9c9C9795647e763E0429E28'),
+            dkg_agent=RealDKGAgent(os.environ.get('DKG_NODE_URL', 'http://localhost:8900')),
+            workers=int(os.environ.get('MCP_WORKERS', 16))
+        )
+
+    async def run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def verify_water_payment(self, tx_hash, pump_id=None):
+        """On-chain purchase for tx_hash, plus what the bridges recorded for it"""
+        (purchase, error), recorded, water_events = await asyncio.gather(
+            self.receipts.purchase(tx_hash),
+            self.run(self._recorded_payments, tx_hash),
+            self.run(self._water_events_for, tx_hash)
+        )
+        if purchase and pump_id and bytes.fromhex(purchase['pump_id_bytes'][2:]) not in pump_id_keys(pump_id.upper()):
+            error = f"Purchase was for {purchase['pump_id']}, not {pump_id.upper()}"
+
+        result = {
+            "tx_hash": tx_hash.lower(),
+            "verified": error is None,
+            "on_chain": purchase,
+            "recorded_payments": recorded,
+            "water_events": water_events
+        }
+        if error:
+            result["reason"] = error
+        return result
+
+    async def verify_water_payments(self, payments):
+        """Many verify_water_payment calls at once; shared tx hashes are fetched once"""
+        return await asyncio.gather(*(
+            self.verify_water_payment(p['tx_hash'], p.get('pump_id')) for p in payments
+        ))
+
+    async def create_water_asset(self, pump_data, payment_data, audit_log=None):
+        """Build, publish and anchor a Knowledge Asset through the DKG agent"""
+        pump_data = {"liters_dispensed": 10, **pump_data}
+        asset = self.dkg_agent.create_water_knowledge_asset(pump_data, payment_data, audit_log or {})
+        published = await self.run(self.dkg_agent.publish_to_dkg, asset)
+        if not published["success"]:
+            return {"success": False, "event_id": asset["eventId"], "error": published["error"]}
+
+        anchor = self.dkg_agent.anchor_to_blockchain(published["ual"], payment_data.get("tx_hash"))
+        return {
+            "success": True,
+            "event_id": asset["eventId"],
+            "ual": published["ual"],
+            "token_id": published["tokenId"],
+            "verification_hash": asset["verificationHash"],
+            "anchor": anchor
+        }
+
+    async def list_water_events(self, pump_id=None, since=None, until=None, limit=50, cursor=None):
+        """Water events newest first, paged like /knowledge-assets"""
+        filters = self._filters(pump_id, since, until)
+        rows, next_cursor = await self.run(
+            keyset_page, self.events,
+            "event_id, pump_id, liters_dispensed, payment_amount, payment_currency, "
+            "tx_hash, ual, timestamp",
+            "water_events", filters, cursor, self._limit(limit)
+        )
+        keys = ("event_id", "pump_id", "liters_dispensed", "payment_amount",
+                "payment_currency", "tx_hash", "ual", "timestamp")
+        return {"events": [dict(zip(keys, row)) for row in rows], "next_cursor": next_cursor}
+
+    async def list_payments(self, pump_id=None, status=None, since=None, until=None, limit=50, cursor=None):
+        """SMS payments newest first"""
+        filters = self._filters(pump_id, since, until)
+        if status:
+            filters.append(("status = ?", status))
+        rows, next_cursor = await self.run(
+            keyset_page, self.payments,
+            "phone, amount, currency, pump_id, eth_amount, tx_hash, status, timestamp",
+            "sms_payments", filters, cursor, self._limit(limit)
+        )
+        keys = ("phone", "amount", "currency", "pump_id", "eth_amount", "tx_hash", "status", "timestamp")
+        return {"payments": [dict(zip(keys, row)) for row in rows], "next_cursor": next_cursor}
+
+    async def water_usage(self, pump_ids=None, since=None, until=None):
+        """Events and liters per pump over a date range, in one query"""
+        filters = self._filters(None, since, until)
+        clauses = [condition for condition, _ in filters]
+        params = [value for _, value in filters]
+        if pump_ids:
+            clauses.append(f"pump_id IN ({', '.join('?' * len(pump_ids))})")
+            params.extend(p.upper() for p in pump_ids)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        rows = await self.run(self.events.query, f'''
+            SELECT pump_id, COUNT(*), SUM(liters_dispensed) FROM water_events {where}
+            GROUP BY pump_id ORDER BY pump_id
+        ''', params)
+        return {"pumps": [
+            {"pump_id": pump, "events": events, "liters": round(liters or 0, 3)}
+            for pump, events, liters in rows
+        ]}
+
+    def _recorded_payments(self, tx_hash):
+        # majisafe_ai writes the confirming tx hash, lowercased, once a payment settles
+        rows = self.payments.query('''
+            SELECT phone, amount, currency, pump_id, status, timestamp
+            FROM sms_payments WHERE tx_hash = ?
+        ''', (tx_hash.lower(),))
+        keys = ("phone", "amount", "currency", "pump_id", "status", "timestamp")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def _water_events_for(self, tx_hash):
+        try:
+            rows = self.events.query('''
+                SELECT event_id, pump_id, liters_dispensed, ual, timestamp
+                FROM water_events WHERE tx_hash = ?
+            ''', (tx_hash,))
+        except sqlite3.OperationalError:
+            # The DKG bridge that owns the table may not have run yet
+            rows = []
+        keys = ("event_id", "pump_id", "liters_dispensed", "ual", "timestamp")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def _filters(self, pump_id, since, until):
+        filters = []
+        if pump_id:
+            filters.append(("pump_id = ?", pump_id.upper()))
+        if since:
+            filters.append(("timestamp >= ?", normalize_timestamp(since)))
+        if until:
+            filters.append(("timestamp < ?", normalize_timestamp(until)))
+        return filters
+
+    def _limit(self, limit):
+        return min(max(int(limit), 1), 200)
+
+
+tools = MajiSafeTools.from_env()
+
+RANGE = {
+    "pump_id": {"type": "string"},
+    "since": {"type": "string", "description": "ISO date or datetime"},
+    "until": {"type": "string", "description": "ISO date or datetime (exclusive)"},
+    "limit": {"type": "integer", "minimum": 1, "maximum": 200},
+    "cursor": {"type": "string", "description": "next_cursor from the previous page"}
+}
+
 @server.list_tools()
 async def list_tools():
     return [
         Tool(
             name="verify_water_payment",
-            description="Verify water payment on blockchain",
+            description="Verify a water payment on chain and show what the bridges recorded for it",
             inputSchema={
                 "type": "object",
                 "properties": {
                     "tx_hash": {"type": "string"},
                     "pump_id": {"type": "string"}
-                }
+                },
+                "required": ["tx_hash"]
+            }
+        ),
+        Tool(
+            name="verify_water_payments",
+            description="Verify many water payments at once",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "payments": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "tx_hash": {"type": "string"},
+                                "pump_id": {"type": "string"}
+                            },
+                            "required": ["tx_hash"]
+                        }
+                    }
+                },
+                "required": ["payments"]
             }
         ),
         Tool(
             name="create_water_asset",
             description="Create Knowledge Asset for water dispensing",
             inputSchema={
-                "type": "object", 
+                "type": "object",
                 "properties": {
                     "pump_data": {"type": "object"},
-                    "payment_data": {"type": "object"}
+                    "payment_data": {"type": "object"},
+                    "audit_log": {"type": "object"}
+                },
+                "required": ["pump_data", "payment_data"]
+            }
+        ),
+        Tool(
+            name="list_water_events",
+            description="Water dispensing events, newest first, by pump and date",
+            inputSchema={"type": "object", "properties": RANGE}
+        ),
+        Tool(
+            name="list_payments",
+            description="SMS payments, newest first, by pump, status and date",
+            inputSchema={
+                "type": "object",
+                "properties": {**RANGE, "status": {"type": "string"}}
+            }
+        ),
+        Tool(
+            name="water_usage",
+            description="Events and liters dispensed per pump over a date range",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "pump_ids": {"type": "array", "items": {"type": "string"}},
+                    "since": RANGE["since"],
+                    "until": RANGE["until"]
                 }
             }
         )
     ]
 
+HANDLERS = {
+    "verify_water_payment": tools.verify_water_payment,
+    "verify_water_payments": tools.verify_water_payments,
+    "create_water_asset": tools.create_water_asset,
+    "list_water_events": tools.list_water_events,
+    "list_payments": tools.list_payments,
+    "water_usage": tools.water_usage
+}
+
 @server.call_tool()
 async def call_tool(name: str, arguments: dict):
-    if name == "verify_water_payment":
-        return [TextContent(type="text", text=json.dumps({"verified": True}))]
-    elif name == "create_water_asset":
-        return [TextContent(type="text", text=json.dumps({"ual": f"did:dkg:otp:2043/{arguments['pump_data']['pump_id']}"}))]
+    handler = HANDLERS.get(name)
+    if handler is None:
+        result = {"error": f"Unknown tool {name}"}
+    else:
+        try:
+            result = await handler(**arguments)
+        except Exception as e:
+            result = {"error": str(e)}
+    return [TextContent(type="text", text=json.dumps(result, default=str))]
+
+async def main():
+    async with stdio_server() as (read_stream, write_stream):
+        await server.run(read_stream, write_stream, server.create_initialization_options())
 
 if __name__ == "__main__":
-    import asyncio
-    asyncio.run(server.run())
+    asyncio.run(main())
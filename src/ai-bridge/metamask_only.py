@@ -1,139 +1,175 @@
 #!/usr/bin/env python3
 """
 MetaMask Only Automation - Use Existing Browser
-Connects to your existing browser with MetaMask
+Connects to your existing browser with MetaMask; one monitor thread serves every pending payment
 """
 
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-import time
+import re
 import threading
+import time
+
+from lazy import lazy_property
+from payment_confirmation import PaymentConfirmer
+
+TX_HASH = re.compile(r'0x[0-9a-fA-F]{64}')
+
+
+class MetaMaskOnly(PaymentConfirmer):
+    """Settled by a buyWater the customer approved in MetaMask
+
+    The monitor thread attaches to Chrome, reads transaction hashes the web
+    UI shows after MetaMask sends them, and confirms a payment only once that
+    transaction is mined as a WaterBroker purchase for the payment's pump.
+    """
+    source = 'metamask'
+
+    def __init__(self, w3, contract_address, timeout=600, debugger_address="127.0.0.1:9222",
+                 poll_interval=2.0, reconnect_interval=30):
+        """
+        w3: Web3, or a callable returning one (built with the first payment)
+        reconnect_interval: seconds between attempts to attach to Chrome
+        """
+        super().__init__(timeout)
+        self.w3 = w3
+        self.contract_address = contract_address
+        self.debugger_address = debugger_address
+        self.poll_interval = poll_interval
+        self.reconnect_interval = reconnect_interval
+        self.driver = None
+        self.next_connect = 0
+        # MetaMask popups already reported, and tx hashes already looked at
+        self.seen_handles = set()
+        self.seen_hashes = None
+        # tx hash -> when the web UI showed it; dropped if not mined within timeout
+        self.candidates = {}
+        # Guards starting and stopping the monitor against payments arriving
+        self.monitor_lock = threading.Lock()
+        self.monitor_thread = None
+
+    def connect(self):
+        """Attach to Chrome started with --remote-debugging-port; None until it works"""
+        if self.driver or time.monotonic() < self.next_connect:
+            return self.driver
 
-class MetaMaskOnly:
-    def __init__(self):
-        # Connect to existing Chrome browser with MetaMask
-        options = webdriver.ChromeOptions()
-        options.add_experimental_option("debuggerAddress", "127.0.0.1:9222")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
-        
         try:
+            # selenium loads with the first payment, not with the bridge
+            from selenium import webdriver
+            from selenium.webdriver.chrome.service import Service
+            from webdriver_manager.chrome import ChromeDriverManager
+
+            options = webdriver.ChromeOptions()
+            options.add_experimental_option("debuggerAddress", self.debugger_address)
+            options.add_argument("--no-sandbox")
+            options.add_argument("--disable-dev-shm-usage")
+
             service = Service(ChromeDriverManager().install())
             self.driver = webdriver.Chrome(service=service, options=options)
             print("🔗 Connected to existing Chrome browser")
         except Exception as e:
+            # Retried while payments wait; the web UI callback still works meanwhile
+            self.next_connect = time.monotonic() + self.reconnect_interval
             print(f"❌ Cannot connect to existing browser: {e}")
             print("💡 Please start Chrome with: chrome --remote-debugging-port=9222")
-            self.driver = None
-            
-        self.metamask_confirmed = False
-        self.monitoring = False
-        
-    def wait_for_metamask_and_confirm(self, phone, message):
-        """Wait for MetaMask in existing browser"""
-        if not self.driver:
-            print("❌ No browser connection - starting simple mode")
-            print("👤 Please manually:")
-            print("   1. Open http://localhost:8000")
-            print("   2. Click 'Buy Water'") 
-            print("   3. Confirm MetaMask")
-            
-            # Wait 30 seconds for manual confirmation
-            time.sleep(30)
-            
-            return {
-                'status': 'success',
-                'message': 'activate',
-                'tx_hash': 'manual_confirmation',
-                'pump_id': 'PUMP001'
-            }
-        
-        try:
-            print(f"🦊 Monitoring existing browser for MetaMask: {message}")
-            print("👤 Open http://localhost:8000 and click 'Buy Water'")
-            
-            self.monitoring = True
-            self.metamask_confirmed = False
-            
-            # Monitor existing browser tabs
-            monitor_thread = threading.Thread(target=self._monitor_existing_browser)
-            monitor_thread.daemon = True
-            monitor_thread.start()
-            
-            # Wait for confirmation
-            for i in range(60):  # 2 minutes
-                if self.metamask_confirmed:
-                    return {
-                        'status': 'success',
-                        'message': 'activate',
-                        'tx_hash': 'metamask_confirmed',
-                        'pump_id': 'PUMP001'
-                    }
-                
-                if i % 15 == 0:
-                    print(f"⏳ Waiting for MetaMask... ({i*2}s)")
-                
-                time.sleep(2)
-            
-            print("⏰ Timeout - assuming manual confirmation")
-            return {
-                'status': 'success',
-                'message': 'activate', 
-                'tx_hash': 'timeout_success',
-                'pump_id': 'PUMP001'
-            }
-            
-        except Exception as e:
-            print(f"❌ Browser monitoring error: {e}")
-            return {
-                'status': 'success',
-                'message': 'activate',
-                'tx_hash': 'fallback_success', 
-                'pump_id': 'PUMP001'
-            }
-    
+        return self.driver
+
+    def started(self, request):
+        print(f"🦊 Waiting for MetaMask: {request.get('message') or request['pump_id']}")
+        print("👤 Open http://localhost:8000 and click 'Buy Water'")
+
+        # Attaching downloads chromedriver, so it happens on the monitor thread
+        with self.monitor_lock:
+            if self.monitor_thread is None:
+                self.monitor_thread = threading.Thread(target=self._monitor_existing_browser,
+                                                       name="metamask-monitor")
+                self.monitor_thread.daemon = True
+                self.monitor_thread.start()
+
+    @lazy_property
+    def web3(self):
+        return self.w3() if callable(self.w3) else self.w3
+
     def _monitor_existing_browser(self):
-        """Monitor existing browser tabs for MetaMask"""
+        """Poll browser tabs while payments are pending"""
         print("🔍 Monitoring existing browser tabs...")
-        
-        while self.monitoring and not self.metamask_confirmed:
+
+        while True:
+            # Same lock as started(): a payment added now either sees this
+            # thread still running or finds it gone and starts another
+            with self.monitor_lock:
+                if not self.pending_count():
+                    self.monitor_thread = None
+                    return
+
+            if self.connect():
+                try:
+                    self._scan_tabs()
+                except Exception as e:
+                    # Browser closed or restarted: attach again on the next poll
+                    print(f"❌ Browser monitoring error: {e}")
+                    self.driver = None
             try:
-                # Get all open tabs
-                all_windows = self.driver.window_handles
-                
-                for handle in all_windows:
-                    self.driver.switch_to.window(handle)
-                    current_url = self.driver.current_url
-                    
-                    # Check for MetaMask popup or transaction
-                    if "extension" in current_url or "metamask" in current_url.lower():
-                        print("🦊 MetaMask tab detected!")
-                        
-                        # Look for transaction confirmation
-                        try:
-                            page_text = self.driver.page_source.lower()
-                            
-                            if "confirm" in page_text and "transaction" in page_text:
-                                print("✅ MetaMask transaction detected!")
-                                self.metamask_confirmed = True
-                                return
-                                
-                        except:
-                            pass
-                
+                self._check_candidates()
             except Exception as e:
-                pass
-            
-            time.sleep(2)
-    
+                print(f"❌ Transaction lookup error: {e}")
+
+            time.sleep(self.poll_interval)
+
+    def _scan_tabs(self):
+        found = set()
+        for handle in self.driver.window_handles:
+            self.driver.switch_to.window(handle)
+            current_url = self.driver.current_url
+
+            if "extension" in current_url or "metamask" in current_url.lower():
+                # The popup only means the customer is deciding; nothing is settled yet
+                if handle not in self.seen_handles:
+                    self.seen_handles.add(handle)
+                    print("🦊 MetaMask confirmation open - waiting for the transaction")
+                continue
+            found.update(h.lower() for h in TX_HASH.findall(self.driver.page_source))
+
+        if self.seen_hashes is None:
+            # Hashes already on screen belong to earlier purchases
+            self.seen_hashes = found
+            return
+        for tx_hash in found - self.seen_hashes:
+            self.seen_hashes.add(tx_hash)
+            print(f"✅ MetaMask transaction sent: {tx_hash[:12]}...")
+            self.candidates[tx_hash] = time.monotonic()
+
+    def _check_candidates(self):
+        """Confirm payments whose transaction is mined as a purchase for their pump"""
+        from chain_watcher import decode_purchase, pump_id_keys
+        from web3 import Web3
+        from web3.exceptions import TransactionNotFound
+
+        for tx_hash, seen_at in list(self.candidates.items()):
+            try:
+                receipt = self.web3.eth.get_transaction_receipt(tx_hash)
+            except TransactionNotFound:
+                if time.monotonic() - seen_at > self.timeout:
+                    # Dropped or never broadcast; no payment waits that long anyway
+                    del self.candidates[tx_hash]
+                continue
+            del self.candidates[tx_hash]
+            purchase = None
+            if receipt['status'] == 1:
+                purchase = decode_purchase(receipt, Web3.to_checksum_address(self.contract_address))
+            if not purchase:
+                print(f"❌ {tx_hash[:12]}... is not a successful WaterBroker purchase")
+                continue
+
+            # Oldest waiting payment for the pump the customer paid for
+            match = next((r for r in self.waiting()
+                          if purchase['pump_id_bytes'] in pump_id_keys(r['pump_id'])), None)
+            if match:
+                self.confirm(request_id=match['request_id'], tx_hash=tx_hash)
+
     def close(self):
-        """Close connection"""
-        self.monitoring = False
-        # Don't close existing browser, just disconnect
+        """Cancel pending payments and disconnect (the browser stays open)"""
+        super().close()
         if self.driver:
             try:
                 self.driver.quit()
-            except:
+            except Exception:
                 pass
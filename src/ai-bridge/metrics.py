@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Metrics - Counters, gauges and latency histograms in Prometheus text format
+One registry per process; every bridge serves it at /metrics
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Seconds; SMS stages run from microseconds (parsing) to tens of seconds (chain)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1, 2.5, 5, 10, 30, 60)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        for key, value in sorted(values.items()):
+            yield self.name, format_labels(self.labels, key), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a with-block, including when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self.lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self.values.items()}
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield (f"{self.name}_bucket",
+                       format_labels(self.labels, key, [('le', format_value(bound))]), cumulative)
+            yield f"{self.name}_sum", format_labels(self.labels, key), total
+            yield f"{self.name}_count", format_labels(self.labels, key), cumulative
+
+
+class Gauge:
+    """Read at scrape time from func(): a number, or {label values tuple: number}"""
+    kind = 'gauge'
+
+    def __init__(self, name, help, func, labels=()):
+        self.name = name
+        self.help = help
+        self.func = func
+        self.labels = tuple(labels)
+
+    def samples(self):
+        try:
+            value = self.func()
+        except Exception:
+            return
+        if isinstance(value, dict):
+            for key, v in sorted(value.items()):
+                key = key if isinstance(key, tuple) else (key,)
+                yield self.name, format_labels(self.labels, key), v
+        elif value is not None:
+            yield self.name, '', value
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def counter(self, name, help, labels=()):
+        return self._register(name, lambda: Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(name, lambda: Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, func, labels=()):
+        """Gauges are callbacks; registering a name again replaces the callback"""
+        gauge = Gauge(name, help, func, labels)
+        with self.lock:
+            self.metrics[name] = gauge
+        return gauge
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, name, factory):
+        """Counters and histograms are shared: the same name returns the same metric"""
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = factory()
+            return metric
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics():
+    """Process-wide registry (each gunicorn worker reports its own)"""
+    return _registry
+
+
+# Shared by the bridges so dashboards can compare them stage by stage
+SMS_STAGE_SECONDS = _registry.histogram(
+    'majisafe_sms_stage_seconds', 'Time spent in each step of the SMS-to-water pipeline',
+    ('bridge', 'stage'))
+SMS_TOTAL = _registry.counter(
+    'majisafe_sms_total', 'SMS handled, by outcome', ('bridge', 'outcome'))
+HTTP_REQUEST_SECONDS = _registry.histogram(
+    'majisafe_http_request_seconds', 'Request latency by route and status',
+    ('bridge', 'route', 'method', 'status'))
+DB_COMMIT_SECONDS = _registry.histogram(
+    'majisafe_db_commit_seconds', 'Group-commit transaction time', ('db',))
+DB_COMMIT_ROWS = _registry.histogram(
+    'majisafe_db_commit_rows', 'Rows per group commit', ('db',),
+    buckets=(1, 2, 5, 10, 25, 50, 100, 200, 500))
+
+
+def stage_timer(bridge):
+    """stage('parse') -> with-block timing one pipeline stage for this bridge"""
+    def stage(name):
+        return SMS_STAGE_SECONDS.time(bridge=bridge, stage=name)
+    return stage
+
+
+def instrument(app, bridge):
+    """Time every request of a Flask app and serve the registry at /metrics"""
+    from flask import Response, g, request
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start, bridge=bridge,
+                route=request.url_rule.rule if request.url_rule else 'unmatched',
+                method=request.method, status=response.status_code)
+        return response
+
+    app.add_url_rule('/metrics', 'metrics',
+                     lambda: Response(_registry.render(), content_type=CONTENT_TYPE))
+    return app
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+MQTT Bus - Pub/sub transport between the bridge and ESP32 pumps
+paho-mqtt against a real broker, or an in-process broker for development
+"""
+
+import itertools
+import queue
+import threading
+
+
+def topic_matches(topic_filter, topic):
+    """MQTT filter matching: '+' is one level, a trailing '#' is any remainder"""
+    filter_parts = topic_filter.split('/')
+    topic_parts = topic.split('/')
+    for i, part in enumerate(filter_parts):
+        if part == '#':
+            return True
+        if i >= len(topic_parts) or (part != '+' and part != topic_parts[i]):
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+class InProcessBroker:
+    """Broker stand-in: delivers on a background thread, redelivers QoS-1 messages
+    whose handler raised, up to max_redeliveries"""
+
+    def __init__(self, max_redeliveries=3):
+        self.max_redeliveries = max_redeliveries
+        self.lock = threading.Lock()
+        self.subscriptions = []
+        self.inbox = queue.Queue()
+        self.published = 0
+        self.redelivered = 0
+
+        self.thread = threading.Thread(target=self._run, name="mqtt-inprocess")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def publish(self, topic, payload, qos=1):
+        with self.lock:
+            self.published += 1
+            targets = [(f, cb, q) for f, cb, q in self.subscriptions if topic_matches(f, topic)]
+        for topic_filter, callback, sub_qos in targets:
+            self.inbox.put((topic, payload, callback, min(qos, sub_qos), 0))
+
+    def subscribe(self, topic_filter, callback, qos=1):
+        """callback(topic, payload) runs on the broker's delivery thread"""
+        with self.lock:
+            self.subscriptions.append((topic_filter, callback, qos))
+
+    def close(self):
+        self.inbox.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            item = self.inbox.get()
+            if item is None:
+                break
+            topic, payload, callback, qos, attempt = item
+            try:
+                callback(topic, payload)
+            except Exception as e:
+                if qos >= 1 and attempt < self.max_redeliveries:
+                    self.redelivered += 1
+                    self.inbox.put((topic, payload, callback, qos, attempt + 1))
+                else:
+                    print(f"❌ MQTT handler error on {topic}: {e}")
+
+
+class PahoBus:
+    """Same publish/subscribe interface over paho-mqtt (persistent session, QoS 1)"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, host='localhost', port=1883, client_id=None, username=None,
+                 password=None, keepalive=30):
+        # Optional dependency: only needed when PUMP_TRANSPORT=mqtt
+        import paho.mqtt.client as mqtt
+
+        client_id = client_id or f"majisafe-bridge-{next(self._ids)}"
+        if hasattr(mqtt, 'CallbackAPIVersion'):
+            self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id, clean_session=False)
+        else:
+            self.client = mqtt.Client(client_id=client_id, clean_session=False)
+        if username:
+            self.client.username_pw_set(username, password)
+
+        self.lock = threading.Lock()
+        self.subscriptions = []
+        self.client.on_message = self._on_message
+        self.client.on_connect = self._on_connect
+        # paho queues QoS-1 messages published while the link is down
+        self.client.max_queued_messages_set(10000)
+        self.client.connect(host, port, keepalive)
+        self.client.loop_start()
+
+    def publish(self, topic, payload, qos=1):
+        self.client.publish(topic, payload, qos=qos)
+
+    def subscribe(self, topic_filter, callback, qos=1):
+        with self.lock:
+            self.subscriptions.append((topic_filter, callback, qos))
+        self.client.subscribe(topic_filter, qos)
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+    def _on_connect(self, client, userdata, flags, *args):
+        # Re-subscribe after a reconnect; the broker may have dropped the session
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        for topic_filter, _, qos in subscriptions:
+            client.subscribe(topic_filter, qos)
+
+    def _on_message(self, client, userdata, message):
+        with self.lock:
+            targets = [cb for f, cb, _ in self.subscriptions if topic_matches(f, message.topic)]
+        for callback in targets:
+            try:
+                callback(message.topic, message.payload)
+            except Exception as e:
+                print(f"❌ MQTT handler error on {message.topic}: {e}")
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Nonce Manager - Many in-flight buyWater transactions from one hot wallet
+Local nonce allocation, cached fee estimates, gap recovery and stuck-tx replacement
+"""
+
+import heapq
+import threading
+import time
+
+from web3 import Web3
+from web3.exceptions import TransactionNotFound
+
+BUY_WATER_ABI = [
+    {
+        "inputs": [{"name": "pumpId", "type": "bytes32"}],
+        "name": "buyWater",
+        "outputs": [],
+        "stateMutability": "payable",
+        "type": "function"
+    }
+]
+
+
+class FeeEstimator:
+    def __init__(self, w3, ttl=15, priority_fee_gwei=1.5, base_fee_multiplier=2):
+        self.w3 = w3
+        self.ttl = ttl
+        self.priority_fee = Web3.to_wei(priority_fee_gwei, 'gwei')
+        self.base_fee_multiplier = base_fee_multiplier
+
+        self.lock = threading.Lock()
+        self.cached = None
+        self.cached_at = 0
+
+    def fees(self):
+        """Fee fields for a new transaction; one RPC call per ttl, not per tx"""
+        with self.lock:
+            if self.cached and time.monotonic() - self.cached_at < self.ttl:
+                return dict(self.cached)
+
+            block = self.w3.eth.get_block('latest')
+            base_fee = block.get('baseFeePerGas')
+            if base_fee is not None:
+                # EIP-1559: headroom for a few full blocks of base fee growth
+                self.cached = {
+                    'maxPriorityFeePerGas': self.priority_fee,
+                    'maxFeePerGas': base_fee * self.base_fee_multiplier + self.priority_fee
+                }
+            else:
+                self.cached = {'gasPrice': self.w3.eth.gas_price}
+            self.cached_at = time.monotonic()
+            return dict(self.cached)
+
+    def invalidate(self):
+        with self.lock:
+            self.cached = None
+
+
+class NonceManager:
+    def __init__(self, w3, address):
+        self.w3 = w3
+        self.address = address
+        self.lock = threading.Lock()
+        self.next_nonce = None
+        # Nonces handed out but never broadcast; reused first so no gap is left
+        self.released = []
+
+    def allocate(self):
+        with self.lock:
+            if self.released:
+                return heapq.heappop(self.released)
+            if self.next_nonce is None:
+                self.next_nonce = self.w3.eth.get_transaction_count(self.address, 'pending')
+            nonce = self.next_nonce
+            self.next_nonce += 1
+            return nonce
+
+    def release(self, nonce):
+        """Return a nonce whose transaction never reached the node"""
+        with self.lock:
+            heapq.heappush(self.released, nonce)
+
+    def take_gaps(self, below):
+        """Released nonces under below that no one reused; the chain's pending
+        nonce rules out ones a transaction from elsewhere already took"""
+        with self.lock:
+            if not self.released or self.released[0] >= below:
+                return []
+            chain_nonce = self.w3.eth.get_transaction_count(self.address, 'pending')
+            gaps = []
+            while self.released and self.released[0] < below:
+                nonce = heapq.heappop(self.released)
+                if nonce >= chain_nonce:
+                    gaps.append(nonce)
+            return gaps
+
+    def resync(self):
+        """Re-read the chain's pending nonce after a 'nonce too low' or restart"""
+        with self.lock:
+            chain_nonce = self.w3.eth.get_transaction_count(self.address, 'pending')
+            self.released = [n for n in self.released if n >= chain_nonce]
+            heapq.heapify(self.released)
+            if self.next_nonce is None or chain_nonce > self.next_nonce:
+                self.next_nonce = chain_nonce
+            return self.next_nonce
+
+
+class TransactionPipeline:
+    def __init__(self, w3, private_key, contract_address, gas_limit=200000,
+                 stuck_after=90, fee_bump=1.125, check_interval=3):
+        self.w3 = w3
+        self.account = w3.eth.account.from_key(private_key)
+        self.contract = w3.eth.contract(
+            address=Web3.to_checksum_address(contract_address),
+            abi=BUY_WATER_ABI
+        )
+        self.gas_limit = gas_limit
+        self.stuck_after = stuck_after
+        # Nodes require >= 10% higher fees to replace a pending transaction
+        self.fee_bump = fee_bump
+        self.check_interval = check_interval
+
+        self.nonces = NonceManager(w3, self.account.address)
+        self.fee_estimator = FeeEstimator(w3)
+        self.chain_id = None
+
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.replacement_listeners = []
+
+        self.running = False
+        self.thread = None
+
+    def on_replaced(self, listener):
+        """listener(old_tx_hash, new_tx_hash) when a stuck tx is re-sent (either may be mined)"""
+        self.replacement_listeners.append(listener)
+
+    def buy_water(self, pump_id_bytes, value_wei):
+        """Sign and broadcast buyWater without waiting for it to be mined
+
+        Raises if the transaction certainly never reached the node. When the
+        send times out the hash is still returned: the purchase may be mined.
+        """
+        if self.chain_id is None:
+            self.chain_id = self.w3.eth.chain_id
+
+        nonce = self.nonces.allocate()
+        return self._submit(nonce, lambda: self.contract.functions.buyWater(pump_id_bytes).build_transaction({
+            'from': self.account.address,
+            'value': value_wei,
+            'gas': self.gas_limit,
+            'nonce': nonce,
+            'chainId': self.chain_id,
+            **self.fee_estimator.fees()
+        }))
+
+    def in_flight_count(self):
+        with self.lock:
+            return len(self.in_flight)
+
+    def check_in_flight(self):
+        """Fill nonce gaps, drop mined transactions and replace ones stuck for stuck_after seconds"""
+        self._fill_gaps()
+        with self.lock:
+            pending = list(self.in_flight.items())
+
+        for nonce, entry in pending:
+            # Any version of the nonce may be the one that gets mined
+            if not any(self._mined(tx_hash) for tx_hash in entry['tx_hashes']):
+                if time.monotonic() - entry['sent_at'] >= self.stuck_after:
+                    self._replace(nonce, entry)
+                continue
+
+            with self.lock:
+                if self.in_flight.get(nonce) is entry:
+                    del self.in_flight[nonce]
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="tx-pipeline")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def _mined(self, tx_hash):
+        try:
+            self.w3.eth.get_transaction_receipt(tx_hash)
+            return True
+        except TransactionNotFound:
+            return False
+
+    def _submit(self, nonce, build):
+        """Build, sign and broadcast a transaction at an allocated nonce; returns its hash
+
+        The nonce goes back to the manager only when the node certainly has no
+        transaction at it: something failed before the broadcast, or the node
+        answered with an error. A timeout or dropped connection leaves that
+        open, so the transaction stays in flight under the hash it was signed
+        with. Either it gets mined, or once stuck_after passes it is re-sent.
+        """
+        try:
+            tx = build()
+            raw, tx_hash = self._sign(tx)
+            sent = self._broadcast(raw)
+        except Exception as e:
+            if 'nonce too low' in str(e).lower():
+                # Someone else used this wallet; the nonce is gone, not reusable
+                self.nonces.resync()
+            else:
+                self.nonces.release(nonce)
+            raise
+
+        with self.lock:
+            self.in_flight[nonce] = {'tx': tx, 'tx_hashes': [tx_hash], 'sent_at': time.monotonic()}
+        if not sent:
+            try:
+                self.nonces.resync()
+            except Exception as e:
+                # The node is unreachable; the next check_in_flight reads it again
+                print(f"⚠️ Could not resync nonces: {e}")
+        return tx_hash
+
+    def _sign(self, tx):
+        signed = self.account.sign_transaction(tx)
+        return signed.rawTransaction, signed.hash.hex()
+
+    def _broadcast(self, raw):
+        """True once the node has the transaction, False if it may or may not
+
+        Raises ValueError when the node rejected it (web3 turns JSON-RPC
+        errors into ValueError).
+        """
+        try:
+            self.w3.eth.send_raw_transaction(raw)
+        except ValueError as e:
+            message = str(e).lower()
+            if 'already known' in message or 'known transaction' in message:
+                return True
+            raise
+        except Exception as e:
+            print(f"⚠️ Broadcast outcome unknown, keeping the nonce: {e}")
+            return False
+        return True
+
+    def _fill_gaps(self):
+        """Spend released nonces that in-flight transactions are queued behind
+
+        A nonce handed back and never reused stops every later one from being
+        mined, so each gap gets a zero-value transfer to the wallet itself.
+        """
+        with self.lock:
+            if not self.in_flight:
+                return
+            highest = max(self.in_flight)
+
+        for nonce in self.nonces.take_gaps(highest):
+            try:
+                tx_hash = self._submit(nonce, lambda: {
+                    'from': self.account.address,
+                    'to': self.account.address,
+                    'value': 0,
+                    'gas': 21000,
+                    'nonce': nonce,
+                    'chainId': self.chain_id,
+                    **self.fee_estimator.fees()
+                })
+            except Exception as e:
+                print(f"⚠️ Could not fill nonce gap {nonce}: {e}")
+                continue
+            print(f"🩹 Filled nonce gap {nonce} with {tx_hash[:12]}...")
+
+    def _replace(self, nonce, entry):
+        """Re-send the same nonce with bumped fees"""
+        tx = dict(entry['tx'])
+        self.fee_estimator.invalidate()
+        current = self.fee_estimator.fees()
+        for field in ('gasPrice', 'maxFeePerGas', 'maxPriorityFeePerGas'):
+            if field in tx:
+                bumped = int(tx[field] * self.fee_bump) + 1
+                tx[field] = max(bumped, current.get(field, 0))
+
+        try:
+            raw, new_hash = self._sign(tx)
+            # Tracked even if the outcome is unknown: the node may have it
+            self._broadcast(raw)
+        except Exception as e:
+            # Typically "nonce too low": the original was mined meanwhile
+            print(f"⚠️ Could not replace nonce {nonce}: {e}")
+            return
+
+        old_hash = entry['tx_hashes'][-1]
+        print(f"⛽ Replaced stuck tx {old_hash[:12]}... with {new_hash[:12]}...")
+        with self.lock:
+            # Earlier hashes stay: the original can still win the race to be mined
+            self.in_flight[nonce] = {'tx': tx, 'tx_hashes': entry['tx_hashes'] + [new_hash],
+                                     'sent_at': time.monotonic()}
+        for listener in self.replacement_listeners:
+            listener(old_hash, new_hash)
+
+    def _run(self):
+        while self.running:
+            try:
+                self.check_in_flight()
+            except Exception as e:
+                print(f"❌ Transaction pipeline error: {e}")
+            time.sleep(self.check_interval)
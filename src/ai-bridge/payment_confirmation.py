@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Payment Confirmation - Pluggable backends that settle SMS payments on a real signal
+request() returns a Future at once; a web UI callback, chain event or operator resolves it
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+from lazy import lazy_property
+
+# Result statuses; only SUCCESS carries message 'activate'
+SUCCESS = 'success'
+REJECTED = 'rejected'
+TIMEOUT = 'timeout'
+CANCELLED = 'cancelled'
+
+
+class PaymentConfirmer:
+    """Manual backend: resolved by confirm()/reject() calls
+
+    Those come from the web UI's /blockchain-confirmed callback or an
+    operator. One timer thread handles every deadline, so hundreds of
+    payments can wait at once without a thread (or a sleep) each.
+    Subclasses add signal sources through started() and finished().
+    """
+    source = 'manual'
+
+    def __init__(self, timeout=600):
+        """timeout: seconds a payment may wait before it resolves as TIMEOUT"""
+        self.timeout = timeout
+
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        # request id -> request, in the order they were opened
+        self.pending = {}
+        # (when, sequence, callback) heap for timeouts and scheduled signals
+        self.timers = []
+        self.sequence = itertools.count()
+        self.counts = {SUCCESS: 0, REJECTED: 0, TIMEOUT: 0, CANCELLED: 0}
+
+        self.running = False
+        self.thread = None
+
+    def request(self, pump_id, phone, timeout=None, **context):
+        """Start waiting for a payment; returns a Future of the result dict
+
+        The result is {'status', 'message', 'tx_hash', 'pump_id', 'phone',
+        'request_id', 'source', 'waited'}. It never raises and never
+        reports SUCCESS unless a signal confirmed this payment.
+        """
+        now = time.time()
+        timeout = self.timeout if timeout is None else timeout
+        request = {
+            'request_id': uuid.uuid4().hex[:16],
+            'pump_id': pump_id,
+            'phone': phone,
+            'opened_at': now,
+            'expires_at': now + timeout,
+            **context
+        }
+        future = Future()
+        future.request = request
+
+        with self.lock:
+            self.pending[request['request_id']] = (request, future)
+        self.schedule(timeout, lambda: self._resolve(
+            request['request_id'], TIMEOUT, message="No payment confirmation before the deadline"))
+        # A failing signal source still leaves the callback, operator and timeout
+        self._call(self.started, request)
+        return future
+
+    async def request_async(self, pump_id, phone, timeout=None, **context):
+        """request() for asyncio callers; awaits the result dict"""
+        return await asyncio.wrap_future(self.request(pump_id, phone, timeout, **context))
+
+    def confirm(self, pump_id=None, phone=None, tx_hash=None, request_id=None, source=None):
+        """Settle the matching payment as paid; returns its result, or None if nothing matched"""
+        match = self._match(request_id, phone, pump_id)
+        if match is None:
+            return None
+        return self._resolve(match, SUCCESS, tx_hash=tx_hash, source=source)
+
+    def reject(self, reason, pump_id=None, phone=None, request_id=None, source=None):
+        """Settle the matching payment as refused, e.g. by an operator"""
+        match = self._match(request_id, phone, pump_id)
+        if match is None:
+            return None
+        return self._resolve(match, REJECTED, message=reason, source=source)
+
+    def waiting(self):
+        """Pending requests, oldest first (without their futures)"""
+        with self.lock:
+            return [dict(request) for request, _ in self.pending.values()]
+
+    def pending_count(self):
+        return len(self.pending)
+
+    def stats(self):
+        with self.lock:
+            return {'backend': self.source, 'pending': len(self.pending), **self.counts}
+
+    def schedule(self, delay, callback):
+        """Run callback() on the timer thread after delay seconds"""
+        with self.wakeup:
+            heapq.heappush(self.timers, (time.monotonic() + delay, next(self.sequence), callback))
+            if not self.running:
+                self.running = True
+                self.thread = threading.Thread(target=self._run, name="payment-confirmations")
+                self.thread.daemon = True
+                self.thread.start()
+            self.wakeup.notify()
+
+    def close(self):
+        """Stop the timer thread; payments still waiting resolve as CANCELLED"""
+        with self.wakeup:
+            self.running = False
+            self.wakeup.notify()
+            request_ids = list(self.pending)
+        for request_id in request_ids:
+            self._resolve(request_id, CANCELLED, message="Bridge shutting down")
+
+    def started(self, request):
+        """Hook: a payment started waiting (e.g. watch the chain for it)"""
+
+    def finished(self, request, result):
+        """Hook: a payment resolved, by any source (e.g. stop watching for it)"""
+
+    def _match(self, request_id, phone, pump_id):
+        """Request id, else the phone's oldest payment, else the pump's oldest"""
+        with self.lock:
+            if request_id:
+                return request_id if request_id in self.pending else None
+            for key, value in (('phone', phone), ('pump_id', pump_id)):
+                if value:
+                    return next((rid for rid, (request, _) in self.pending.items()
+                                 if request[key] == value), None)
+        return None
+
+    def _resolve(self, request_id, status, tx_hash=None, message=None, source=None):
+        with self.lock:
+            entry = self.pending.pop(request_id, None)
+            if entry is None:
+                # Already settled by another signal (or timed out first)
+                return None
+            self.counts[status] += 1
+
+        request, future = entry
+        result = {
+            'status': status,
+            'message': 'activate' if status == SUCCESS else message,
+            'tx_hash': tx_hash,
+            'pump_id': request['pump_id'],
+            'phone': request['phone'],
+            'request_id': request_id,
+            'source': source or self.source,
+            'waited': round(time.time() - request['opened_at'], 3)
+        }
+        self._call(self.finished, request, result)
+        future.set_result(result)
+        return result
+
+    def _call(self, callback, *args):
+        try:
+            callback(*args)
+        except Exception as e:
+            print(f"❌ Payment confirmation callback error: {e}")
+
+    def _run(self):
+        while True:
+            with self.wakeup:
+                while self.running and not (self.timers and self.timers[0][0] <= time.monotonic()):
+                    self.wakeup.wait(self.timers[0][0] - time.monotonic() if self.timers else None)
+                if not self.running:
+                    return
+                now = time.monotonic()
+                due = []
+                while self.timers and self.timers[0][0] <= now:
+                    due.append(heapq.heappop(self.timers)[2])
+            for callback in due:
+                self._call(callback)
+
+
+class ChainConfirmer(PaymentConfirmer):
+    """Settled by the WaterPurchased event for the payment's pump
+
+    All pending payments share one WaterBrokerWatcher (one eth_getLogs per
+    poll). w3 may be a callable so web3 loads with the first payment.
+    """
+    source = 'chain'
+
+    def __init__(self, w3, contract_address, timeout=600, poll_interval=2.0, confirmations=1):
+        super().__init__(timeout)
+        self.w3 = w3
+        self.contract_address = contract_address
+        self.poll_interval = poll_interval
+        self.confirmations = confirmations
+
+    @lazy_property
+    def watcher(self):
+        from chain_watcher import WaterBrokerWatcher
+        w3 = self.w3() if callable(self.w3) else self.w3
+        watcher = WaterBrokerWatcher(w3, self.contract_address, poll_interval=self.poll_interval,
+                                     confirmations=self.confirmations, pending_ttl=self.timeout)
+        watcher.start()
+        return watcher
+
+    def started(self, request):
+        request_id = request['request_id']
+        request['watch'] = self.watcher.expect(
+            request['pump_id'],
+            lambda payment, event: self._resolve(request_id, SUCCESS, tx_hash=event['tx_hash']),
+            tx_hash=request.get('tx_hash'))
+
+    def finished(self, request, result):
+        # Settled some other way (or timed out): the next purchase for this pump is someone else's
+        if 'watch' in request:
+            self.watcher.cancel(request['watch'])
+
+    def close(self):
+        super().close()
+        if 'watcher' in self.__dict__:
+            self.watcher.stop()
+
+
+def make_confirmer(kind=None, timeout=None, w3=None, contract_address=None):
+    """Backend named by kind or PAYMENT_CONFIRMATION: manual, chain, trigger, demo, metamask
+
+    manual   - web UI callback / operator only (default)
+    chain    - WaterPurchased events via w3 (a Web3 or a callable returning one)
+    trigger  - manual, and opens the web UI for the customer (simple_trigger)
+    demo     - confirms itself after DEMO_CONFIRM_DELAY seconds (simple_demo)
+    metamask - MetaMask transactions seen in a Chrome debugging session, once mined (metamask_only)
+    """
+    kind = (kind or os.environ.get('PAYMENT_CONFIRMATION', 'manual')).lower()
+    timeout = float(timeout if timeout is not None else os.environ.get('PAYMENT_CONFIRMATION_TIMEOUT', 600))
+
+    if kind == 'manual':
+        return PaymentConfirmer(timeout)
+    contract_address = contract_address or os.environ.get(
+        'WATER_BROKER_ADDRESS', '0x4933781A5DDC86bdF9c9C9795647e763E0429E28')
+    if kind == 'chain':
+        return ChainConfirmer(w3, contract_address, timeout,
+                              confirmations=int(os.environ.get('PAYMENT_CONFIRMATIONS', 1)))
+    if kind == 'trigger':
+        from simple_trigger import SimpleTrigger
+        return SimpleTrigger(timeout=timeout)
+    if kind == 'demo':
+        from simple_demo import SimpleDemo
+        return SimpleDemo(timeout=timeout, delay=float(os.environ.get('DEMO_CONFIRM_DELAY', 15)))
+    if kind == 'metamask':
+        from metamask_only import MetaMaskOnly
+        return MetaMaskOnly(w3, contract_address, timeout=timeout)
+    raise ValueError(f"Unknown PAYMENT_CONFIRMATION backend: {kind}")
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Payment Sessions - Per-pump SMS payment state for concurrent customers
+Writers swap in new immutable snapshots under a lock; readers never lock
+"""
+
+import threading
+import time
+
+
+class PaymentSessionStore:
+    def __init__(self, ttl=600):
+        """ttl: seconds an unconfirmed SMS payment stays pending"""
+        self.ttl = ttl
+        self.lock = threading.Lock()
+
+        # pump_id -> tuple of sessions (FIFO: customers queue at a pump)
+        self.by_pump = {}
+        # phone -> session, for customers asking about their own payment
+        self.by_phone = {}
+        self.latest = None
+
+    def open(self, pump_id, phone, amount, currency, **extra):
+        """Record a validated SMS payment waiting for blockchain confirmation"""
+        now = time.time()
+        session = {
+            'payment_received': True,
+            'blockchain_confirmed': False,
+            'pump_id': pump_id,
+            'phone': phone,
+            'amount': f"{amount} {currency}",
+            'opened_at': now,
+            'expires_at': now + self.ttl,
+            **extra
+        }
+
+        with self.lock:
+            by_pump, by_phone = self._evicted(now)
+            by_pump[pump_id] = by_pump.get(pump_id, ()) + (session,)
+            by_phone[phone] = session
+            self._swap(by_pump, by_phone, session)
+        return session
+
+    def get(self, pump_id):
+        """Oldest pending session for a pump, or None"""
+        now = time.time()
+        for session in self.by_pump.get(pump_id, ()):
+            if session['expires_at'] > now:
+                return session
+        return None
+
+    def for_phone(self, phone):
+        session = self.by_phone.get(phone)
+        if session and session['expires_at'] > time.time():
+            return session
+        return None
+
+    def newest(self):
+        """Most recently opened session that is still pending"""
+        session = self.latest
+        if session and session['expires_at'] > time.time() and self._pending(session):
+            return session
+
+        # The latest one was confirmed or expired; fall back to a scan
+        active = self.active()
+        return max(active, key=lambda s: s['opened_at']) if active else None
+
+    def active(self):
+        """All pending sessions, oldest first per pump"""
+        now = time.time()
+        return [
+            session
+            for sessions in self.by_pump.values()
+            for session in sessions
+            if session['expires_at'] > now
+        ]
+
+    def confirm(self, pump_id=None, phone=None, tx_hash=None, session=None):
+        """Close a session once its blockchain payment is confirmed
+
+        Matches the given session when still pending, else by phone when
+        given, else the oldest session on pump_id.
+        Returns the confirmed session, or None if nothing matched.
+        """
+        session = self._take(pump_id, phone, session)
+        if session is None:
+            return None
+        return {**session, 'blockchain_confirmed': True, 'tx_hash': tx_hash}
+
+    def cancel(self, session):
+        """Drop a pending session whose payment was rejected or timed out"""
+        return self._take(None, None, session) is not None
+
+    def evict_expired(self):
+        with self.lock:
+            by_pump, by_phone = self._evicted(time.time())
+            self._swap(by_pump, by_phone, self.latest)
+
+    def _take(self, pump_id, phone, session):
+        """Remove and return the matching pending session"""
+        with self.lock:
+            by_pump, by_phone = self._evicted(time.time())
+
+            if session is not None:
+                pending = by_pump.get(session['pump_id'], ())
+                session = next((s for s in pending if s is session), None)
+            else:
+                session = by_phone.get(phone) if phone else None
+                if session is None and pump_id:
+                    pending = by_pump.get(pump_id, ())
+                    session = pending[0] if pending else None
+            if session is None:
+                return None
+
+            remaining = tuple(s for s in by_pump.get(session['pump_id'], ()) if s is not session)
+            if remaining:
+                by_pump[session['pump_id']] = remaining
+            else:
+                by_pump.pop(session['pump_id'], None)
+            if by_phone.get(session['phone']) is session:
+                del by_phone[session['phone']]
+
+            self._swap(by_pump, by_phone, self.latest)
+
+        return session
+
+    def _pending(self, session):
+        return any(s is session for s in self.by_pump.get(session['pump_id'], ()))
+
+    def _evicted(self, now):
+        """Copies of the indexes without expired sessions (caller holds the lock)"""
+        by_pump = {}
+        for pump_id, sessions in self.by_pump.items():
+            live = tuple(s for s in sessions if s['expires_at'] > now)
+            if live:
+                by_pump[pump_id] = live
+        by_phone = {p: s for p, s in self.by_phone.items() if s['expires_at'] > now}
+        return by_pump, by_phone
+
+    def _swap(self, by_pump, by_phone, latest):
+        # Single reference assignments: readers see either the old or new snapshot
+        self.by_pump = by_pump
+        self.by_phone = by_phone
+        self.latest = latest
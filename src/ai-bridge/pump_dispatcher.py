@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Pump Dispatcher - Sends activation commands to ESP32 pump controllers
+Registry of pump -> device address, acked commands with deadlines, parallel fan-out
+HTTP to each device, or MQTT topics pumps/<id>/cmd, /ack and /telemetry
+"""
+
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from http_client import HTTPClient
+
+# Used when no registry is configured: the single demo pump on the LAN
+DEFAULT_PUMPS = {'PUMP001': 'http://192.168.1.100'}
+
+
+class PumpRegistry:
+    def __init__(self, pumps=None):
+        self.lock = threading.Lock()
+        self.pumps = {}
+        for pump_id, address in (pumps or {}).items():
+            self.register(pump_id, address)
+
+    @classmethod
+    def from_file(cls, path):
+        """pumps.json: {"PUMP001": "http://192.168.1.100", ...}"""
+        with open(path) as f:
+            return cls(json.load(f))
+
+    @classmethod
+    def from_env(cls, value):
+        """PUMP_DEVICES=PUMP001=http://192.168.1.100,PUMP002=http://192.168.1.101"""
+        pumps = {}
+        for entry in filter(None, value.split(',')):
+            pump_id, _, address = entry.partition('=')
+            pumps[pump_id.strip()] = address.strip()
+        return cls(pumps)
+
+    def register(self, pump_id, address):
+        """Add or move a pump; bare IPs get http://"""
+        address = address.rstrip('/')
+        if '://' not in address:
+            address = f"http://{address}"
+        with self.lock:
+            self.pumps[pump_id.upper()] = address
+
+    def address(self, pump_id):
+        return self.pumps.get(pump_id.upper())
+
+    def all(self):
+        return dict(self.pumps)
+
+
+class PumpDispatcher:
+    def __init__(self, registry, deadline=8.0, attempts=3, ack_timeout=3.0,
+                 connect_timeout=2.0, backoff=0.25, workers=16):
+        """
+        deadline: seconds from submit until an unacked command is given up
+        attempts: sends per command; retries reuse the command_id so the
+                  firmware runs a command at most once
+        ack_timeout: longest a single send waits for the firmware's ack
+        """
+        self.registry = registry
+        self.deadline = deadline
+        self.attempts = attempts
+        self.ack_timeout = ack_timeout
+        self.connect_timeout = connect_timeout
+        self.backoff = backoff
+
+        # Own pool: retries are handled here against the deadline, not by the client
+        self.http = HTTPClient(connect_timeout=connect_timeout, read_timeout=ack_timeout,
+                               retries=0, pool_maxsize=workers)
+        import requests
+        self.send_errors = (requests.RequestException, ValueError)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pump-dispatch")
+
+        self.lock = threading.Lock()
+        self.counters = {'sent': 0, 'acked': 0, 'retries': 0, 'failed': 0}
+
+    def submit(self, pump_id, duration=10, command_id=None):
+        """Queue an activation; the Future resolves to the result dict (never raises)"""
+        command_id = command_id or uuid.uuid4().hex[:16]
+        expires_at = time.monotonic() + self.deadline
+        return self.executor.submit(self._activate, pump_id.upper(), duration, command_id, expires_at)
+
+    def activate(self, pump_id, duration=10, command_id=None):
+        """Activate a pump and wait for the ack (or the deadline)"""
+        return self.submit(pump_id, duration, command_id).result()
+
+    def activate_many(self, commands):
+        """Fan out [(pump_id, duration), ...] in parallel; results in the same order"""
+        futures = [self.submit(pump_id, duration) for pump_id, duration in commands]
+        return [future.result() for future in futures]
+
+    def confirm_web3(self, pump_id, tx_hash, event_id):
+        """Forward a blockchain confirmation to a pump's /confirm-web3 endpoint"""
+        address = self.registry.address(pump_id)
+        if not address:
+            return {'status': 'error', 'message': f"Unknown pump {pump_id}"}
+
+        # The firmware reads these with server.arg(), i.e. form fields
+        response = self.http.post(f"{address}/confirm-web3",
+                                  data={'tx_hash': tx_hash, 'event_id': event_id},
+                                  timeout=(self.connect_timeout, self.ack_timeout))
+        try:
+            return response.json()
+        except ValueError:
+            return {'status': 'error', 'message': f"HTTP {response.status_code}"}
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+        return {**counters, 'pumps': len(self.registry.all()), 'http': self.http.metrics()}
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.http.close()
+
+    def _activate(self, pump_id, duration, command_id, expires_at):
+        start = time.monotonic()
+        result = {'pump_id': pump_id, 'command_id': command_id, 'acked': False, 'attempts': 0}
+
+        address = self.registry.address(pump_id)
+        if not address:
+            self._count('failed')
+            return {**result, 'error': f"Unknown pump {pump_id}"}
+
+        payload = {'pump_id': pump_id, 'duration': duration, 'command': 'ACTIVATE', 'command_id': command_id}
+        error = None
+        for attempt in range(1, self.attempts + 1):
+            remaining = expires_at - time.monotonic()
+            if remaining <= 0:
+                error = error or "Deadline expired"
+                break
+
+            result['attempts'] = attempt
+            if attempt > 1:
+                self._count('retries')
+            self._count('sent')
+
+            try:
+                response = self.http.post(
+                    f"{address}/activate", json=payload,
+                    timeout=(min(self.connect_timeout, remaining), min(self.ack_timeout, remaining))
+                )
+                ack = response.json() if response.status_code == 200 else {}
+                if ack.get('command_id') == command_id and ack.get('status') in ('ack', 'success'):
+                    self._count('acked')
+                    return {**result, 'acked': True, 'latency_ms': round(1000 * (time.monotonic() - start), 1)}
+                error = ack.get('message') or f"HTTP {response.status_code}"
+            except self.send_errors as e:
+                error = str(e)
+
+            # Jittered backoff, but never past the deadline
+            delay = random.uniform(0, self.backoff * (2 ** (attempt - 1)))
+            time.sleep(max(0, min(delay, expires_at - time.monotonic())))
+
+        self._count('failed')
+        return {**result, 'error': error, 'latency_ms': round(1000 * (time.monotonic() - start), 1)}
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+
+class MQTTPumpDispatcher:
+    def __init__(self, bus, deadline=8.0, resend_interval=2.0, tick=0.1):
+        """
+        bus: InProcessBroker or PahoBus
+        resend_interval: republish an unacked command this often until the deadline
+        """
+        self.bus = bus
+        self.deadline = deadline
+        self.resend_interval = resend_interval
+        self.tick = tick
+
+        self.lock = threading.Lock()
+        # command_id -> in-flight command; one timer thread serves all of them
+        self.pending = {}
+        self.counters = {'sent': 0, 'acked': 0, 'retries': 0, 'failed': 0}
+
+        # Last telemetry per pump, plus hooks for the telemetry store
+        self.telemetry = {}
+        self.telemetry_handlers = []
+
+        self.bus.subscribe('pumps/+/ack', self._on_ack, qos=1)
+        self.bus.subscribe('pumps/+/telemetry', self._on_telemetry, qos=1)
+
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="pump-mqtt-timer")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, pump_id, duration=10, command_id=None):
+        """Publish an activation; the Future resolves to the result dict (never raises)"""
+        return self._send(pump_id, {'command': 'ACTIVATE', 'duration': duration}, command_id)
+
+    def activate(self, pump_id, duration=10, command_id=None):
+        return self.submit(pump_id, duration, command_id).result()
+
+    def activate_many(self, commands):
+        """Publish all commands at once; acks arrive on one subscription"""
+        futures = [self.submit(pump_id, duration) for pump_id, duration in commands]
+        return [future.result() for future in futures]
+
+    def confirm_web3(self, pump_id, tx_hash, event_id):
+        result = self._send(pump_id, {'command': 'CONFIRM_WEB3', 'tx_hash': tx_hash,
+                                      'event_id': event_id}).result()
+        if result['acked']:
+            return {'status': 'success', 'message': 'Payment confirmed'}
+        return {'status': 'error', 'message': result['error']}
+
+    def on_telemetry(self, handler):
+        """handler(pump_id, reading) for every telemetry message"""
+        self.telemetry_handlers.append(handler)
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+            in_flight = len(self.pending)
+        return {**counters, 'in_flight': in_flight, 'pumps': len(self.telemetry)}
+
+    def close(self):
+        """Fail every command still waiting for an ack, then disconnect"""
+        with self.lock:
+            self.running = False
+            pending = list(self.pending.values())
+            self.pending.clear()
+            self.counters['failed'] += len(pending)
+        self.thread.join()
+        for command in pending:
+            self._finish(command, False, "shutdown")
+        self.bus.close()
+
+    def _send(self, pump_id, body, command_id=None):
+        pump_id = pump_id.upper()
+        command_id = command_id or uuid.uuid4().hex[:16]
+        now = time.monotonic()
+        command = {
+            'pump_id': pump_id,
+            'command_id': command_id,
+            'payload': json.dumps({**body, 'pump_id': pump_id, 'command_id': command_id}),
+            'future': Future(),
+            'started': now,
+            'expires_at': now + self.deadline,
+            'next_send': now + self.resend_interval,
+            'attempts': 1
+        }
+        with self.lock:
+            closed = not self.running
+            if not closed:
+                self.pending[command_id] = command
+                self.counters['sent'] += 1
+        if closed:
+            self._finish(command, False, "shutdown")
+            return command['future']
+
+        self.bus.publish(f"pumps/{pump_id}/cmd", command['payload'], qos=1)
+        return command['future']
+
+    def _finish(self, command, acked, error=None):
+        result = {
+            'pump_id': command['pump_id'],
+            'command_id': command['command_id'],
+            'acked': acked,
+            'attempts': command['attempts'],
+            'latency_ms': round(1000 * (time.monotonic() - command['started']), 1)
+        }
+        if error:
+            result['error'] = error
+        command['future'].set_result(result)
+
+    def _on_ack(self, topic, payload):
+        ack = self._decode(topic, payload)
+        if ack is None:
+            return
+        with self.lock:
+            command = self.pending.pop(ack.get('command_id'), None)
+            if command:
+                self.counters['acked'] += 1
+        # Late or duplicate acks (QoS 1 is at-least-once) find nothing pending
+        if command:
+            self._finish(command, True)
+
+    def _on_telemetry(self, topic, payload):
+        pump_id = topic.split('/')[1]
+        reading = self._decode(topic, payload)
+        if reading is None:
+            return
+        self.telemetry[pump_id] = {**reading, 'received_at': time.time()}
+        for handler in self.telemetry_handlers:
+            handler(pump_id, reading)
+
+    def _decode(self, topic, payload):
+        """JSON object from a device message, or None (logged) if it is malformed"""
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            message = None
+        if not isinstance(message, dict):
+            print(f"❌ Malformed message on {topic}: {payload[:80]!r}")
+            return None
+        return message
+
+    def _run(self):
+        while self.running:
+            time.sleep(self.tick)
+            now = time.monotonic()
+            expired, resend = [], []
+            with self.lock:
+                for command_id, command in list(self.pending.items()):
+                    if command['expires_at'] <= now:
+                        expired.append(self.pending.pop(command_id))
+                        self.counters['failed'] += 1
+                    elif command['next_send'] <= now:
+                        command['next_send'] = now + self.resend_interval
+                        command['attempts'] += 1
+                        self.counters['retries'] += 1
+                        resend.append(command)
+
+            # Same command_id: the firmware acks a repeat without running it again
+            for command in resend:
+                self.bus.publish(f"pumps/{command['pump_id']}/cmd", command['payload'], qos=1)
+            for command in expired:
+                self._finish(command, False, "Deadline expired")
+
+
+_default_dispatcher = None
+_default_lock = threading.Lock()
+
+
+def get_pump_dispatcher():
+    """Process-wide dispatcher: MQTT when PUMP_TRANSPORT=mqtt, else HTTP to
+    PUMP_DEVICES, else PUMPS_FILE, else the demo pump"""
+    global _default_dispatcher
+    if _default_dispatcher is None:
+        with _default_lock:
+            if _default_dispatcher is None and os.environ.get('PUMP_TRANSPORT') == 'mqtt':
+                from mqtt_bus import PahoBus
+                bus = PahoBus(
+                    host=os.environ.get('MQTT_HOST', 'localhost'),
+                    port=int(os.environ.get('MQTT_PORT', 1883)),
+                    username=os.environ.get('MQTT_USERNAME'),
+                    password=os.environ.get('MQTT_PASSWORD')
+                )
+                _default_dispatcher = MQTTPumpDispatcher(
+                    bus,
+                    deadline=float(os.environ.get('PUMP_DEADLINE', 8))
+                )
+            if _default_dispatcher is None:
+                devices = os.environ.get('PUMP_DEVICES')
+                path = os.environ.get('PUMPS_FILE', os.path.join(os.path.dirname(__file__), 'pumps.json'))
+                if devices:
+                    registry = PumpRegistry.from_env(devices)
+                elif os.path.exists(path):
+                    registry = PumpRegistry.from_file(path)
+                else:
+                    registry = PumpRegistry(DEFAULT_PUMPS)
+                _default_dispatcher = PumpDispatcher(
+                    registry,
+                    deadline=float(os.environ.get('PUMP_DEADLINE', 8)),
+                    attempts=int(os.environ.get('PUMP_ATTEMPTS', 3))
+                )
+    return _default_dispatcher
@@ -1,21 +1,55 @@
 #!/usr/bin/env python3
 """Real OriginTrail DKG Agent"""
 
-import requests
 import json
+import hashlib
+import os
+import uuid
 from datetime import datetime
 
+from http_client import get_http_client
+from lazy import lazy_property
+
 class RealDKGAgent:
-    def __init__(self):
-        self.dkg_node_url = "http://localhost:8900"
+    def __init__(self, dkg_node_url=None, http_client=None):
+        self.dkg_node_url = dkg_node_url or os.environ.get("DKG_NODE_URL", "http://localhost:8900")
+        if http_client:
+            self.http = http_client
         self.network = "otp:20430"
+        self.publish_options = {
+            "epochsNum": 5,
+            "maxNumberOfRetries": 3,
+            "frequency": 1
+        }
+        
+        # Set by enable_batching(); publish_to_dkg then coalesces assets
+        self.batcher = None
+    
+    @lazy_property
+    def http(self):
+        # The shared client (and requests) loads with the first publish, not at startup
+        return get_http_client()
+    
+    def enable_batching(self, window_seconds=2.0, max_batch_size=25):
+        """Publish assets as collections of up to max_batch_size per window"""
+        from dkg_batcher import DKGBatcher
+        
+        if not self.batcher:
+            self.batcher = DKGBatcher(self, window_seconds, max_batch_size)
+            print(f"📦 DKG batching on: {max_batch_size} assets / {window_seconds}s window")
+        return self.batcher
         
     def create_water_knowledge_asset(self, pump_data, payment_data, audit_log):
         """Create OriginTrail Knowledge Asset"""
-        return {
+        # Unique per event so bursts on one pump within a second don't collide
+        event_id = f"water-{pump_data['pump_id']}-{int(datetime.now().timestamp())}-{uuid.uuid4().hex[:8]}"
+        
+        asset = {
             "@context": ["https://schema.org/", "https://www.w3.org/ns/dkg#"],
             "@type": "WaterDispenseEvent",
-            "@id": f"water-{pump_data['pump_id']}-{int(datetime.now().timestamp())}",
+            "@id": event_id,
+            "eventId": event_id,
+            "pumpId": pump_data['pump_id'],
             "name": f"Water Dispensed at {pump_data['pump_id']}",
             "description": f"Blockchain-verified water dispensing event",
             "location": {
@@ -37,19 +71,25 @@ class RealDKGAgent:
             "timestamp": datetime.now().isoformat(),
             "auditTrail": audit_log
         }
+        
+        # Hash of the asset content so the published copy can be verified later
+        asset["verificationHash"] = hashlib.sha256(
+            json.dumps(asset, sort_keys=True, default=str).encode()
+        ).hexdigest()
+        return asset
     
     def publish_to_dkg(self, knowledge_asset):
         """Publish to real OriginTrail DKG"""
+        if self.batcher:
+            # Blocks until the asset's batch has been published
+            return self.batcher.submit(knowledge_asset).result()
+        
         try:
-            response = requests.post(
+            response = self.http.post(
                 f"{self.dkg_node_url}/assets",
                 json={
                     "public": knowledge_asset,
-                    "options": {
-                        "epochsNum": 5,
-                        "maxNumberOfRetries": 3,
-                        "frequency": 1
-                    }
+                    "options": self.publish_options
                 },
                 headers={"Content-Type": "application/json"}
             )
@@ -67,10 +107,58 @@ class RealDKGAgent:
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    def publish_collection_to_dkg(self, knowledge_assets):
+        """Publish many assets as one Knowledge Collection, returning a UAL per event"""
+        try:
+            response = self.http.post(
+                f"{self.dkg_node_url}/assets",
+                json={
+                    "public": {
+                        "@context": ["https://schema.org/", "https://www.w3.org/ns/dkg#"],
+                        "@graph": knowledge_assets
+                    },
+                    "options": self.publish_options
+                },
+                headers={"Content-Type": "application/json"}
+            )
+            
+            if response.status_code == 200:
+                result = response.json()
+                collection_ual = result["UAL"]
+                
+                # Assets in a collection are addressed as <collection UAL>/<position>
+                uals = result.get("UALs") or [
+                    f"{collection_ual}/{i + 1}" for i in range(len(knowledge_assets))
+                ]
+                return {
+                    "success": True,
+                    "ual": collection_ual,
+                    "tokenId": result["publicAssertionId"],
+                    "uals": {
+                        asset["eventId"]: ual
+                        for asset, ual in zip(knowledge_assets, uals)
+                    }
+                }
+            else:
+                return {"success": False, "error": f"DKG error: {response.text}"}
+                
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+    
+    def anchor_to_blockchain(self, ual, tx_hash):
+        """Link a published UAL to the payment transaction that paid for it"""
+        anchor_hash = hashlib.sha256(f"{ual}:{tx_hash}".encode()).hexdigest()
+        return {
+            "ual": ual,
+            "tx_hash": tx_hash,
+            "anchor_hash": anchor_hash,
+            "anchored_at": datetime.now().isoformat()
+        }
+    
     def get_asset(self, ual):
         """Retrieve Knowledge Asset by UAL"""
         try:
-            response = requests.get(f"{self.dkg_node_url}/assets/{ual}")
+            response = self.http.get(f"{self.dkg_node_url}/assets/{ual}")
             return response.json() if response.status_code == 200 else None
         except:
             return None
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Response Cache - LRU + TTL cache for paid query responses
+Entries are grouped by pump so new data for one pump drops only its entries
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def make_etag(body):
+    """Strong ETag (unquoted) from the serialized response
+
+    Hashing the bytes, not a version counter, keeps the tag the same across
+    worker processes and restarts for as long as the body is the same.
+    """
+    return hashlib.sha1(body).hexdigest()[:20]
+
+
+class ResponseCache:
+    def __init__(self, capacity=2048, ttl=60):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # key -> (expires_at, etag, body); key[0] is the pump id
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """(etag, body) for a fresh entry, or None"""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], entry[2]
+            if entry:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, etag, body):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, etag, body)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def record_not_modified(self):
+        with self.lock:
+            self.not_modified += 1
+
+    def invalidate(self, pump_ids):
+        """Drop every cached response for these pumps; returns how many went"""
+        pump_ids = set(pump_ids)
+        with self.lock:
+            stale = [key for key in self.entries if key[0] in pump_ids]
+            for key in stale:
+                del self.entries[key]
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def metrics(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "not_modified": self.not_modified,
+                "invalidations": self.invalidations
+            }
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+MajiSafe Serve - Runs a bridge under gunicorn instead of the Flask dev server
+Worker processes x threads per bridge; SIGTERM drains in-flight SMS before exit
+"""
+
+import argparse
+import importlib
+import os
+import signal
+import sys
+
+# module -> (default port, most worker processes it can run with)
+# majisafe_ai keeps pending payments and SSE clients in memory, and the DKG
+# bridge also owns the publish queue and open telemetry chunks, so those two
+# scale with threads in one process. The others keep all state in SQLite
+# (x402_water's analytics and cache are per-process copies of it).
+BRIDGES = {
+    'main': (5000, None),
+    'simple_sms_ai': (5000, None),
+    'majisafe_ai': (5001, 1),
+    'majisafe_dkg_bridge': (5002, 1),
+    'x402_water': (5003, None),
+}
+
+
+def parse_args(module=None, argv=None):
+    parser = argparse.ArgumentParser(description="Run a MajiSafe bridge")
+    if module is None:
+        parser.add_argument('module', choices=sorted(BRIDGES))
+    parser.add_argument('--host', default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_WORKERS', 0)),
+                        help="worker processes (default: one per CPU, capped per bridge)")
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('WEB_THREADS', 32)),
+                        help="threads per worker; each open SSE stream holds one, so at most "
+                             "threads - --reserved-threads streams stay open (SSE_MAX_CLIENTS)")
+    parser.add_argument('--reserved-threads', type=int, default=int(os.environ.get('RESERVED_THREADS', 8)),
+                        help="threads per worker SSE streams may not take, kept for /process-sms")
+    parser.add_argument('--graceful-timeout', type=int, default=int(os.environ.get('GRACEFUL_TIMEOUT', 30)),
+                        help="seconds in-flight requests get to finish on shutdown")
+    parser.add_argument('--dev', action='store_true', help="Flask dev server (single process)")
+    parser.add_argument('--debug', action='store_true', help="with --dev: debugger and reloader")
+    args = parser.parse_args(argv)
+    if module is not None:
+        args.module = module
+    return args
+
+
+def worker_count(module, requested):
+    """Requested workers, or one per CPU, within the bridge's limit"""
+    limit = BRIDGES[module][1]
+    workers = requested or os.cpu_count() or 1
+    if limit and workers > limit:
+        if requested:
+            print(f"⚠️ {module} keeps per-process state; running {limit} worker(s), not {workers}")
+        workers = limit
+    return workers
+
+
+def run_dev(module, host, port, debug=False):
+    bridge = importlib.import_module(module)
+    # Turn SIGTERM into SystemExit so shutdown() still flushes
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        bridge.create_app().run(host=host, port=port, debug=debug, threaded=True)
+    finally:
+        bridge.shutdown()
+
+
+def run_gunicorn(module, host, port, workers, threads, graceful_timeout):
+    from gunicorn.app.base import BaseApplication
+
+    def post_worker_init(worker):
+        # Open SSE streams never finish by themselves; end them as soon as
+        # SIGTERM arrives so the graceful timeout only waits for real requests
+        stop = worker.handle_exit
+
+        def handle_exit(sig, frame):
+            from event_stream import close_all
+            close_all()
+            stop(sig, frame)
+
+        signal.signal(signal.SIGTERM, handle_exit)
+
+    def worker_exit(server, worker):
+        # Requests in flight have finished; flush what they queued
+        importlib.import_module(module).shutdown()
+
+    class BridgeApplication(BaseApplication):
+        def load_config(self):
+            for key, value in {
+                'bind': f"{host}:{port}",
+                'workers': workers,
+                'threads': threads,
+                'worker_class': 'gthread',
+                'graceful_timeout': graceful_timeout,
+                'timeout': max(60, graceful_timeout),
+                'keepalive': 5,
+                'proc_name': f"majisafe-{module}",
+                'post_worker_init': post_worker_init,
+                'worker_exit': worker_exit,
+            }.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # Runs in each worker, so every process builds its own clients and threads
+            return importlib.import_module(module).create_app()
+
+    print(f"🚀 {module} on {host}:{port}: {workers} worker(s) x {threads} threads")
+    BridgeApplication().run()
+
+
+def main(module=None, argv=None):
+    """Entry point for `python serve.py <bridge>` and each bridge's __main__"""
+    args = parse_args(module, argv)
+    port = args.port or BRIDGES[args.module][0]
+
+    if args.dev:
+        run_dev(args.module, args.host, port, args.debug)
+    else:
+        # Streams past the limit get the current state and reconnect later
+        os.environ.setdefault('SSE_MAX_CLIENTS', str(max(args.threads - args.reserved_threads, 1)))
+        run_gunicorn(args.module, args.host, port, worker_count(args.module, args.workers),
+                     args.threads, args.graceful_timeout)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
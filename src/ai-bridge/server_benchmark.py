@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Server Benchmark - /process-sms requests/s: Flask dev server vs serve.py (gunicorn)
+python server_benchmark.py [bridge] [seconds] [clients]; each run gets a fresh temp dir
+"""
+
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from multiprocessing import Pool
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(bridge, port, flags, workdir, env=None):
+    """env: extra variables for the bridge, e.g. stub URLs"""
+    env = {**os.environ, **(env or {}), 'PYTHONPATH': HERE + os.pathsep + os.environ.get('PYTHONPATH', '')}
+    # Own process group: the debug reloader forks a child that must go too
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, 'serve.py'), bridge,
+         '--host', '127.0.0.1', '--port', str(port), *flags],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/status", timeout=1).ok:
+                return process
+        except requests.RequestException:
+            time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError(f"{bridge} {' '.join(flags)} did not start")
+
+
+def stop_server(process, timeout=30):
+    """SIGTERM the group and time the drain; returns (seconds, exit code)"""
+    start = time.perf_counter()
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        code = process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        code = process.wait()
+    return time.perf_counter() - start, code
+
+
+def client(args):
+    """One load process: threads posting distinct payment SMS until the deadline"""
+    url, threads, deadline = args
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def loop(n):
+        session = requests.Session()
+        mine, failed = [], 0
+        while time.time() < deadline:
+            sms = {
+                'phone': f"+25078{n:07d}",
+                'message': 'PAY 5000 BIF PUMP001',
+                'message_id': uuid.uuid4().hex
+            }
+            start = time.perf_counter()
+            try:
+                response = session.post(url, json=sms, timeout=10)
+                if response.status_code >= 500:
+                    failed += 1
+                    continue
+            except requests.RequestException:
+                failed += 1
+                continue
+            mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    offset = os.getpid() % 1000 * 1000
+    workers = [threading.Thread(target=loop, args=(offset + i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies, errors[0]
+
+
+def load(url, seconds, clients, processes):
+    deadline = time.time() + seconds
+    per_process = max(1, clients // processes)
+    with Pool(processes) as pool:
+        results = pool.map(client, [(url, per_process, deadline)] * processes)
+    latencies = sorted(l for result in results for l in result[0])
+    errors = sum(result[1] for result in results)
+    return latencies, errors
+
+
+def benchmark(bridge='simple_sms_ai', seconds=10, clients=32):
+    processes = min(4, os.cpu_count() or 1)
+    setups = [
+        ("dev server, debug=True", ['--dev', '--debug']),
+        ("dev server", ['--dev']),
+        ("gunicorn 1 x 32", ['--workers', '1', '--threads', '32']),
+        (f"gunicorn {os.cpu_count()} x 8", ['--workers', str(os.cpu_count()), '--threads', '8']),
+    ]
+    print(f"🧪 POST /process-sms on {bridge}: {clients} clients, {seconds}s per setup")
+
+    baseline = None
+    for name, flags in setups:
+        with tempfile.TemporaryDirectory() as workdir:
+            port = free_port()
+            server = start_server(bridge, port, flags, workdir)
+            latencies, errors = load(f"http://127.0.0.1:{port}/process-sms", seconds, clients, processes)
+            drain, code = stop_server(server)
+
+        rate = len(latencies) / seconds
+        baseline = baseline or rate
+        p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+        print(f"  {name:24} {rate:8.1f} req/s ({rate / baseline:4.1f}x)  "
+              f"p50 {p50:6.1f} ms  p99 {p99:7.1f} ms  errors {errors}  "
+              f"stop {drain:.1f}s (exit {code})")
+
+
+if __name__ == "__main__":
+    bridge = sys.argv[1] if len(sys.argv) > 1 else 'simple_sms_ai'
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    clients = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+    benchmark(bridge, seconds, clients)
@@ -1,51 +1,26 @@
 #!/usr/bin/env python3
 """
 Simple Demo Mode - No Blockchain Required
-Perfect for demo video - shows the flow without network issues
+Perfect for demo video - each payment confirms itself after a countdown on the timer thread
 """
 
-import time
-import webbrowser
+from payment_confirmation import SUCCESS
+from simple_trigger import SimpleTrigger
 
-class SimpleDemo:
-    def __init__(self):
-        pass
-        
-    def wait_for_metamask_and_confirm(self, phone, message):
-        """Simple demo flow"""
-        try:
-            print(f"🎬 DEMO MODE: Processing SMS payment: {message}")
-            print("👤 Opening browser for you...")
-            
-            # Open browser automatically
-            webbrowser.open("http://localhost:8000")
-            
-            print("🎯 Please click 'Buy Water' in the browser")
-            print("⏳ Waiting 15 seconds for demo...")
-            
-            # Wait 15 seconds for demo
-            for i in range(15):
-                print(f"⏳ Demo countdown: {15-i}s")
-                time.sleep(1)
-            
-            print("✅ Demo payment confirmed!")
-            print("🚰 Activating pump for demo!")
-            
-            return {
-                'status': 'success',
-                'message': 'activate',
-                'tx_hash': 'demo_transaction_success',
-                'pump_id': 'PUMP001'
-            }
-            
-        except Exception as e:
-            print(f"Demo error: {e}")
-            return {
-                'status': 'success',
-                'message': 'activate',
-                'tx_hash': 'demo_fallback',
-                'pump_id': 'PUMP001'
-            }
-    
-    def close(self):
-        pass
+
+class SimpleDemo(SimpleTrigger):
+    source = 'demo'
+
+    def __init__(self, timeout=600, delay=15, web_ui_url="http://localhost:8000"):
+        """delay: seconds before a payment confirms itself, unless the web UI is faster"""
+        super().__init__(timeout, web_ui_url)
+        self.delay = delay
+
+    def started(self, request):
+        print(f"🎬 DEMO MODE: Processing SMS payment for {request['pump_id']}")
+        super().started(request)
+        print(f"🎯 Demo confirms in {self.delay:g}s")
+
+        request_id = request['request_id']
+        self.schedule(self.delay, lambda: self._resolve(
+            request_id, SUCCESS, tx_hash=f"demo_{request_id}"))
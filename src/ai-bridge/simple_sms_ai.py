@@ -4,36 +4,46 @@ Simple SMS AI Bridge for ESP32
 Receives SMS from ESP32, makes Web3 payment, sends back activation command
 """
 
-from flask import Flask, request, jsonify
-from web3 import Web3
-import sqlite3
-import re
+import os
 
-app = Flask(__name__)
+from flask import Blueprint, Flask, request, jsonify
+
+from lazy import lazy_property, web3_client
+from storage import SQLiteStore
+from exchange_rates import get_rate_provider
+from sms_parser import parse_payment
+from sms_dedup import SMSDeduplicator
+from metrics import SMS_TOTAL, instrument, stage_timer
+
+bp = Blueprint('simple_sms_ai', __name__)
+
+stage = stage_timer('simple_sms_ai')
+
+def outcome(name):
+    SMS_TOTAL.inc(bridge='simple_sms_ai', outcome=name)
 
 class SimpleSMSAI:
     def __init__(self):
-        # Web3 setup
-        self.w3 = Web3(Web3.HTTPProvider('https://sepolia.base.org'))
+        # Web3 setup (client built on first use)
         self.contract_address = '0x4933781A5DDC86bdF9c9C9795647e763E0429E28'
         
         # Your MetaMask private key for automatic payments
         self.private_key = "YOUR_PRIVATE_KEY_HERE"  # Replace with your key
         
-        # Currency rates (local currency to ETH)
-        self.rates = {
-            'BIF': 0.000000347,  # Burundi Francs
-            'USD': 0.0004,
-            'RWF': 0.000000312   # Rwanda Francs
-        }
+        # Currency rates (local currency to ETH), refreshed in the background
+        self.rates = get_rate_provider()
         
         self.init_db()
         print("🤖 Simple SMS AI Bridge Ready")
         print("📱 Waiting for SMS from ESP32...")
     
+    @lazy_property
+    def w3(self):
+        return web3_client(os.environ.get('RPC_URL', 'https://sepolia.base.org'))
+    
     def init_db(self):
-        self.conn = sqlite3.connect('sms_payments.db', check_same_thread=False)
-        self.conn.execute('''
+        self.db = SQLiteStore('sms_payments.db')
+        self.db.execute('''
             CREATE TABLE IF NOT EXISTS payments (
                 id INTEGER PRIMARY KEY,
                 phone TEXT,
@@ -47,28 +57,22 @@ class SimpleSMSAI:
                 timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
             )
         ''')
-        self.conn.commit()
+        
+        # ESP32 retries must not pay twice
+        self.dedup = SMSDeduplicator(self.db)
     
     def parse_sms(self, message):
         """Parse: PAY 5000 BIF PUMP001"""
-        try:
-            parts = message.upper().strip().split()
-            if len(parts) != 4 or parts[0] != 'PAY':
-                return None
-            
-            amount = float(parts[1])
-            currency = parts[2]
-            pump_id = parts[3]
-            eth_amount = amount * self.rates.get(currency, 0)
-            
-            return {
-                'amount': amount,
-                'currency': currency,
-                'pump_id': pump_id,
-                'eth_amount': eth_amount
-            }
-        except:
+        command = parse_payment(message)
+        if not command:
             return None
+        
+        return {
+            'amount': command.amount,
+            'currency': command.currency,
+            'pump_id': command.pump_id,
+            'eth_amount': self.rates.to_eth(command.amount, command.currency)
+        }
     
     def make_web3_payment(self, payment_data):
         """Make automatic Web3 payment"""
@@ -85,12 +89,26 @@ class SimpleSMSAI:
             print(f"❌ Payment error: {e}")
             return None
 
-# Global AI instance
-sms_ai = SimpleSMSAI()
+# Global AI instance, built by create_app() in each worker process
+sms_ai = None
 
-@app.route('/process-sms', methods=['POST'])
+def create_app():
+    global sms_ai
+    if sms_ai is None:
+        sms_ai = SimpleSMSAI()
+    app = Flask(__name__)
+    app.register_blueprint(bp)
+    return instrument(app, 'simple_sms_ai')
+
+def shutdown():
+    """Commit queued payment rows before the process exits"""
+    if sms_ai:
+        sms_ai.db.close()
+
+@bp.route('/process-sms', methods=['POST'])
 def process_sms():
     """Receive SMS from ESP32"""
+    dedup_key = None
     try:
         data = request.json
         phone = data.get('phone', '')
@@ -99,44 +117,68 @@ def process_sms():
         print(f"\n📱 SMS from {phone}: {message}")
         
         # Parse payment
-        payment_data = sms_ai.parse_sms(message)
+        with stage('parse'):
+            payment_data = sms_ai.parse_sms(message)
         if not payment_data:
+            outcome('invalid_format')
             return jsonify({'status': 'error', 'message': 'Invalid SMS format'})
         
+        with stage('dedup'):
+            dedup_key, duplicate = sms_ai.dedup.claim(phone, message, data.get('message_id') or data.get('sent_at'))
+        if duplicate:
+            outcome('duplicate')
+            print(f"🔁 Duplicate SMS from {phone} - answered from cache")
+            return jsonify(duplicate)
+        
         print(f"💰 Payment: {payment_data['amount']} {payment_data['currency']} = {payment_data['eth_amount']} ETH")
         
         # Check minimum payment
-        if payment_data['eth_amount'] < 0.001:
-            return jsonify({'status': 'error', 'message': 'Payment too small'})
+        with stage('validate'):
+            is_valid, reason = sms_ai.rates.validate(payment_data['amount'], payment_data['currency'])
+        if not is_valid:
+            outcome('rejected')
+            response = {'status': 'error', 'message': reason}
+            sms_ai.dedup.complete(dedup_key, response)
+            return jsonify(response)
         
         # Make Web3 payment
-        tx_hash = sms_ai.make_web3_payment(payment_data)
+        with stage('chain'):
+            tx_hash = sms_ai.make_web3_payment(payment_data)
         if not tx_hash:
+            outcome('chain_failed')
+            sms_ai.dedup.release(dedup_key)
             return jsonify({'status': 'error', 'message': 'Payment failed'})
         
         # Log payment
-        sms_ai.conn.execute('''
-            INSERT INTO payments (phone, message, amount, currency, pump_id, eth_amount, tx_hash, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (phone, message, payment_data['amount'], payment_data['currency'],
-              payment_data['pump_id'], payment_data['eth_amount'], tx_hash, 'completed'))
-        sms_ai.conn.commit()
+        with stage('log'):
+            sms_ai.db.insert('''
+                INSERT INTO payments (phone, message, amount, currency, pump_id, eth_amount, tx_hash, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (phone, message, payment_data['amount'], payment_data['currency'],
+                  payment_data['pump_id'], payment_data['eth_amount'], tx_hash, 'completed'))
         
         print(f"✅ Payment successful: {tx_hash}")
         print(f"🚰 Activating pump: {payment_data['pump_id']}")
         
-        return jsonify({
+        response = {
             'status': 'success',
             'message': 'activate',  # This tells ESP32 to activate pump
             'tx_hash': tx_hash,
             'pump_id': payment_data['pump_id']
-        })
+        }
+        sms_ai.dedup.complete(dedup_key, response)
+        outcome('accepted')
+        return jsonify(response)
         
     except Exception as e:
+        outcome('error')
         print(f"❌ Error: {e}")
+        # Let the gateway's retry through instead of answering it as a duplicate
+        if dedup_key:
+            sms_ai.dedup.release(dedup_key)
         return jsonify({'status': 'error', 'message': str(e)})
 
-@app.route('/status', methods=['GET'])
+@bp.route('/status', methods=['GET'])
 def status():
     return jsonify({'status': 'online', 'service': 'Simple SMS AI Bridge'})
 
@@ -146,4 +188,5 @@ if __name__ == "__main__":
     print("💰 AI will make Web3 payments automatically")
     print("🚰 Pump activation commands sent back to ESP32")
     
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    from serve import main
+    main('simple_sms_ai')
@@ -1,56 +1,30 @@
 #!/usr/bin/env python3
 """
 Simple SMS Trigger - Uses Existing Working MetaMask Code
-Just opens browser and lets user use the working web UI
+Opens the web UI and waits for its /blockchain-confirmed callback, without blocking
 """
 
 import webbrowser
-import time
 
-class SimpleTrigger:
-    def __init__(self):
-        pass
-        
-    def wait_for_metamask_and_confirm(self, phone, message):
-        """Simple approach - open browser and wait"""
-        try:
-            print(f"📱 SMS Payment received: {message}")
+from payment_confirmation import PaymentConfirmer
+
+
+class SimpleTrigger(PaymentConfirmer):
+    source = 'web_ui'
+
+    def __init__(self, timeout=600, web_ui_url="http://localhost:8000"):
+        super().__init__(timeout)
+        self.web_ui_url = web_ui_url
+
+    def started(self, request):
+        print(f"📱 SMS Payment received: {request.get('message') or request['pump_id']}")
+        # One tab serves every queued customer; don't open another per SMS
+        if self.pending_count() == 1:
             print("🌐 Opening MajiSafe web interface...")
-            
-            # Open the working web UI
-            webbrowser.open("http://localhost:8000")
-            
-            print("👤 Please:")
-            print("   1. Connect MetaMask (if not connected)")
-            print("   2. Click 'PURCHASE WATER' button")
-            print("   3. Confirm transaction in MetaMask")
-            
-            print("⏳ Waiting 30 seconds for transaction...")
-            
-            # Wait 30 seconds for user to complete transaction
-            for i in range(30):
-                remaining = 30 - i
-                print(f"⏳ {remaining}s remaining...")
-                time.sleep(1)
-            
-            print("✅ Assuming transaction completed!")
-            print("🚰 Activating pump!")
-            
-            return {
-                'status': 'success',
-                'message': 'activate',
-                'tx_hash': 'web_ui_transaction',
-                'pump_id': 'PUMP001'
-            }
-            
-        except Exception as e:
-            print(f"Error: {e}")
-            return {
-                'status': 'success',  # Always succeed for demo
-                'message': 'activate',
-                'tx_hash': 'fallback_success',
-                'pump_id': 'PUMP001'
-            }
-    
-    def close(self):
-        pass
+            webbrowser.open(self.web_ui_url)
+
+        print("👤 Please:")
+        print("   1. Connect MetaMask (if not connected)")
+        print("   2. Click 'PURCHASE WATER' button")
+        print("   3. Confirm transaction in MetaMask")
+        print(f"⏳ Waiting up to {int(request['expires_at'] - request['opened_at'])}s for the web UI to confirm...")
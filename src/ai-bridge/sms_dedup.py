@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+SMS Dedup - Idempotent SMS ingestion for gateway retries and repeated polls
+Bounded in-memory LRU in front of a unique index in SQLite
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Returned to a retry that arrives while the first copy is still being processed
+IN_PROGRESS = {
+    'status': 'processing',
+    'message': 'Payment already received - processing',
+    'duplicate': True
+}
+
+
+def dedup_key(phone, message, gateway_id=None):
+    """Stable key for one SMS: phone, normalized text and the gateway's id/timestamp"""
+    text = ' '.join((message or '').upper().split())
+    raw = f"{phone}|{text}|{gateway_id or ''}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+class SMSDeduplicator:
+    def __init__(self, store, capacity=10000, window=120, retention=86400):
+        """
+        store: SQLiteStore holding the sms_dedup table
+        window: seconds an SMS without a gateway id/timestamp counts as a retry;
+                after that the same text from the same phone is a new purchase
+        retention: seconds an SMS with a gateway id/timestamp is remembered
+        """
+        self.store = store
+        self.capacity = capacity
+        self.window = window
+        self.retention = retention
+
+        self.lock = threading.Lock()
+        # key -> (expires_at, response or None while in progress)
+        self.recent = OrderedDict()
+
+        # Duplicate counters, split by where they were answered from
+        self.cache_hits = 0
+        self.db_hits = 0
+
+        self.store.execute('''
+            CREATE TABLE IF NOT EXISTS sms_dedup (
+                dedup_key TEXT NOT NULL,
+                response TEXT,
+                expires_at REAL NOT NULL
+            )
+        ''')
+        self.store.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_sms_dedup_key ON sms_dedup (dedup_key)')
+        self.store.execute('CREATE INDEX IF NOT EXISTS idx_sms_dedup_expires ON sms_dedup (expires_at)')
+        self.purge_expired()
+
+    def claim(self, phone, message, gateway_id=None):
+        """Claim an incoming SMS for processing
+
+        Returns (key, None) when this caller owns the SMS and must process it,
+        or (key, response) for a duplicate: the first copy's stored response,
+        or IN_PROGRESS if that copy has not finished yet.
+        """
+        key = dedup_key(phone, message, gateway_id)
+        now = time.time()
+
+        with self.lock:
+            entry = self.recent.get(key)
+            if entry and entry[0] > now:
+                self.recent.move_to_end(key)
+                self.cache_hits += 1
+                return key, entry[1] or IN_PROGRESS
+
+        expires_at = now + (self.retention if gateway_id else self.window)
+
+        # The unique index decides the race between bridges/workers sharing the db
+        cursor = self.store.execute('''
+            INSERT INTO sms_dedup (dedup_key, response, expires_at) VALUES (?, NULL, ?)
+            ON CONFLICT (dedup_key) DO UPDATE SET response = NULL, expires_at = excluded.expires_at
+            WHERE sms_dedup.expires_at <= ?
+        ''', (key, expires_at, now))
+
+        if cursor.rowcount:
+            with self.lock:
+                self._remember(key, expires_at, None)
+            return key, None
+
+        rows = self.store.query('SELECT response, expires_at FROM sms_dedup WHERE dedup_key = ?', (key,))
+        response, expires_at = rows[0] if rows else (None, expires_at)
+        response = json.loads(response) if response else None
+        with self.lock:
+            if response:
+                self._remember(key, expires_at, response)
+            self.db_hits += 1
+        return key, response or IN_PROGRESS
+
+    def complete(self, key, response):
+        """Store the response that retries of this SMS should get"""
+        response = {**response, 'duplicate': True}
+        with self.lock:
+            entry = self.recent.get(key)
+            expires_at = entry[0] if entry else time.time() + self.window
+            self._remember(key, expires_at, response)
+
+        self.store.insert('UPDATE sms_dedup SET response = ? WHERE dedup_key = ?',
+                          (json.dumps(response, default=str), key))
+
+    def release(self, key):
+        """Processing failed before any side effect; let the next retry run again"""
+        with self.lock:
+            self.recent.pop(key, None)
+        # Not queued: a retry arriving right away must find the claim gone
+        self.store.execute('DELETE FROM sms_dedup WHERE dedup_key = ?', (key,))
+
+    def purge_expired(self):
+        """Drop expired keys from SQLite; returns the number of rows removed"""
+        return self.store.execute('DELETE FROM sms_dedup WHERE expires_at <= ?', (time.time(),)).rowcount
+
+    def stats(self):
+        return {
+            'cached_keys': len(self.recent),
+            'cache_hits': self.cache_hits,
+            'db_hits': self.db_hits
+        }
+
+    def _remember(self, key, expires_at, response):
+        """Insert into the LRU, evicting the oldest keys (caller holds the lock)"""
+        self.recent[key] = (expires_at, response)
+        self.recent.move_to_end(key)
+        while len(self.recent) > self.capacity:
+            self.recent.popitem(last=False)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+SMS Ingest - Asyncio polling of several SMS providers / SIM gateways at once
+Per-source cursors and adaptive intervals, bounded-concurrency processing
+"""
+
+import asyncio
+import time
+
+from http_client import get_http_client
+
+
+class SMSSource:
+    """One provider or SIM gateway; fetch() returns new messages since the cursor"""
+
+    def __init__(self, name, min_interval=None):
+        """min_interval: fastest this source may be polled (None: service default)"""
+        self.name = name
+        self.min_interval = min_interval
+        self.cursor = None
+
+    def fetch(self):
+        """Blocking fetch, run on a worker thread; returns a list of SMS dicts"""
+        raise NotImplementedError
+
+
+class HTTPSMSSource(SMSSource):
+    def __init__(self, name, url, params=None, auth=None, cursor_param='since',
+                 cursor_field='sid', newest_first=False):
+        """
+        cursor_param: query parameter carrying the last seen cursor value
+        cursor_field: message field the cursor is taken from
+        newest_first: the provider lists the newest message first
+        """
+        super().__init__(name)
+        self.url = url
+        self.params = params or {}
+        self.auth = auth
+        self.cursor_param = cursor_param
+        self.cursor_field = cursor_field
+        self.newest_first = newest_first
+        self.http = get_http_client()
+
+    def fetch(self):
+        params = dict(self.params)
+        if self.cursor is not None:
+            params[self.cursor_param] = self.cursor
+
+        response = self.http.get(self.url, params=params, auth=self.auth)
+        response.raise_for_status()
+        messages = [
+            {
+                'from': m['from'],
+                'body': m['body'],
+                'date_sent': m.get('date_sent'),
+                'sid': m.get('sid') or m.get('id'),
+                'source': self.name
+            }
+            for m in response.json().get('messages', [])
+        ]
+
+        if messages:
+            newest = messages[0] if self.newest_first else messages[-1]
+            self.cursor = newest.get(self.cursor_field) or self.cursor
+        return messages
+
+
+class TwilioSource(HTTPSMSSource):
+    def __init__(self, account_sid, auth_token, phone_number):
+        super().__init__(
+            f"twilio:{phone_number}",
+            f"https://api.twilio.com/2010-04-01/Accounts/{account_sid}/Messages.json",
+            params={"To": phone_number},
+            auth=(account_sid, auth_token),
+            # Twilio filters by send date and lists newest first; dedup absorbs the overlap
+            cursor_param='DateSent>',
+            cursor_field='date_sent',
+            newest_first=True
+        )
+
+
+class CallableSource(SMSSource):
+    """Wraps a plain function returning a list of messages (demo / legacy pollers)"""
+
+    def __init__(self, name, func, min_interval=None):
+        super().__init__(name, min_interval)
+        self.func = func
+
+    def fetch(self):
+        return self.func()
+
+
+class SMSIngestService:
+    def __init__(self, sources, handler, concurrency=8, min_interval=1.0,
+                 max_interval=30.0, idle_backoff=1.5, queue_size=1000):
+        """
+        handler: called with each SMS dict; plain functions run on worker threads
+        concurrency: messages processed at the same time across all sources
+        min_interval / max_interval: bounds of each source's adaptive poll interval
+        idle_backoff: interval multiplier after an empty poll (errors double it)
+        """
+        self.sources = list(sources)
+        self.handler = handler
+        self.concurrency = concurrency
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.idle_backoff = idle_backoff
+        self.queue_size = queue_size
+
+        self.queue = None
+        self.stopping = None
+
+        # Per-source counters for status output
+        self.source_stats = {
+            source.name: {'polls': 0, 'messages': 0, 'errors': 0, 'interval': min_interval, 'last_poll': None}
+            for source in self.sources
+        }
+        self.processed = 0
+        self.failed = 0
+
+    async def run(self):
+        """Poll every source and process messages until stop() is called"""
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.stopping = asyncio.Event()
+
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        pollers = [asyncio.create_task(self._poll(source)) for source in self.sources]
+
+        await self.stopping.wait()
+        for task in pollers:
+            task.cancel()
+        await asyncio.gather(*pollers, return_exceptions=True)
+
+        # Let queued messages finish before the workers go
+        await self.queue.join()
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    def stop(self):
+        if self.stopping is not None:
+            self.stopping.set()
+
+    def stats(self):
+        return {
+            'sources': self.source_stats,
+            'queued': self.queue.qsize() if self.queue else 0,
+            'processed': self.processed,
+            'failed': self.failed
+        }
+
+    async def _poll(self, source):
+        stats = self.source_stats[source.name]
+        floor = source.min_interval or self.min_interval
+        interval = floor
+
+        while True:
+            try:
+                messages = await asyncio.to_thread(source.fetch)
+            except Exception as e:
+                print(f"❌ SMS source {source.name} error: {e}")
+                stats['errors'] += 1
+                interval = min(interval * 2, max(self.max_interval, floor))
+            else:
+                stats['polls'] += 1
+                stats['messages'] += len(messages)
+                for sms in messages:
+                    await self.queue.put(sms)
+
+                # Busy sources are polled fast; quiet ones drift toward max_interval
+                if messages:
+                    interval = floor
+                else:
+                    interval = min(interval * self.idle_backoff, max(self.max_interval, floor))
+
+            stats['interval'] = round(interval, 2)
+            stats['last_poll'] = time.time()
+            await asyncio.sleep(interval)
+
+    async def _worker(self):
+        while True:
+            sms = await self.queue.get()
+            try:
+                if asyncio.iscoroutinefunction(self.handler):
+                    await self.handler(sms)
+                else:
+                    await asyncio.to_thread(self.handler, sms)
+                self.processed += 1
+            except Exception as e:
+                print(f"❌ SMS processing error: {e}")
+                self.failed += 1
+            finally:
+                self.queue.task_done()
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+SMS Load Test - A fleet of ESP32 SMS gateways posting bursty PAY traffic to a bridge
+python sms_load_test.py --bridge simple_sms_ai --gateways 50 --duration 60 [--json run.json]
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+from serve import BRIDGES
+from server_benchmark import free_port, start_server, stop_server
+from sms_parser import parse_payment
+from stub_chain_rpc import StubChainRPC
+from stub_dkg_node import StubDKGNode
+from stub_esp32 import StubESP32
+
+# Where each bridge takes gateway SMS, and the body it expects
+ENDPOINTS = {
+    'main': ('/sms-payment', 'payment'),
+    'simple_sms_ai': ('/process-sms', 'sms'),
+    'majisafe_ai': ('/process-sms', 'sms'),
+    'majisafe_dkg_bridge': ('/process-sms', 'structured'),
+}
+
+# Gateway sites: phone prefix, currency and the amounts people there send
+SITES = [
+    ('+2577', 'BIF', (3000, 5000, 5000, 10000, 20000)),
+    ('+25078', 'RWF', (4000, 5000, 10000, 20000)),
+    ('+25472', 'KES', (200, 500, 500, 1000)),
+    ('+2576', 'USD', (1, 2, 5)),
+]
+
+# What a SIM800L hands the gateway: clean, lower case, modem noise, punctuation
+PAY_TEMPLATES = [
+    "PAY {amount} {currency} {pump}",
+    "PAY {amount} {currency} {pump}",
+    "pay {amount} {currency} {pump}",
+    '+CMT: "{phone}","","{sent_at}"\r\nPAY {amount} {currency} {pump}\r\nOK',
+    '"PAY {amount} {currency} {pump_dashed}."',
+]
+MALFORMED_TEMPLATES = [
+    "PAY {amount}",
+    "PAY {currency} {pump}",
+    "PAY {amount} XYZ {pump}",
+    "P4Y {amount} {currency} {pump}",
+    "hello is the pump on",
+    "",
+]
+COMMAND_TEMPLATES = ["BAL", "STATUS {pump}", "HELP"]
+
+# Mean seconds a gateway spends quiet, then in a burst (market day, queue at the pump)
+QUIET_SECONDS = 60
+BURST_SECONDS = 15
+
+STAGE_SAMPLE = re.compile(r'^majisafe_sms_stage_seconds_(sum|count)\{bridge="([^"]*)",stage="([^"]*)"\} (\S+)$')
+
+
+def arrivals(rng, duration, rate, burst):
+    """Seconds at which one gateway receives SMS: Poisson at rate/minute, x burst in bursts"""
+    t, bursting = 0.0, False
+    switch = rng.expovariate(1 / QUIET_SECONDS)
+    while True:
+        t += rng.expovariate(rate / 60 * (burst if bursting else 1))
+        if t > switch:
+            # Memoryless: restart the draw from the regime change
+            t, bursting = switch, not bursting
+            switch = t + rng.expovariate(1 / (BURST_SECONDS if bursting else QUIET_SECONDS))
+            continue
+        if t >= duration:
+            return
+        yield t
+
+
+def gateway_plan(index, args, run_started):
+    """Everything one gateway will send, fixed by --seed before the run starts"""
+    rng = random.Random(args.seed * 100003 + index)
+    prefix, currency, amounts = SITES[index % len(SITES)]
+    # A gateway serves one village: a few pumps and a pool of regular phones
+    pumps = [(index + i) % args.pumps + 1 for i in range(2)]
+    phones = [f"{prefix}{rng.randint(10**6, 10**7 - 1)}" for _ in range(20)]
+
+    plan = []
+    for offset in arrivals(rng, args.duration, args.rate, args.burst):
+        phone = rng.choice(phones)
+        pump = rng.choice(pumps)
+        sent_at = datetime.fromtimestamp(run_started + offset).strftime('%y/%m/%d,%H:%M:%S+08')
+        roll = rng.random()
+        if roll < args.malformed:
+            kind, templates = 'malformed', MALFORMED_TEMPLATES
+        elif roll < args.malformed + args.commands:
+            kind, templates = 'command', COMMAND_TEMPLATES
+        else:
+            kind, templates = 'pay', PAY_TEMPLATES
+        message = rng.choice(templates).format(
+            amount=rng.choice(amounts), currency=currency, phone=phone, sent_at=sent_at,
+            pump=f"PUMP{pump:03d}", pump_dashed=f"PUMP-{pump:03d}")
+        plan.append({
+            'offset': offset,
+            'kind': kind,
+            'sms': {'phone': phone, 'message': message, 'sent_at': sent_at},
+            # The gateway missed the answer (e.g. a GPRS drop) and posts the SMS again
+            'redeliver': rng.random() < args.duplicates
+        })
+    return plan
+
+
+def request_body(sms, style, device_id):
+    if style == 'payment':
+        return {'phone': sms['phone'], 'payment': sms['message']}
+    if style == 'structured':
+        # majisafe_dkg_pump.ino parses on the device and posts the fields
+        body = {**sms, 'device_id': device_id, 'timestamp': int(time.time())}
+        command = parse_payment(sms['message'])
+        if command:
+            body.update(amount=command.amount, currency=command.currency, pump_id=command.pump_id)
+        return body
+    return sms
+
+
+class LoadStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # one per attempt: (kind, attempt number, result, seconds)
+        self.attempts = []
+        # final result per SMS and kind
+        self.outcomes = {}
+        self.lags = []
+
+    def attempt(self, kind, number, result, seconds):
+        with self.lock:
+            self.attempts.append((kind, number, result, seconds))
+
+    def finish(self, kind, result, lag):
+        with self.lock:
+            key = (kind, result)
+            self.outcomes[key] = self.outcomes.get(key, 0) + 1
+            self.lags.append(lag)
+
+
+def classify(response):
+    """accepted / rejected (the bridge answered with an error) / http_5xx / bad_response"""
+    if response.status_code >= 500:
+        return 'http_5xx'
+    try:
+        body = response.json()
+    except ValueError:
+        return 'bad_response'
+    if body.get('status') == 'success' or body.get('success') is True:
+        return 'accepted'
+    return 'rejected'
+
+
+class Gateway(threading.Thread):
+    def __init__(self, index, plan, args, url, style, stats, started):
+        super().__init__(name=f"gateway-{index}", daemon=True)
+        self.index = index
+        self.plan = plan
+        self.args = args
+        self.url = url
+        self.style = style
+        self.stats = stats
+        self.started = started
+        self.session = requests.Session()
+
+    def run(self):
+        # One modem, one HTTP request at a time: SMS that arrive meanwhile queue up
+        for entry in self.plan:
+            delay = self.started + entry['offset'] - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            lag = time.perf_counter() - self.started - entry['offset']
+            result = self.deliver(entry['kind'], entry['sms'])
+            self.stats.finish(entry['kind'], result, lag)
+            if entry['redeliver'] and result not in ('timeout', 'connection'):
+                self.deliver('redelivery', entry['sms'])
+
+    def deliver(self, kind, sms):
+        """POST with the firmware's retry loop; returns the last attempt's result"""
+        body = request_body(sms, self.style, f"ESP32_{self.index:03d}")
+        for attempt in range(self.args.retries + 1):
+            start = time.perf_counter()
+            try:
+                response = self.session.post(self.url, json=body, timeout=self.args.timeout)
+                result = classify(response)
+            except requests.Timeout:
+                result = 'timeout'
+            except requests.RequestException:
+                result = 'connection'
+            self.stats.attempt(kind, attempt, result, time.perf_counter() - start)
+            if result in ('accepted', 'rejected'):
+                return result
+            time.sleep(self.args.retry_delay * 2 ** attempt)
+        return result
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def summarize(stats, seconds, args):
+    latencies = sorted(s for _, _, result, s in stats.attempts if result not in ('timeout', 'connection'))
+    results = {}
+    for _, _, result, _ in stats.attempts:
+        results[result] = results.get(result, 0) + 1
+    sms = sum(stats.outcomes.values())
+    failed = sum(count for (_, result), count in stats.outcomes.items()
+                 if result not in ('accepted', 'rejected'))
+    outcomes = {}
+    for (kind, result), count in sorted(stats.outcomes.items()):
+        outcomes.setdefault(kind, {})[result] = count
+    lags = sorted(stats.lags)
+
+    return {
+        'config': {name: getattr(args, name) for name in (
+            'bridge', 'url', 'gateways', 'duration', 'rate', 'burst', 'malformed', 'commands',
+            'duplicates', 'retries', 'timeout', 'seed')},
+        'seconds': round(seconds, 2),
+        'sms': sms,
+        'requests': len(stats.attempts),
+        'retries': sum(1 for _, number, _, _ in stats.attempts if number),
+        'redeliveries': sum(1 for kind, number, _, _ in stats.attempts if kind == 'redelivery' and not number),
+        'throughput_rps': round(len(stats.attempts) / seconds, 1),
+        'latency_ms': {name: round(percentile(latencies, p) * 1000, 1)
+                       for name, p in (('p50', 50), ('p95', 95), ('p99', 99), ('max', 100))},
+        'queue_lag_ms': {name: round(percentile(lags, p) * 1000, 1) for name, p in (('p50', 50), ('p99', 99))},
+        'results': results,
+        'request_error_rate': round(sum(n for r, n in results.items() if r not in ('accepted', 'rejected'))
+                                    / max(1, len(stats.attempts)), 4),
+        'sms_error_rate': round(failed / max(1, sms), 4),
+        'outcomes': outcomes,
+    }
+
+
+def scrape_stages(base_url):
+    """Mean ms per pipeline stage from the bridge's /metrics"""
+    try:
+        text = requests.get(f"{base_url}/metrics", timeout=5).text
+    except requests.RequestException:
+        return {}
+    totals = {}
+    for line in text.splitlines():
+        match = STAGE_SAMPLE.match(line)
+        if match:
+            kind, _, stage, value = match.groups()
+            totals.setdefault(stage, {})[kind] = float(value)
+    return {stage: {'count': int(t['count']), 'mean_ms': round(t['sum'] / t['count'] * 1000, 3)}
+            for stage, t in totals.items() if t.get('count')}
+
+
+def print_report(summary, baseline=None):
+    def delta(path):
+        if not baseline:
+            return ''
+        old, new = baseline, summary
+        for key in path:
+            old, new = old.get(key, {}), new[key]
+        return f" ({(new - old) / old * 100:+.0f}%)" if isinstance(old, (int, float)) and old else ''
+
+    config = summary['config']
+    print(f"\n📊 {config['gateways']} gateways x {config['duration']}s, seed {config['seed']} "
+          f"-> {config['url'] or config['bridge']}")
+    print(f"  SMS {summary['sms']}  requests {summary['requests']} "
+          f"(retries {summary['retries']}, redeliveries {summary['redeliveries']})")
+    print(f"  Throughput {summary['throughput_rps']} req/s{delta(['throughput_rps'])}")
+    print("  Latency   " + "  ".join(f"{name} {value} ms{delta(['latency_ms', name])}"
+                                     for name, value in summary['latency_ms'].items()))
+    print("  Queue lag " + "  ".join(f"{name} {value} ms" for name, value in summary['queue_lag_ms'].items()))
+    print(f"  Errors    {summary['request_error_rate'] * 100:.2f}% of requests, "
+          f"{summary['sms_error_rate'] * 100:.2f}% of SMS  {summary['results']}")
+    for kind, results in summary['outcomes'].items():
+        print(f"  {kind:10} {results}")
+    for stage, values in summary.get('stages', {}).items():
+        print(f"  stage {stage:16} {values['mean_ms']:8.3f} ms mean  ({values['count']})")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test a bridge with simulated ESP32 SMS gateways")
+    parser.add_argument('--bridge', choices=sorted(BRIDGES), default='simple_sms_ai',
+                        help="started with serve.py in a temp dir, wired to local stubs")
+    parser.add_argument('--url', help="test a running bridge instead (base URL, no stubs); --bridge picks the endpoint")
+    parser.add_argument('--gateways', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=30, help="seconds of traffic")
+    parser.add_argument('--rate', type=float, default=6, help="SMS per minute per gateway when quiet")
+    parser.add_argument('--burst', type=float, default=8, help="rate multiplier during bursts")
+    parser.add_argument('--malformed', type=float, default=0.08, help="share of malformed SMS")
+    parser.add_argument('--commands', type=float, default=0.07, help="share of BAL/STATUS/HELP")
+    parser.add_argument('--duplicates', type=float, default=0.03, help="share of SMS posted twice")
+    parser.add_argument('--retries', type=int, default=2, help="re-posts after a timeout or 5xx")
+    parser.add_argument('--retry-delay', type=float, default=1.0, help="seconds before the first re-post")
+    parser.add_argument('--timeout', type=float, default=30, help="HTTP timeout (firmware: 30s)")
+    parser.add_argument('--pumps', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=0, help="serve.py worker processes")
+    parser.add_argument('--threads', type=int, default=32, help="serve.py threads per worker")
+    parser.add_argument('--dkg-latency', type=float, default=0.05)
+    parser.add_argument('--rpc-latency', type=float, default=0.02)
+    parser.add_argument('--pump-latency', type=float, default=0.01)
+    parser.add_argument('--json', help="write the summary here")
+    parser.add_argument('--compare', help="summary JSON of an earlier run to diff against")
+    return parser.parse_args(argv)
+
+
+def run(args):
+    """Drive the fleet; starts the bridge and stubs unless --url is given"""
+    path, style = ENDPOINTS[args.bridge]
+    started_at = time.time()
+    plans = [gateway_plan(i, args, started_at) for i in range(args.gateways)]
+    stats = LoadStats()
+
+    stubs, server, workdir = [], None, None
+    base_url = args.url.rstrip('/') if args.url else None
+    try:
+        if not base_url:
+            dkg = StubDKGNode(latency=args.dkg_latency).start()
+            chain = StubChainRPC(latency=args.rpc_latency).start()
+            pumps = [StubESP32(pump_id=f"PUMP{n:03d}", latency=args.pump_latency).start()
+                     for n in range(1, args.pumps + 1)]
+            stubs = [dkg, chain, *pumps]
+            env = {
+                'DKG_NODE_URL': dkg.url,
+                'RPC_URL': chain.url,
+                'X402_RPC_URL': chain.url,
+                'PUMP_DEVICES': ','.join(f"{pump.pump_id}={pump.url}" for pump in pumps),
+            }
+            workdir = tempfile.TemporaryDirectory()
+            port = free_port()
+            flags = ['--threads', str(args.threads)] + (['--workers', str(args.workers)] if args.workers else [])
+            server = start_server(args.bridge, port, flags, workdir.name, env)
+            base_url = f"http://127.0.0.1:{port}"
+
+        print(f"🧪 {args.gateways} gateways, {sum(len(p) for p in plans)} SMS over {args.duration}s "
+              f"-> {base_url}{path}")
+        start = time.perf_counter()
+        gateways = [Gateway(i, plan, args, base_url + path, style, stats, start)
+                    for i, plan in enumerate(plans)]
+        for gateway in gateways:
+            gateway.start()
+        for gateway in gateways:
+            gateway.join()
+        summary = summarize(stats, time.perf_counter() - start, args)
+        summary['stages'] = scrape_stages(base_url)
+    finally:
+        if server:
+            stop_server(server)
+        for stub in stubs:
+            stub.stop()
+        if workdir:
+            workdir.cleanup()
+    return summary
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    summary = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(summary, baseline)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f"💾 Summary written to {os.path.abspath(args.json)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+SMS Command Parser - One grammar for every bridge
+PAY <amount> <currency> <pump>, BAL, STATUS [pump], HELP - tolerant of SIM800L noise
+"""
+
+import re
+import sys
+from decimal import Decimal
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+HELP_TEXT = (
+    "MajiSafe commands:\n"
+    "PAY [amount] [currency] [pump] - e.g. PAY 5000 BIF PUMP001\n"
+    "STATUS [pump] - pending payment\n"
+    "BAL - total paid from this phone\n"
+    "HELP - this message"
+)
+
+# SIM800L frames an SMS as: +CMT: "+2577...","","24/05/01,10:15:00+08"\r\n<body>\r\nOK
+MODEM_LINE = re.compile(r'^\s*(?:\+CMT[I]?:.*|\+CMGR:.*|OK|AT.*)\s*$', re.IGNORECASE)
+
+# That framing around a plain "PAY 5000 BIF PUMP001", in one pass; anything
+# else is split into lines. Spelled-out case rather than IGNORECASE keeps it cheap.
+FRAMED_PAY = re.compile(r'''
+    [ \t]*\+[Cc][Mm][Tt][Ii]?:[\x20-\x7e]*\r\n
+    [Pp][Aa][Yy]\x20([0-9]+)\x20([A-Za-z]{3})\x20[Pp][Uu][Mm][Pp]([0-9]+)
+    (?:\r\n[Oo][Kk])?(?:\r\n)?
+''', re.VERBOSE)
+
+# Control characters and stray quoting the modem or phone keyboards add
+NOISE_CHARS = '\\x00-\\x1f\\x7f"\'`'
+NOISE = re.compile(f'[{NOISE_CHARS}]+')
+
+# Exactly what \s matches, spelled out: a set of plain ranges is a table lookup,
+# \s inside a set is a Unicode category test for every character
+WHITESPACE = ' \\t-\\r\\x1c-\\x1f\\x85\\xa0\\u1680\\u2000-\\u200a\\u2028\\u2029\\u202f\\u205f\\u3000'
+
+# No separator run, digit run or word below can give back characters and still
+# match, so on Python 3.11+ they are possessive and a near-miss fails without
+# backtracking. Older versions get the same grammar, greedy.
+ONCE = '+' if sys.version_info >= (3, 11) else ''
+
+# Noise is matched as a separator, so the message needs no substitution pass
+# first; a run of it counts as one space, as NOISE.sub() would give. PAY is
+# the command nearly every SMS carries, so it gets a pattern of its own.
+PAY_COMMAND = re.compile(r'''
+    [{ws}.,;:!*#\-{noise}]*{once}
+    PAY[{ws}:,\-{noise}]*{once}
+        (\d{{4,}}{once}|\d{{1,3}}(?:(?:[,{ws}]|[{noise}]+)\d{{3}})*(?!\d))  # amount
+        (?:[.](\d+{once}))?                                              # fraction
+        [{ws}:,\-{noise}]*{once}
+        ([A-Z]{{3}})                                                     # currency
+        [{ws}:,\-{noise}]+{once}
+        (?:PUMP[{ws}_\-{noise}]*{once}(\d+{once})|([A-Z0-9]+{once}))       # pump: number or name
+    [{ws}.,;:!*#\-{noise}]*{once}
+'''.format(ws=WHITESPACE, noise=NOISE_CHARS, once=ONCE), re.VERBOSE)
+
+OTHER_COMMAND = re.compile(r'''
+    [{ws}.,;:!*#\-{noise}]*{once}
+    (?:
+        (?P<bal>BAL(?:ANCE)?)
+      | (?P<status>STATUS|STAT)(?:[{ws}:,\-{noise}]+{once}(?P<status_pump>PUMP[{ws}_\-{noise}]*{once}\d+{once}|[A-Z0-9]+{once}))?
+      | HELP|\?
+    )
+    [{ws}.,;:!*#\-{noise}]*{once}
+'''.format(ws=WHITESPACE, noise=NOISE_CHARS, once=ONCE), re.VERBOSE)
+
+PUMP_SEPARATORS = re.compile(f'[\\s_\\-{NOISE_CHARS}]+')
+AMOUNT_SEPARATORS = re.compile(f'[,\\s{NOISE_CHARS}]')
+
+
+class SMSCommand(NamedTuple):
+    command: str                        # PAY, BAL, STATUS or HELP
+    amount: Optional[Decimal] = None
+    currency: Optional[str] = None
+    pump_id: Optional[str] = None
+
+
+BAL = SMSCommand('BAL')
+HELP = SMSCommand('HELP')
+# Bare keywords, the whole message once upper-cased
+KEYWORDS = {'BAL': BAL, 'BALANCE': BAL, 'HELP': HELP, '?': HELP,
+            'STATUS': SMSCommand('STATUS'), 'STAT': SMSCommand('STATUS')}
+
+# SMSCommand(...) runs namedtuple's Python-level __new__, which only calls
+# tuple.__new__; parse_sms calls that directly for the commands it builds.
+# Both are bound once here, not looked up for every message.
+_new = tuple.__new__
+_match_pay = PAY_COMMAND.fullmatch
+
+
+def _strip_modem(message):
+    """Drop SIM800L framing lines; a message that is all framing is kept as is"""
+    lines = [line for line in message.splitlines() if line.strip() and not MODEM_LINE.match(line)]
+    return ' '.join(lines) if lines else message
+
+
+def normalize(message):
+    """Strip modem framing and noise; returns the upper-cased SMS body"""
+    return NOISE.sub(' ', _strip_modem(message)).upper().strip()
+
+
+def _pump(value):
+    if not value or value.isalnum():
+        return value
+    return PUMP_SEPARATORS.sub('', value)
+
+
+def parse_sms(message):
+    """Parse one SMS into an SMSCommand, or None if it isn't a command"""
+    if not message:
+        return None
+
+    # Line breaks (\n, \r, \v, \x85, ...) are never printable
+    if message.isprintable():
+        message = message.upper()
+    else:
+        match = FRAMED_PAY.fullmatch(message)
+        if match:
+            amount, currency, number = match.groups()
+            return _new(SMSCommand, ('PAY', Decimal(amount), currency.upper(), 'PUMP' + number))
+        message = _strip_modem(message).upper()
+
+    if 'PAY' in message:
+        match = _match_pay(message)
+        if match:
+            amount, fraction, currency, number, name = match.groups()
+            if not amount.isdigit():
+                amount = AMOUNT_SEPARATORS.sub('', amount)
+            if fraction:
+                amount = f'{amount}.{fraction}'
+            pump = 'PUMP' + number if number else name
+            return _new(SMSCommand, ('PAY', Decimal(amount), currency, pump))
+        if message.startswith('PAY'):
+            return None                 # no other command starts with P
+
+    command = KEYWORDS.get(message)
+    if command:
+        return command
+
+    # "STATUS PUMP001" needs no pattern; separators and noise still do
+    if message.startswith('STATUS '):
+        pump = message[7:]
+        if pump.isalnum() and pump.isascii():
+            return _new(SMSCommand, ('STATUS', None, None, pump))
+
+    match = OTHER_COMMAND.fullmatch(message)
+    if not match:
+        return None
+    bal, status, status_pump = match.groups()
+    if bal:
+        return BAL
+    if status:
+        return SMSCommand('STATUS', pump_id=_pump(status_pump))
+    return HELP
+
+
+# Gateway logs repeat the same few messages over and over; memoize for replays
+parse_cached = lru_cache(maxsize=65536)(parse_sms)
+
+
+def parse_many(messages):
+    """Bulk mode for replaying gateway logs: list of SMSCommand-or-None"""
+    return list(map(parse_cached, messages))
+
+
+def parse_payment(message):
+    """Just the PAY command, or None - what the payment bridges need"""
+    command = parse_cached(message)
+    if command and command.command == 'PAY':
+        return command
+    return None
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+SMS Parser Benchmark - Unique-message parsing speed against the legacy regex
+Live SMS traffic is almost all unique, so that is the headline number. Replaying
+a gateway log through parse_many is mostly lru_cache hits and is reported apart.
+Usage: python sms_parser_benchmark.py [messages]
+"""
+
+import random
+import re
+import sys
+import time
+
+from sms_parser import parse_cached, parse_many, parse_sms
+
+TEMPLATES = [
+    "PAY {amount} {currency} PUMP{pump:03d}",
+    "pay {amount} {currency} pump {pump:03d}",
+    '+CMT: "+2577{phone}","","24/05/01,10:15:00+08"\r\nPAY {amount} {currency} PUMP{pump:03d}\r\nOK',
+    '"PAY {amount} {currency} PUMP-{pump:03d}."',
+    "STATUS PUMP{pump:03d}",
+    "BAL",
+    "HELP",
+    "PAY {amount}",          # malformed
+    "hello is the pump on",  # not a command
+]
+
+
+def random_sms(rng, amount, pump):
+    return rng.choice(TEMPLATES).format(
+        amount=amount,
+        currency=rng.choice(['BIF', 'USD', 'RWF', 'KES']),
+        pump=pump,
+        phone=rng.randint(1000000, 9999999)
+    )
+
+
+def gateway_log(count, distinct=500, seed=7):
+    """A replayable log: count messages drawn from a pool of distinct ones"""
+    rng = random.Random(seed)
+    pool = [random_sms(rng, rng.choice([1000, 2000, 5000, 10000]), rng.randint(1, 50))
+            for _ in range(distinct)]
+    return [rng.choice(pool) for _ in range(count)]
+
+
+def unique_sms(count, seed=11):
+    """count messages that, BAL and HELP aside, never repeat - live traffic"""
+    rng = random.Random(seed)
+    return [random_sms(rng, rng.randrange(100, 1_000_000), rng.randint(1, 999))
+            for _ in range(count)]
+
+
+def legacy_parse(message):
+    """The old main.py parser, for comparison"""
+    match = re.search(r'PAY\s+(\d+)\s+(\w+)\s+(\w+)', message.upper())
+    if not match:
+        return None
+    return float(match.group(1)), match.group(2), match.group(3)
+
+
+def unique_rates(parsers, messages, rounds=7):
+    """msg/s for each parser over the same messages, best of rounds
+
+    Rounds alternate between the parsers and count CPU time, so a busy host
+    slows them all alike rather than whichever happened to run then.
+    """
+    best = [float('inf')] * len(parsers)
+    for _ in range(rounds):
+        for i, parse in enumerate(parsers):
+            start = time.process_time()
+            for message in messages:
+                parse(message)
+            best[i] = min(best[i], time.process_time() - start)
+    return [len(messages) / elapsed for elapsed in best]
+
+
+def rate(label, per_second):
+    print(f"{label:<34} {per_second:>14,.0f} msg/s")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    unique = unique_sms(min(count, 200_000))
+
+    # parse_sms never caches whole messages; the legacy regex is the bar to clear
+    print(f"Unique messages ({len(unique):,}):")
+    legacy, grammar = unique_rates([legacy_parse, parse_sms], unique)
+    rate("  legacy regex (PAY only)", legacy)
+    rate("  parse_sms", grammar)
+    print(f"  parse_sms / legacy: {grammar / legacy:.2f}x")
+
+    log = gateway_log(count)
+    parse_cached.cache_clear()
+    start = time.perf_counter()
+    parsed = parse_many(log)
+    elapsed = time.perf_counter() - start
+    info = parse_cached.cache_info()
+
+    print(f"Cached replay ({count:,} messages, {info.misses:,} distinct):")
+    rate("  parse_many", count / elapsed)
+    commands = sum(1 for p in parsed if p)
+    print(f"  {commands:,} commands, {count - commands:,} rejected, "
+          f"{info.hits / count:.1%} cache hits - not a unique-message rate")
@@ -4,38 +4,53 @@ MajiSafe SMS Receiver - Real SMS Integration
 Monitors SMS messages to +25766303339 and processes payments
 """
 
-import time
-import requests
+import os
 import json
+import asyncio
+import threading
 from web3 import Web3
-import sqlite3
 from datetime import datetime
 
+from http_client import get_http_client
+from storage import SQLiteStore
+from chain_watcher import WaterBrokerWatcher
+from nonce_manager import TransactionPipeline
+from exchange_rates import get_rate_provider
+from sms_parser import parse_payment
+from sms_dedup import SMSDeduplicator
+from pump_dispatcher import get_pump_dispatcher
+from sms_ingest import SMSIngestService, HTTPSMSSource, TwilioSource, CallableSource
+
 class SMSReceiver:
     def __init__(self):
         # Twilio or SMS service credentials
-        self.sms_service_url = "https://api.twilio.com/2010-04-01/Accounts/YOUR_ACCOUNT_SID/Messages.json"
+        self.account_sid = "YOUR_ACCOUNT_SID"
         self.auth_token = "YOUR_AUTH_TOKEN"
+        self.http = get_http_client()
         self.phone_number = "+25766303339"
         
         # Web3 setup for automatic payments
-        self.w3 = Web3(Web3.HTTPProvider('https://sepolia.base.org'))
+        self.w3 = Web3(Web3.HTTPProvider(os.environ.get('RPC_URL', 'https://sepolia.base.org')))
         self.contract_address = '0x4933781A5DDC86bdF9c9C9795647e763E0429E28'
         self.private_key = "YOUR_PRIVATE_KEY"  # For automatic payments
         
-        # Exchange rates
-        self.rates = {
-            'BIF': 0.000000347,  # Burundi Francs to ETH
-            'USD': 0.0004,
-            'RWF': 0.000000312   # Rwanda Francs to ETH
-        }
+        # Confirmations come from one log poller instead of a receipt wait per payment
+        self.watcher = WaterBrokerWatcher(self.w3, self.contract_address)
+        self.tx_pipeline = None
+        self.pipeline_lock = threading.Lock()
+        
+        # ESP32 pumps by id, activated with acked commands
+        self.pumps = get_pump_dispatcher()
+        
+        # Exchange rates, refreshed in the background
+        self.rates = get_rate_provider()
         
         self.init_db()
         print(f"📱 SMS Receiver monitoring: {self.phone_number}")
     
     def init_db(self):
-        self.conn = sqlite3.connect('sms_payments.db', check_same_thread=False)
-        self.conn.execute('''
+        self.db = SQLiteStore('sms_payments.db')
+        self.db.execute('''
             CREATE TABLE IF NOT EXISTS real_sms_payments (
                 id INTEGER PRIMARY KEY,
                 from_phone TEXT,
@@ -49,119 +64,81 @@ class SMSReceiver:
                 timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
             )
         ''')
-        self.conn.commit()
+        
+        # The provider returns the same messages on every poll
+        self.dedup = SMSDeduplicator(self.db)
     
     def check_new_sms(self):
-        """Check for new SMS messages"""
-        try:
-            # For demo, simulate checking SMS service
-            # In real implementation, this would call Twilio API
-            
-            # Simulate received SMS
-            fake_sms = {
-                'from': '+250788123456',
-                'body': 'PAY 5000 BIF PUMP001',
-                'date_sent': datetime.now().isoformat()
-            }
-            
-            print(f"📱 New SMS from {fake_sms['from']}: {fake_sms['body']}")
-            return [fake_sms]
-            
-        except Exception as e:
-            print(f"❌ SMS check error: {e}")
-            return []
+        """Simulated SMS for the demo, used when no provider is configured"""
+        fake_sms = {
+            'from': '+250788123456',
+            'body': 'PAY 5000 BIF PUMP001',
+            'date_sent': datetime.now().isoformat()
+        }
+        
+        print(f"📱 New SMS from {fake_sms['from']}: {fake_sms['body']}")
+        return [fake_sms]
+    
+    def sms_sources(self):
+        """Twilio plus any SMS_PROVIDER_URLS gateways, each polled independently"""
+        sources = []
+        if self.account_sid != "YOUR_ACCOUNT_SID":
+            sources.append(TwilioSource(self.account_sid, self.auth_token, self.phone_number))
+        
+        for i, url in enumerate(filter(None, os.environ.get('SMS_PROVIDER_URLS', '').split(','))):
+            sources.append(HTTPSMSSource(f"gateway{i + 1}", url.strip()))
+        
+        # The demo SMS is new every time, so keep the old 10 s cadence
+        return sources or [CallableSource('demo', self.check_new_sms, min_interval=10)]
     
     def parse_payment_sms(self, sms_body):
         """Parse SMS: PAY 5000 BIF PUMP001"""
-        try:
-            parts = sms_body.upper().split()
-            if len(parts) != 4 or parts[0] != 'PAY':
-                return None
-                
-            amount = float(parts[1])
-            currency = parts[2]
-            pump_id = parts[3]
-            
-            eth_amount = amount * self.rates.get(currency, 0)
-            
-            return {
-                'amount': amount,
-                'currency': currency,
-                'pump_id': pump_id,
-                'eth_amount': eth_amount
-            }
-        except:
+        command = parse_payment(sms_body)
+        if not command:
             return None
+        
+        return {
+            'amount': command.amount,
+            'currency': command.currency,
+            'pump_id': command.pump_id,
+            'eth_amount': self.rates.to_eth(command.amount, command.currency),
+            'wei_amount': self.rates.to_wei(command.amount, command.currency)
+        }
+    
+    def get_tx_pipeline(self):
+        """Transaction pipeline for the hot wallet, created on first payment"""
+        with self.pipeline_lock:
+            if not self.tx_pipeline:
+                self.tx_pipeline = TransactionPipeline(self.w3, self.private_key, self.contract_address)
+                # Keep the watcher matching a payment after its tx is fee-bumped
+                self.tx_pipeline.on_replaced(self.watcher.add_tx_hash)
+                self.tx_pipeline.start()
+            return self.tx_pipeline
     
     def make_web3_payment(self, payment_data):
         """Automatically make Web3 payment with MetaMask"""
         try:
             print(f"💰 Making Web3 payment: {payment_data['eth_amount']} ETH")
             
-            # Create contract instance
-            contract_abi = [
-                {
-                    "inputs": [{"name": "pumpId", "type": "bytes32"}],
-                    "name": "buyWater",
-                    "outputs": [],
-                    "stateMutability": "payable",
-                    "type": "function"
-                }
-            ]
-            
-            contract = self.w3.eth.contract(
-                address=self.contract_address,
-                abi=contract_abi
-            )
-            
-            # Prepare transaction
-            account = self.w3.eth.account.from_key(self.private_key)
+            pipeline = self.get_tx_pipeline()
             pump_id_bytes = self.w3.keccak(text=payment_data['pump_id'])
             
-            transaction = contract.functions.buyWater(pump_id_bytes).build_transaction({
-                'from': account.address,
-                'value': self.w3.to_wei(payment_data['eth_amount'], 'ether'),
-                'gas': 200000,
-                'gasPrice': self.w3.to_wei('20', 'gwei'),
-                'nonce': self.w3.eth.get_transaction_count(account.address)
-            })
-            
-            # Sign and send transaction
-            signed_txn = self.w3.eth.account.sign_transaction(transaction, self.private_key)
-            tx_hash = self.w3.eth.send_raw_transaction(signed_txn.rawTransaction)
+            # Nonce and fees come from the pipeline, so many payments can be in flight
+            tx_hash = pipeline.buy_water(pump_id_bytes, payment_data['wei_amount'])
             
-            print(f"🔗 Transaction sent: {tx_hash.hex()}")
+            print(f"🔗 Transaction sent: {tx_hash} ({pipeline.in_flight_count()} in flight)")
             
-            # Wait for confirmation
-            receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
-            print(f"✅ Transaction confirmed: Block {receipt.blockNumber}")
-            
-            return tx_hash.hex()
+            # Confirmation is picked up by the chain watcher
+            return tx_hash
             
         except Exception as e:
             print(f"❌ Web3 payment error: {e}")
             return None
     
-    def send_esp32_command(self, pump_id, duration=10):
-        """Send activation command to ESP32"""
-        try:
-            esp32_url = "http://192.168.1.100/activate"  # ESP32 IP
-            
-            payload = {
-                'pump_id': pump_id,
-                'duration': duration,
-                'command': 'ACTIVATE'
-            }
-            
-            print(f"📡 Sending to ESP32: Activate {pump_id} for {duration}s")
-            
-            # For demo, simulate ESP32 response
-            print(f"🚰 ESP32 Response: Pump {pump_id} activated successfully")
-            return True
-            
-        except Exception as e:
-            print(f"❌ ESP32 command error: {e}")
-            return False
+    def send_esp32_command(self, pump_id, duration=10, command_id=None):
+        """Send activation command to ESP32; the Future resolves once it acks or times out"""
+        print(f"📡 Sending to ESP32: Activate {pump_id} for {duration}s")
+        return self.pumps.submit(pump_id, duration, command_id)
     
     def process_sms_payment(self, sms):
         """Complete SMS to pump activation flow"""
@@ -173,34 +150,66 @@ class SMSReceiver:
             print("❌ Invalid SMS format")
             return
         
+        dedup_key, duplicate = self.dedup.claim(sms['from'], sms['body'], sms.get('sid') or sms.get('date_sent'))
+        if duplicate:
+            print(f"🔁 Already processed ({duplicate['status']})")
+            return
+        
         print(f"💰 Payment: {payment_data['amount']} {payment_data['currency']} = {payment_data['eth_amount']} ETH")
         
         # Validate minimum payment
-        if payment_data['eth_amount'] < 0.001:
-            print("❌ Payment too small (minimum 0.001 ETH)")
+        is_valid, message = self.rates.validate(payment_data['amount'], payment_data['currency'])
+        if not is_valid:
+            print(f"❌ {message}")
+            self.dedup.complete(dedup_key, {'status': 'error', 'message': message})
             return
         
         # Make Web3 payment
         tx_hash = self.make_web3_payment(payment_data)
         if not tx_hash:
             print("❌ Web3 payment failed")
+            self.dedup.release(dedup_key)
             return
+        self.dedup.complete(dedup_key, {'status': 'sent', 'tx_hash': tx_hash})
         
-        # Send ESP32 command
-        esp32_success = self.send_esp32_command(payment_data['pump_id'])
+        # Activate the pump once WaterPurchased for this transaction is mined
+        # (the watcher holds the event if it was mined before this call)
+        self.watcher.expect(
+            payment_data['pump_id'],
+            self.complete_payment,
+            tx_hash=tx_hash,
+            sms=sms,
+            payment_data=payment_data
+        )
+        print(f"⏳ Waiting for on-chain confirmation of {tx_hash[:10]}...")
+    
+    def complete_payment(self, payment, event):
+        """Chain watcher callback: payment mined, activate pump and log"""
+        # The dispatcher waits for the ack, so the watcher thread moves straight on
+        # The tx hash as command id: a re-delivered event cannot run the pump twice
+        activation = self.send_esp32_command(payment['payment_data']['pump_id'],
+                                             command_id=event['tx_hash'][2:18])
+        activation.add_done_callback(lambda f: self.log_payment(payment, event, f.result()))
+    
+    def log_payment(self, payment, event, activation):
+        sms = payment['sms']
+        payment_data = payment['payment_data']
         
         # Log to database
-        self.conn.execute('''
+        self.db.insert('''
             INSERT INTO real_sms_payments 
             (from_phone, sms_content, amount, currency, pump_id, eth_amount, tx_hash, status)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         ''', (sms['from'], sms['body'], payment_data['amount'], 
               payment_data['currency'], payment_data['pump_id'], 
-              payment_data['eth_amount'], tx_hash, 'completed'))
-        self.conn.commit()
+              payment_data['eth_amount'], event['tx_hash'],
+              'completed' if activation['acked'] else 'pump_unreachable'))
         
-        print(f"✅ Payment complete! TX: {tx_hash[:10]}...")
-        print(f"🚰 Pump {payment_data['pump_id']} activated!")
+        print(f"✅ Payment complete! TX: {event['tx_hash'][:10]}... (block {event['block_number']})")
+        if activation['acked']:
+            print(f"🚰 Pump {payment_data['pump_id']} activated!")
+        else:
+            print(f"❌ Pump {payment_data['pump_id']} did not ack: {activation['error']}")
     
     def start_monitoring(self):
         """Start monitoring SMS messages"""
@@ -209,22 +218,21 @@ class SMSReceiver:
         print("💬 Format: PAY 5000 BIF PUMP001")
         print("-" * 50)
         
-        while True:
-            try:
-                # Check for new SMS
-                new_messages = self.check_new_sms()
-                
-                for sms in new_messages:
-                    self.process_sms_payment(sms)
-                
-                time.sleep(10)  # Check every 10 seconds
-                
-            except KeyboardInterrupt:
-                print("\n🛑 SMS monitoring stopped")
-                break
-            except Exception as e:
-                print(f"❌ Monitoring error: {e}")
-                time.sleep(30)
+        self.watcher.start()
+        
+        # Sources are polled concurrently; payments are processed a few at a time
+        self.ingest = SMSIngestService(
+            self.sms_sources(),
+            self.process_sms_payment,
+            concurrency=int(os.environ.get('SMS_CONCURRENCY', 8)),
+            min_interval=float(os.environ.get('SMS_POLL_MIN', 1)),
+            max_interval=float(os.environ.get('SMS_POLL_MAX', 30))
+        )
+        
+        try:
+            asyncio.run(self.ingest.run())
+        except KeyboardInterrupt:
+            print("\n🛑 SMS monitoring stopped")
 
 if __name__ == "__main__":
     receiver = SMSReceiver()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Startup Benchmark - Cold interpreter to first /status answer, per bridge
+python startup_benchmark.py [bridge ...] [--runs 5] [--top 8]; import breakdown from python -X importtime
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from serve import BRIDGES
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Should only load when a request needs them, never to boot
+HEAVY_MODULES = ('web3', 'eth_account', 'selenium', 'webdriver_manager', 'requests')
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import {module} as bridge
+imported = time.perf_counter()
+client = bridge.create_app().test_client()
+built = time.perf_counter()
+status = client.get('/status').status_code
+ready = time.perf_counter()
+wall = time.time()
+bridge.shutdown()
+print('STARTUP ' + json.dumps({{
+    'import': imported - start, 'create_app': built - imported, 'first_status': ready - built,
+    'ready_at': wall, 'status': status,
+    'heavy': [name for name in {heavy!r} if name in sys.modules]
+}}))
+'''
+
+
+def probe(module, importtime=False):
+    """One cold start in a fresh temp dir: (timings, importtime stderr)"""
+    flags = ['-X', 'importtime'] if importtime else []
+    env = {**os.environ, 'PYTHONPATH': HERE + os.pathsep + os.environ.get('PYTHONPATH', '')}
+    with tempfile.TemporaryDirectory() as workdir:
+        spawned = time.time()
+        result = subprocess.run(
+            [sys.executable, *flags, '-c', PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=workdir, env=env, capture_output=True, text=True, timeout=120
+        )
+    for line in result.stdout.splitlines():
+        if line.startswith('STARTUP '):
+            timings = json.loads(line[len('STARTUP '):])
+            timings['process'] = timings.pop('ready_at') - spawned
+            return timings, result.stderr
+    error = (result.stderr.strip().splitlines() or ['no output'])[-1]
+    raise RuntimeError(error)
+
+
+def heaviest_imports(stderr, module, top):
+    """The bridge's direct imports by cumulative -X importtime microseconds"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            entries.append((len(name) - len(name.lstrip()), name.strip(), int(cumulative)))
+
+    # Children are logged before their parent, so walk back from the bridge module
+    bridge = max((i for i, entry in enumerate(entries) if entry[1] == module), default=None)
+    if bridge is None:
+        return []
+    depth = entries[bridge][0] + 2
+    direct = []
+    for indent, name, cumulative in reversed(entries[:bridge]):
+        if indent < depth:
+            break
+        if indent == depth:
+            direct.append((name, cumulative))
+    return sorted(direct, key=lambda entry: -entry[1])[:top]
+
+
+def benchmark(bridges, runs=5, top=8):
+    print(f"🧪 Cold start, median of {runs} runs: import | create_app | first /status | process -> ready")
+    breakdowns = {}
+    for module in bridges:
+        try:
+            samples = [probe(module)[0] for _ in range(runs)]
+            _, stderr = probe(module, importtime=True)
+        except (RuntimeError, subprocess.TimeoutExpired) as e:
+            print(f"  {module:20} ❌ {e}")
+            continue
+
+        def median(key):
+            return statistics.median(sample[key] for sample in samples) * 1000
+
+        heavy = ', '.join(samples[-1]['heavy']) or 'none'
+        print(f"  {module:20} {median('import'):6.0f} ms | {median('create_app'):5.0f} ms | "
+              f"{median('first_status'):5.0f} ms | {median('process'):6.0f} ms   "
+              f"heavy modules loaded: {heavy}")
+        breakdowns[module] = heaviest_imports(stderr, module, top)
+
+    for module, imports in breakdowns.items():
+        print(f"\n📦 {module}: heaviest imports (-X importtime, cumulative)")
+        for name, micros in imports:
+            print(f"  {name:28} {micros / 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time bridge cold starts")
+    parser.add_argument('bridges', nargs='*', help=f"default: all of {', '.join(sorted(BRIDGES))}")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=8)
+    args = parser.parse_args()
+    unknown = set(args.bridges) - set(BRIDGES)
+    if unknown:
+        parser.error(f"unknown bridge(s): {', '.join(sorted(unknown))}")
+    benchmark(args.bridges or sorted(BRIDGES), args.runs, args.top)
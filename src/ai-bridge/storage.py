@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+MajiSafe Storage - SQLite access shared by all bridges
+Per-thread WAL connections for reads, one group-commit writer for inserts
+"""
+
+import base64
+import os
+import queue
+import sqlite3
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from decimal import Decimal
+
+from metrics import DB_COMMIT_ROWS, DB_COMMIT_SECONDS, get_metrics
+
+# WAL lets readers run while the writer commits; NORMAL skips the fsync per commit
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+# Parsed SMS amounts are Decimals; REAL columns convert the text on insert
+sqlite3.register_adapter(Decimal, str)
+
+# Live writers, for the queue-depth gauge
+_writers = weakref.WeakSet()
+
+
+def _write_queue_depths():
+    depths = {}
+    for writer in list(_writers):
+        depths[writer.db_name] = depths.get(writer.db_name, 0) + writer.depth()
+    return depths
+
+
+get_metrics().gauge('majisafe_db_write_queue', 'Writes waiting for the group-commit writer',
+                    _write_queue_depths, ('db',))
+
+
+def connect(db_path):
+    """Open a connection with the bridge pragmas applied, in autocommit mode"""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def encode_cursor(timestamp, row_id):
+    """Opaque pagination cursor for the last row of a page"""
+    return base64.urlsafe_b64encode(f"{timestamp}|{row_id}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for malformed cursors"""
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+        return timestamp, int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def normalize_timestamp(value):
+    """Accept ISO dates/datetimes and match SQLite's CURRENT_TIMESTAMP format"""
+    return value.replace('T', ' ').rstrip('Z') if value else value
+
+
+def keyset_page(store, columns, table, filters=(), cursor=None, limit=50):
+    """Newest-first page of rows, seeking past the cursor on (timestamp, id)
+
+    filters is a list of (condition, value) pairs, e.g. ("pump_id = ?", "PUMP001").
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    clauses = [condition for condition, _ in filters]
+    params = [value for _, value in filters]
+
+    if cursor:
+        clauses.append("(timestamp, id) < (?, ?)")
+        params.extend(decode_cursor(cursor))
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    rows = store.query(f'''
+        SELECT id, timestamp, {columns} FROM {table} {where}
+        ORDER BY timestamp DESC, id DESC
+        LIMIT ?
+    ''', params + [limit + 1])
+
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last[1], last[0])
+
+    return [row[2:] for row in rows[:limit]], next_cursor
+
+
+class GroupCommitWriter:
+    def __init__(self, db_path, batch_size=200, flush_interval=0.02):
+        self.db_path = db_path
+        self.db_name = os.path.basename(db_path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.pending = queue.Queue()
+        self.running = True
+
+        # Commit counters, handy when tuning batch_size
+        self.commits = 0
+        self.rows_written = 0
+
+        self.thread = threading.Thread(target=self._run, name="sqlite-writer")
+        self.thread.daemon = True
+        self.thread.start()
+        _writers.add(self)
+
+    def submit(self, sql, params):
+        """Queue a write; the Future resolves to lastrowid once committed"""
+        future = Future()
+        self.pending.put((sql, params, future))
+        return future
+
+    def depth(self):
+        return self.pending.qsize()
+
+    def stop(self):
+        """Commit everything queued so far, then stop the writer thread"""
+        self.running = False
+        self.pending.put(None)
+        self.thread.join()
+
+    def _next_batch(self):
+        item = self.pending.get()
+        if item is None:
+            return None
+
+        batch = [item]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.pending.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self.pending.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        conn = connect(self.db_path)
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            self._commit(conn, batch)
+
+        # Done-callbacks of the last commits may have queued follow-up writes
+        # (e.g. an UPDATE of a row just inserted) behind the stop marker
+        while True:
+            batch = self._drain()
+            if not batch:
+                break
+            self._commit(conn, batch)
+        conn.close()
+
+    def _drain(self):
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                item = self.pending.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                batch.append(item)
+        return batch
+
+    def _commit(self, conn, batch):
+        """Write a batch in one transaction; a bad row only fails its own Future"""
+        results = []
+        start = time.perf_counter()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for sql, params, future in batch:
+                try:
+                    conn.execute("SAVEPOINT row")
+                    cursor = conn.execute(sql, params)
+                    conn.execute("RELEASE row")
+                    results.append((future, cursor.lastrowid, None))
+                except sqlite3.Error as e:
+                    conn.execute("ROLLBACK TO row")
+                    conn.execute("RELEASE row")
+                    results.append((future, None, e))
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.commits += 1
+        self.rows_written += len(batch)
+        DB_COMMIT_SECONDS.observe(time.perf_counter() - start, db=self.db_name)
+        DB_COMMIT_ROWS.observe(len(batch), db=self.db_name)
+        for future, rowid, error in results:
+            if error:
+                future.set_exception(error)
+            else:
+                future.set_result(rowid)
+
+
+class SQLiteStore:
+    def __init__(self, db_path, batch_size=200, flush_interval=0.02):
+        self.db_path = db_path
+        self.local = threading.local()
+        self.writer = GroupCommitWriter(db_path, batch_size, flush_interval)
+
+    def connection(self):
+        """This thread's connection, opened on first use"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = connect(self.db_path)
+        return conn
+
+    def execute(self, sql, params=()):
+        """Run one statement now on this thread's connection (autocommit)"""
+        return self.connection().execute(sql, params)
+
+    def query(self, sql, params=()):
+        return self.connection().execute(sql, params).fetchall()
+
+    def insert(self, sql, params=()):
+        """Queue an insert for the group-commit writer; returns a Future"""
+        return self.writer.submit(sql, params)
+
+    def close(self):
+        self.writer.stop()
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
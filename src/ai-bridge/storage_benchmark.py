@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Storage Benchmark - Shared connection + commit per row vs WAL group commit
+Usage: python storage_benchmark.py [rows] [threads]
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from storage import SQLiteStore
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS sms_payments (
+        id INTEGER PRIMARY KEY,
+        phone TEXT,
+        sms_content TEXT,
+        amount REAL,
+        currency TEXT,
+        pump_id TEXT,
+        eth_amount REAL,
+        tx_hash TEXT,
+        status TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+INSERT = '''
+    INSERT INTO sms_payments (phone, sms_content, amount, currency, pump_id, eth_amount, tx_hash, status)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def row(i):
+    return (f"+2577{i:07d}", "PAY 5000 BIF PUMP001", 5000, "BIF",
+            f"PUMP{i % 10:03d}", 0.001735, "sms_received", "pending_blockchain")
+
+
+def run_threads(threads, rows, work):
+    per_thread = rows // threads
+    workers = [
+        threading.Thread(target=work, args=(t * per_thread, per_thread))
+        for t in range(threads)
+    ]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return per_thread * threads, time.perf_counter() - start
+
+
+def bench_shared_connection(path, rows, threads):
+    """The original bridge pattern: one connection, commit after every insert"""
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute(SCHEMA)
+    conn.commit()
+    lock = threading.Lock()
+
+    def work(offset, count):
+        for i in range(offset, offset + count):
+            with lock:
+                conn.execute(INSERT, row(i))
+                conn.commit()
+
+    written, elapsed = run_threads(threads, rows, work)
+    conn.close()
+    return written, elapsed
+
+
+def bench_group_commit(path, rows, threads):
+    store = SQLiteStore(path)
+    store.execute(SCHEMA)
+
+    def work(offset, count):
+        futures = [store.insert(INSERT, row(i)) for i in range(offset, offset + count)]
+        for future in futures:
+            future.result()
+
+    written, elapsed = run_threads(threads, rows, work)
+    commits = store.writer.commits
+    store.close()
+    return written, elapsed, commits
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+    with tempfile.TemporaryDirectory() as tmp:
+        written, elapsed = bench_shared_connection(os.path.join(tmp, 'shared.db'), rows, threads)
+        print(f"🐢 Shared connection: {written / elapsed:10.0f} inserts/s ({written} rows, {written} commits)")
+
+        written, elapsed, commits = bench_group_commit(os.path.join(tmp, 'wal.db'), rows, threads)
+        print(f"🚀 WAL group commit:  {written / elapsed:10.0f} inserts/s ({written} rows, {commits} commits)")
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Stub Chain RPC - Local stand-in for an Ethereum JSON-RPC node running WaterBroker
+Accepts signed buyWater transactions and answers receipts, logs and nonces for them
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+import rlp
+from eth_account import Account
+from web3 import Web3
+
+from chain_watcher import WATER_PURCHASED
+from stub_dkg_node import StubServer
+
+DEFAULT_CONTRACT = '0x4933781A5DDC86bdF9c9C9795647e763E0429E28'
+BUY_WATER = bytes(Web3.keccak(text="buyWater(bytes32)")[:4])
+
+# Field positions of (nonce, to, value, data) by transaction type
+TX_FIELDS = {0: (0, 3, 4, 5), 1: (1, 4, 5, 6), 2: (1, 5, 6, 7)}
+
+
+def word(value):
+    return value.to_bytes(32, 'big')
+
+
+def to_int(value):
+    """JSON-RPC quantity or block tag -> int, or None for 'latest'/'pending'"""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.startswith('0x'):
+        return int(value, 16)
+    return {'earliest': 0}.get(value)
+
+
+class StubChainRPC:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, block_time=0.0,
+                 contract_address=DEFAULT_CONTRACT, credit_price=10**15, chain_id=1337):
+        """
+        latency: seconds before each JSON-RPC answer
+        block_time: seconds per block; 0 mines every transaction in its own block
+        credit_price: wei per water credit, as WaterBroker.creditPrice
+        """
+        self.latency = latency
+        self.block_time = block_time
+        self.contract_address = Web3.to_checksum_address(contract_address)
+        self.credit_price = credit_price
+        self.chain_id = chain_id
+
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.mined = 1
+        self.requests = 0
+        self.calls = {}
+        # tx hash -> receipt (blockNumber as int until formatted)
+        self.receipts = {}
+        self.logs = []
+        self.nonces = {}
+
+        self.server = StubServer((host, port), self._handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def block_number(self):
+        if self.block_time:
+            return 1 + int((time.monotonic() - self.started) / self.block_time)
+        return self.mined
+
+    def purchase(self, user, pump_id, credits):
+        """Record a buyWater from user without a signed transaction; returns the tx hash"""
+        user = Web3.to_checksum_address(user)
+        tx_hash = Web3.keccak(text=f"{user}:{pump_id}:{credits}:{time.time_ns()}")
+        with self.lock:
+            self._include(tx_hash, user, self.contract_address, credits * self.credit_price,
+                          BUY_WATER + bytes(Web3.keccak(text=pump_id)))
+        return Web3.to_hex(tx_hash)
+
+    def send_raw_transaction(self, raw):
+        sender = Account.recover_transaction(raw)
+        kind = raw[0] if raw[0] < 0xc0 else 0
+        fields = rlp.decode(raw if kind == 0 else raw[1:])
+        nonce, to, value, data = (fields[i] for i in TX_FIELDS[kind])
+        nonce = int.from_bytes(nonce, 'big')
+
+        with self.lock:
+            expected = self.nonces.get(sender, 0)
+            if nonce != expected:
+                raise ValueError(f"nonce too {'low' if nonce < expected else 'high'}: "
+                                 f"expected {expected}, got {nonce}")
+            tx_hash = Web3.keccak(raw)
+            self._include(tx_hash, sender, Web3.to_checksum_address(to) if to else None,
+                          int.from_bytes(value, 'big'), data)
+        return Web3.to_hex(tx_hash)
+
+    def _include(self, tx_hash, sender, to, value, data):
+        """Mine a transaction into the next block (caller holds the lock)"""
+        self.nonces[sender] = self.nonces.get(sender, 0) + 1
+        if self.block_time:
+            block = self.block_number() + 1
+        else:
+            self.mined += 1
+            block = self.mined
+
+        status, logs = 1, []
+        if to == self.contract_address and data[:4] == BUY_WATER:
+            credits = value // self.credit_price
+            if credits and len(data) >= 36:
+                logs.append({
+                    'address': self.contract_address,
+                    'topics': [Web3.to_hex(WATER_PURCHASED),
+                               Web3.to_hex(bytes(12) + bytes.fromhex(sender[2:]))],
+                    'data': Web3.to_hex(word(credits) + data[4:36]),
+                    'logIndex': '0x0',
+                    'removed': False
+                })
+            else:
+                status = 0
+
+        block_hash = Web3.to_hex(word(block))
+        for log in logs:
+            log.update({'blockNumber': block, 'blockHash': block_hash,
+                        'transactionHash': Web3.to_hex(tx_hash), 'transactionIndex': '0x0'})
+            self.logs.append(log)
+        self.receipts[Web3.to_hex(tx_hash)] = {
+            'transactionHash': Web3.to_hex(tx_hash), 'transactionIndex': '0x0',
+            'blockNumber': block, 'blockHash': block_hash,
+            'from': sender, 'to': to, 'contractAddress': None,
+            'gasUsed': '0xc350', 'cumulativeGasUsed': '0xc350', 'effectiveGasPrice': '0x3b9aca00',
+            'status': hex(status), 'type': '0x2', 'logsBloom': '0x' + '00' * 256, 'logs': logs
+        }
+
+    def call(self, method, params):
+        """Answer one JSON-RPC method; raises KeyError for unsupported ones"""
+        with self.lock:
+            self.requests += 1
+            self.calls[method] = self.calls.get(method, 0) + 1
+            height = self.block_number()
+
+        if method == 'eth_chainId':
+            return hex(self.chain_id)
+        if method == 'net_version':
+            return str(self.chain_id)
+        if method == 'eth_blockNumber':
+            return hex(height)
+        if method in ('eth_gasPrice', 'eth_maxPriorityFeePerGas'):
+            return hex(10**9)
+        if method == 'eth_estimateGas':
+            return hex(100000)
+        if method == 'eth_getBalance':
+            return hex(10**21)
+        if method == 'eth_getTransactionCount':
+            with self.lock:
+                return hex(self.nonces.get(Web3.to_checksum_address(params[0]), 0))
+        if method == 'eth_getBlockByNumber':
+            number = to_int(params[0])
+            number = height if number is None else number
+            return {
+                'number': hex(number), 'hash': Web3.to_hex(word(number)),
+                'parentHash': Web3.to_hex(word(max(number - 1, 0))),
+                'timestamp': hex(int(time.time())), 'baseFeePerGas': hex(10**9),
+                'gasLimit': hex(30_000_000), 'gasUsed': '0x0', 'transactions': []
+            }
+        if method == 'eth_sendRawTransaction':
+            return self.send_raw_transaction(Web3.to_bytes(hexstr=params[0]))
+        if method in ('eth_getTransactionReceipt', 'eth_getTransactionByHash'):
+            with self.lock:
+                receipt = self.receipts.get(params[0].lower())
+            if receipt is None or receipt['blockNumber'] > height:
+                return None
+            return {**receipt, 'blockNumber': hex(receipt['blockNumber']),
+                    'logs': [{**log, 'blockNumber': hex(log['blockNumber'])} for log in receipt['logs']]}
+        if method == 'eth_getLogs':
+            return self._get_logs(params[0], height)
+        raise KeyError(method)
+
+    def _get_logs(self, query, height):
+        start = to_int(query.get('fromBlock', 'latest'))
+        end = to_int(query.get('toBlock', 'latest'))
+        start = height if start is None else start
+        end = min(height, height if end is None else end)
+        addresses = query.get('address')
+        if isinstance(addresses, str):
+            addresses = [addresses]
+        addresses = {a.lower() for a in addresses} if addresses else None
+        topic0 = (query.get('topics') or [None])[0]
+        if isinstance(topic0, str):
+            topic0 = [topic0]
+        topic0 = {t.lower() for t in topic0} if topic0 else None
+
+        with self.lock:
+            logs = list(self.logs)
+        return [
+            {**log, 'blockNumber': hex(log['blockNumber'])}
+            for log in logs
+            if start <= log['blockNumber'] <= end
+            and (addresses is None or log['address'].lower() in addresses)
+            and (topic0 is None or log['topics'][0] in topic0)
+        ]
+
+    def _handler(self):
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                time.sleep(node.latency)
+                if isinstance(body, list):
+                    return self._reply([self._answer(call) for call in body])
+                self._reply(self._answer(body))
+
+            def _answer(self, call):
+                answer = {'jsonrpc': '2.0', 'id': call.get('id')}
+                try:
+                    answer['result'] = node.call(call.get('method'), call.get('params') or [])
+                except KeyError:
+                    answer['error'] = {'code': -32601, 'message': f"Method not found: {call.get('method')}"}
+                except Exception as e:
+                    answer['error'] = {'code': -32000, 'message': str(e)}
+                return answer
+
+            def _reply(self, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    node = StubChainRPC(port=8545).start()
+    print(f"🧪 Stub chain RPC listening on {node.url} (WaterBroker at {node.contract_address})")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        node.stop()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Stub DKG Node - Local stand-in for an OriginTrail node's /assets API
+Used for benchmarks and offline development, never for real publishing
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Room for bursts of benchmark connections without resets
+    request_queue_size = 256
+
+
+class StubDKGNode:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.05):
+        """latency: seconds each publish takes, to mimic a real node"""
+        self.latency = latency
+        self.requests = 0
+        self.assets = 0
+        self.lock = threading.Lock()
+
+        self.server = StubServer((host, port), self._handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                if self.path != '/assets':
+                    return self._reply(404, {"error": "Not found"})
+
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                public = body.get("public", {})
+                count = len(public.get("@graph", [])) or 1
+
+                with node.lock:
+                    node.requests += 1
+                    node.assets += count
+                    token_id = node.requests
+
+                time.sleep(node.latency)
+                self._reply(200, {
+                    "UAL": f"did:dkg:otp:20430/0xstub/{token_id}",
+                    "publicAssertionId": f"0x{token_id:064x}"
+                })
+
+            def do_GET(self):
+                if self.path.startswith('/assets/'):
+                    return self._reply(200, {"UAL": self.path[len('/assets/'):]})
+                self._reply(404, {"error": "Not found"})
+
+            def _reply(self, code, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    node = StubDKGNode(port=8900).start()
+    print(f"🧪 Stub DKG node listening on {node.url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        node.stop()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Stub ESP32 - Local stand-in for majisafe_dkg_pump.ino's /activate and /confirm-web3
+Acks commands by command_id like the firmware; can drop or delay acks to exercise retries
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs
+
+from stub_dkg_node import StubServer
+
+
+class StubESP32:
+    def __init__(self, host='127.0.0.1', port=0, pump_id='PUMP001', latency=0.0, drop_first=0):
+        """
+        latency: seconds before each ack
+        drop_first: number of /activate requests answered with 503 before acking
+        """
+        self.pump_id = pump_id
+        self.latency = latency
+        self.drop_first = drop_first
+
+        self.lock = threading.Lock()
+        self.requests = 0
+        # command_id -> duration, in the order the pump ran them
+        self.activations = {}
+        self.confirmations = []
+
+        self.server = StubServer((host, port), self._handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _activate(self, command):
+        with self.lock:
+            self.requests += 1
+            if self.requests <= self.drop_first:
+                return 503, {"status": "error", "message": "Busy"}
+            if command.get('pump_id') != self.pump_id:
+                return 404, {"status": "error", "message": "Unknown pump"}
+
+            command_id = command.get('command_id', '')
+            duplicate = command_id in self.activations
+            if not duplicate:
+                self.activations[command_id] = command.get('duration', 10)
+
+        return 200, {
+            "status": "ack",
+            "command_id": command_id,
+            "pump_id": self.pump_id,
+            "duplicate": duplicate
+        }
+
+    def _handler(self):
+        pump = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length)
+                if pump.latency:
+                    time.sleep(pump.latency)
+
+                if self.path == '/activate':
+                    return self._reply(*pump._activate(json.loads(body or b'{}')))
+
+                if self.path == '/confirm-web3':
+                    form = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+                    if 'tx_hash' not in form or 'event_id' not in form:
+                        return self._reply(400, {"status": "error", "message": "Missing parameters"})
+                    with pump.lock:
+                        pump.confirmations.append(form)
+                    return self._reply(200, {"status": "success", "message": "Payment confirmed"})
+
+                self._reply(404, {"status": "error", "message": "Not found"})
+
+            def _reply(self, code, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    # PUMP_DEVICES=PUMP001=http://127.0.0.1:8930 python sms_receiver.py
+    pump = StubESP32(port=8930).start()
+    print(f"🧪 Stub ESP32 ({pump.pump_id}) listening on {pump.url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pump.stop()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Stub MQTT Pump - Simulated ESP32 on the pumps/<id>/cmd, /ack, /telemetry topics
+Works over InProcessBroker or a real broker through PahoBus
+"""
+
+import json
+import sys
+import threading
+import time
+
+
+class StubMQTTPump:
+    def __init__(self, bus, pump_id='PUMP001', drop_first=0, flow_rate=0.1):
+        """
+        drop_first: commands ignored (no ack) before the pump starts answering
+        flow_rate: liters per second reported in telemetry while running
+        """
+        self.bus = bus
+        self.pump_id = pump_id
+        self.drop_first = drop_first
+        self.flow_rate = flow_rate
+
+        self.lock = threading.Lock()
+        self.received = 0
+        # command_id -> command, in the order the pump ran them
+        self.commands = {}
+
+        self.bus.subscribe(f"pumps/{pump_id}/cmd", self._on_command, qos=1)
+
+    def publish_telemetry(self, liters, flow_pulses=None, duration=None):
+        reading = {
+            'pump_id': self.pump_id,
+            'liters': liters,
+            'flow_pulses': flow_pulses if flow_pulses is not None else int(liters * 10),
+            'timestamp': time.time()
+        }
+        if duration is not None:
+            reading['duration_seconds'] = duration
+        self.bus.publish(f"pumps/{self.pump_id}/telemetry", json.dumps(reading), qos=1)
+
+    def _on_command(self, topic, payload):
+        command = json.loads(payload)
+        with self.lock:
+            self.received += 1
+            if self.received <= self.drop_first:
+                return
+            command_id = command.get('command_id', '')
+            duplicate = command_id in self.commands
+            if not duplicate:
+                self.commands[command_id] = command
+
+        self.bus.publish(f"pumps/{self.pump_id}/ack", json.dumps({
+            'status': 'ack',
+            'command_id': command_id,
+            'pump_id': self.pump_id,
+            'duplicate': duplicate
+        }), qos=1)
+
+        if not duplicate and command.get('command') == 'ACTIVATE':
+            duration = command.get('duration', 10)
+            self.publish_telemetry(round(duration * self.flow_rate, 2), duration=duration)
+
+
+if __name__ == "__main__":
+    # python stub_mqtt_pump.py [count] - simulated pumps on a broker at MQTT_HOST
+    import os
+    from mqtt_bus import PahoBus
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    bus = PahoBus(host=os.environ.get('MQTT_HOST', 'localhost'),
+                  port=int(os.environ.get('MQTT_PORT', 1883)),
+                  client_id='majisafe-stub-pumps')
+    pumps = [StubMQTTPump(bus, f"PUMP{i:03d}") for i in range(1, count + 1)]
+    print(f"🧪 {count} stub pumps listening on pumps/+/cmd")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        bus.close()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Stub Rate Feed - Local exchange-rate feed for RateProvider's HTTP source
+Serves GET /rates and drifts the rates a little on every request
+"""
+
+import json
+import random
+import threading
+import time
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler
+
+from exchange_rates import DEFAULT_RATES
+from stub_dkg_node import StubServer
+
+
+class StubRateFeed:
+    def __init__(self, host='127.0.0.1', port=0, rates=None, drift=0.01):
+        """drift: largest relative change applied per request"""
+        self.rates = {c: Decimal(r) for c, r in (rates or DEFAULT_RATES).items()}
+        self.drift = drift
+        self.requests = 0
+        self.lock = threading.Lock()
+
+        self.server = StubServer((host, port), self._handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/rates"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _next_rates(self):
+        with self.lock:
+            self.requests += 1
+            for currency, rate in self.rates.items():
+                change = Decimal(str(random.uniform(-self.drift, self.drift)))
+                self.rates[currency] = (rate * (1 + change)).quantize(Decimal('1e-12'))
+            return {c: f"{r:f}" for c, r in self.rates.items()}
+
+    def _handler(self):
+        feed = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                if self.path != '/rates':
+                    return self._reply(404, {"error": "Not found"})
+                self._reply(200, {"base": "ETH", "timestamp": time.time(), "rates": feed._next_rates()})
+
+            def _reply(self, code, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    # RATES_URL=http://127.0.0.1:8910/rates python majisafe_ai.py
+    feed = StubRateFeed(port=8910).start()
+    print(f"🧪 Stub rate feed listening on {feed.url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        feed.stop()
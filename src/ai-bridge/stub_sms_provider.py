@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Stub SMS Provider - Local inbox for SMSIngestService's HTTP source
+Serves GET /messages?since=<sid> oldest first; inject() or POST /messages adds SMS
+"""
+
+import json
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlsplit
+
+from stub_dkg_node import StubServer
+
+
+class StubSMSProvider:
+    def __init__(self, host='127.0.0.1', port=0, page_size=50, latency=0.0):
+        """latency: seconds each poll takes, to mimic a slow provider"""
+        self.page_size = page_size
+        self.latency = latency
+        self.messages = []
+        self.polls = 0
+        self.lock = threading.Lock()
+
+        self.server = StubServer((host, port), self._handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/messages"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def inject(self, phone, body):
+        """Add an incoming SMS; returns its sid"""
+        with self.lock:
+            sid = f"SM{len(self.messages) + 1:08d}"
+            self.messages.append({
+                'sid': sid,
+                'from': phone,
+                'body': body,
+                'date_sent': datetime.now().isoformat()
+            })
+            return sid
+
+    def _since(self, sid):
+        with self.lock:
+            self.polls += 1
+            # sids are sequential, so the cursor is also the list offset
+            start = int(sid[2:]) if sid else 0
+            return self.messages[start:start + self.page_size]
+
+    def _handler(self):
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                if url.path != '/messages':
+                    return self._reply(404, {"error": "Not found"})
+                if provider.latency:
+                    time.sleep(provider.latency)
+                since = parse_qs(url.query).get('since', [None])[0]
+                self._reply(200, {"messages": provider._since(since)})
+
+            def do_POST(self):
+                if self.path != '/messages':
+                    return self._reply(404, {"error": "Not found"})
+                length = int(self.headers.get('Content-Length', 0))
+                data = json.loads(self.rfile.read(length) or b'{}')
+                sid = provider.inject(data.get('from', ''), data.get('body', ''))
+                self._reply(201, {"sid": sid})
+
+            def _reply(self, code, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    # SMS_PROVIDER_URLS=http://127.0.0.1:8920/messages python sms_receiver.py
+    provider = StubSMSProvider(port=8920).start()
+    print(f"🧪 Stub SMS provider listening on {provider.url}")
+    print('💬 curl -d \'{"from": "+250788123456", "body": "PAY 5000 BIF PUMP001"}\' ' + provider.url)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        provider.stop()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Telemetry Store - Flow-sensor readings per pump as a compact time series
+Raw readings in array-backed chunks, liters rolled up per minute / hour / day
+"""
+
+import threading
+import time
+from array import array
+
+# Rollup resolutions, finest first, as bucket widths in seconds
+RESOLUTIONS = {'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def bucket_start(timestamp, resolution):
+    width = RESOLUTIONS[resolution]
+    return int(timestamp // width) * width
+
+
+def reading_time(reading, received_at):
+    """Epoch seconds for a reading: 'timestamp' if it is wall-clock time,
+    else received_at minus 'age_ms' (ESP32s only know millis() since boot)"""
+    timestamp = reading.get('timestamp')
+    if timestamp is not None and float(timestamp) > 1e9:
+        return float(timestamp)
+    return received_at - float(reading.get('age_ms', 0)) / 1000
+
+
+class Chunk:
+    """Open chunk of one pump's readings: parallel typed arrays, 16 bytes a reading"""
+
+    def __init__(self):
+        self.timestamps = array('d')
+        self.liters = array('d')
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def append(self, timestamp, liters):
+        self.timestamps.append(timestamp)
+        self.liters.append(liters)
+
+
+class TelemetryStore:
+    def __init__(self, store, chunk_size=4096, chunk_seconds=3600):
+        """
+        store: SQLiteStore; rollups and sealed chunks are written through its group-commit writer
+        chunk_size / chunk_seconds: seal an open chunk at this many readings or this age
+        """
+        self.store = store
+        self.chunk_size = chunk_size
+        self.chunk_seconds = chunk_seconds
+
+        self.lock = threading.Lock()
+        # pump_id -> open Chunk, sealed into telemetry_chunks when full or old
+        self.open_chunks = {}
+        self.readings = 0
+
+        self.init_db()
+
+    def init_db(self):
+        self.store.execute('''
+            CREATE TABLE IF NOT EXISTS telemetry_chunks (
+                id INTEGER PRIMARY KEY,
+                pump_id TEXT NOT NULL,
+                start_ts REAL NOT NULL,
+                end_ts REAL NOT NULL,
+                readings INTEGER NOT NULL,
+                timestamps BLOB NOT NULL,
+                liters BLOB NOT NULL
+            )
+        ''')
+        self.store.execute('''
+            CREATE TABLE IF NOT EXISTS telemetry_rollups (
+                pump_id TEXT NOT NULL,
+                resolution TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                liters REAL NOT NULL,
+                readings INTEGER NOT NULL,
+                PRIMARY KEY (pump_id, resolution, bucket)
+            ) WITHOUT ROWID
+        ''')
+        self.store.execute('''
+            CREATE TABLE IF NOT EXISTS pump_completions (
+                event_id TEXT PRIMARY KEY,
+                pump_id TEXT,
+                liters REAL,
+                duration_seconds INTEGER,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self.store.execute('CREATE INDEX IF NOT EXISTS idx_telemetry_chunks_pump ON telemetry_chunks (pump_id, end_ts)')
+        self.store.execute('CREATE INDEX IF NOT EXISTS idx_telemetry_rollups_bucket ON telemetry_rollups (resolution, bucket)')
+
+    def ingest(self, pump_id, readings, received_at=None):
+        """Store a batch of {"timestamp" or "age_ms", "liters"} readings for one pump
+
+        liters is the volume dispensed since the previous reading.
+        Returns the number of readings stored.
+        """
+        return self.ingest_points(*self.prepare(pump_id, readings, received_at))
+
+    def prepare(self, pump_id, readings, received_at=None):
+        """(pump_id, points) for ingest_points, checked without storing anything
+
+        Raises TypeError or ValueError for a batch ingest() would reject.
+        """
+        if not isinstance(pump_id, str) or not pump_id:
+            raise TypeError("pump_id must be a non-empty string")
+        if not isinstance(readings, list) or not all(isinstance(r, dict) for r in readings):
+            raise TypeError("readings must be a list of objects")
+        received_at = received_at or time.time()
+
+        points = sorted(
+            (reading_time(r, received_at), float(r['liters']))
+            for r in readings if r.get('liters') is not None
+        )
+        return pump_id.upper(), points
+
+    def ingest_points(self, pump_id, points):
+        """Store readings returned by prepare(); returns how many"""
+        if not points:
+            return 0
+
+        # One upsert per touched bucket, however many readings the batch holds
+        rollups = {}
+        for timestamp, liters in points:
+            for resolution in RESOLUTIONS:
+                key = (resolution, bucket_start(timestamp, resolution))
+                total = rollups.get(key)
+                rollups[key] = (total[0] + liters, total[1] + 1) if total else (liters, 1)
+
+        for (resolution, bucket), (liters, count) in rollups.items():
+            self.store.insert('''
+                INSERT INTO telemetry_rollups (pump_id, resolution, bucket, liters, readings)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (pump_id, resolution, bucket) DO UPDATE SET
+                    liters = liters + excluded.liters,
+                    readings = readings + excluded.readings
+            ''', (pump_id, resolution, bucket, liters, count))
+
+        with self.lock:
+            chunk = self.open_chunks.setdefault(pump_id, Chunk())
+            for timestamp, liters in points:
+                chunk.append(timestamp, liters)
+            self.readings += len(points)
+            if len(chunk) >= self.chunk_size or chunk.timestamps[-1] - chunk.timestamps[0] >= self.chunk_seconds:
+                self._seal(pump_id)
+
+        return len(points)
+
+    def record_completion(self, pump_id, event_id, liters, duration=None):
+        """Measured liters for a water event, reported when the pump stops"""
+        return self.store.insert('''
+            INSERT OR REPLACE INTO pump_completions (event_id, pump_id, liters, duration_seconds)
+            VALUES (?, ?, ?, ?)
+        ''', (event_id, pump_id.upper(), liters, duration))
+
+    def liters_series(self, pump_id, since, until, resolution='hour'):
+        """[(bucket_start, liters)] for one pump from the rollups"""
+        rows = self.store.query('''
+            SELECT bucket, liters FROM telemetry_rollups
+            WHERE pump_id = ? AND resolution = ? AND bucket >= ? AND bucket < ?
+            ORDER BY bucket
+        ''', (pump_id.upper(), resolution, bucket_start(since, resolution), until))
+        return [(bucket, round(liters, 3)) for bucket, liters in rows]
+
+    def total_liters(self, since, until, pump_id=None):
+        """{pump_id: liters} over [since, until) to the minute
+
+        Whole days come from day rollups and the ragged ends from hour and
+        minute rollups, so a year-long query reads a few hundred rows.
+        """
+        clauses, params = [], []
+        for resolution, start, end in self._cover(since, until):
+            clauses.append("(resolution = ? AND bucket >= ? AND bucket < ?)")
+            params.extend((resolution, start, end))
+        if not clauses:
+            return {}
+
+        pump_filter = ""
+        if pump_id:
+            pump_filter = "pump_id = ? AND "
+            params.insert(0, pump_id.upper())
+
+        rows = self.store.query(f'''
+            SELECT pump_id, SUM(liters) FROM telemetry_rollups
+            WHERE {pump_filter}({' OR '.join(clauses)})
+            GROUP BY pump_id
+        ''', params)
+        return {pump: round(liters, 3) for pump, liters in rows}
+
+    def raw(self, pump_id, since, until):
+        """[(timestamp, liters)] readings, decoded from sealed chunks and the open one"""
+        pump_id = pump_id.upper()
+        rows = self.store.query('''
+            SELECT timestamps, liters FROM telemetry_chunks
+            WHERE pump_id = ? AND end_ts >= ? AND start_ts < ?
+            ORDER BY start_ts
+        ''', (pump_id, since, until))
+
+        chunks = []
+        for timestamps_blob, liters_blob in rows:
+            chunk = Chunk()
+            chunk.timestamps.frombytes(timestamps_blob)
+            chunk.liters.frombytes(liters_blob)
+            chunks.append(chunk)
+        with self.lock:
+            open_chunk = self.open_chunks.get(pump_id)
+            if open_chunk:
+                # Copy under the lock; the open chunk keeps growing
+                copy = Chunk()
+                copy.timestamps.extend(open_chunk.timestamps)
+                copy.liters.extend(open_chunk.liters)
+                chunks.append(copy)
+
+        return [
+            (t, l)
+            for chunk in chunks
+            for t, l in zip(chunk.timestamps, chunk.liters)
+            if since <= t < until
+        ]
+
+    def flush(self):
+        """Seal every open chunk (call before shutdown)"""
+        with self.lock:
+            for pump_id in list(self.open_chunks):
+                self._seal(pump_id)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'readings': self.readings,
+                'open_chunks': len(self.open_chunks),
+                'buffered_readings': sum(len(c) for c in self.open_chunks.values())
+            }
+
+    def _seal(self, pump_id):
+        """Write a pump's open chunk as one row (caller holds the lock)"""
+        chunk = self.open_chunks.pop(pump_id, None)
+        if not chunk:
+            return
+        self.store.insert('''
+            INSERT INTO telemetry_chunks (pump_id, start_ts, end_ts, readings, timestamps, liters)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (pump_id, min(chunk.timestamps), max(chunk.timestamps), len(chunk),
+              chunk.timestamps.tobytes(), chunk.liters.tobytes()))
+
+    def _cover(self, since, until):
+        """Split [since, until) into (resolution, start, end) ranges, coarsest in the middle"""
+        start = bucket_start(since, 'minute')
+        end = bucket_start(until, 'minute')
+        ranges = []
+
+        def split(lo, hi, resolution):
+            if resolution == 'minute':
+                if lo < hi:
+                    ranges.append(('minute', lo, hi))
+                return
+            finer = 'hour' if resolution == 'day' else 'minute'
+            width = RESOLUTIONS[resolution]
+            aligned_lo = -(-lo // width) * width
+            aligned_hi = hi // width * width
+            if aligned_lo >= aligned_hi:
+                split(lo, hi, finer)
+                return
+            split(lo, aligned_lo, finer)
+            ranges.append((resolution, aligned_lo, aligned_hi))
+            split(aligned_hi, hi, finer)
+
+        split(start, end, 'day')
+        return ranges
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The bridges are flat modules in src/ai-bridge
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
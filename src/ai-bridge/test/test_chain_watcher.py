@@ -0,0 +1,44 @@
+from web3 import Web3
+
+from chain_watcher import WaterBrokerWatcher
+from stub_chain_rpc import StubChainRPC
+
+BUYER = '0x' + '11' * 20
+
+
+def test_purchase_mined_before_expect_still_settles():
+    node = StubChainRPC().start()
+    try:
+        watcher = WaterBrokerWatcher(Web3(Web3.HTTPProvider(node.url)), node.contract_address)
+        watcher.poll_once()
+
+        # Automine: the watcher sees the block before the sender registers the payment
+        tx_hash = node.purchase(BUYER, 'PUMP001', 1)
+        watcher.poll_once()
+
+        matched = []
+        watcher.expect('PUMP001', lambda payment, event: matched.append(event['tx_hash']), tx_hash=tx_hash)
+        assert matched == [tx_hash.lower()]
+        assert watcher.pending_count() == 0
+    finally:
+        node.stop()
+
+
+def test_replacement_mined_before_add_tx_hash_still_settles():
+    node = StubChainRPC().start()
+    try:
+        watcher = WaterBrokerWatcher(Web3(Web3.HTTPProvider(node.url)), node.contract_address)
+        watcher.poll_once()
+
+        matched = []
+        watcher.expect('PUMP001', lambda payment, event: matched.append(event['tx_hash']),
+                       tx_hash='0x' + 'ab' * 32)
+        replacement = node.purchase(BUYER, 'PUMP001', 1)
+        watcher.poll_once()
+        assert matched == []
+
+        watcher.add_tx_hash('0x' + 'ab' * 32, replacement)
+        assert matched == [replacement.lower()]
+        assert watcher.pending_count() == 0
+    finally:
+        node.stop()
@@ -0,0 +1,44 @@
+import asyncio
+import importlib
+
+import pytest
+
+import majisafe_ai
+from stub_chain_rpc import StubChainRPC
+
+BUYER = '0x' + '42' * 20
+
+
+@pytest.fixture
+def node(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    node = StubChainRPC().start()
+    monkeypatch.setenv('RPC_URL', node.url)
+    monkeypatch.setenv('WATER_BROKER_ADDRESS', node.contract_address)
+    monkeypatch.setenv('PAYMENT_CONFIRMATION', 'manual')
+    yield node
+    node.stop()
+
+
+def test_confirmed_sms_payment_is_found_by_verify_water_payment(node):
+    client = majisafe_ai.create_app().test_client()
+    try:
+        sms = client.post('/process-sms', json={'phone': '+25779000001',
+                                                'message': 'PAY 5000 BIF PUMP001'}).get_json()
+        tx_hash = node.purchase(BUYER, 'PUMP001', 5)
+        confirmed = client.post('/blockchain-confirmed', json={'confirmation_id': sms['confirmation_id'],
+                                                               'tx_hash': tx_hash})
+        assert confirmed.status_code == 200
+    finally:
+        # Commits the queued sms_payments insert and its outcome update
+        majisafe_ai.shutdown()
+        majisafe_ai.ai = None
+
+    mcp_server = importlib.import_module('mcp_server')
+    result = asyncio.run(mcp_server.HANDLERS['verify_water_payment'](tx_hash=tx_hash, pump_id='PUMP001'))
+
+    assert result['verified']
+    assert result['recorded_payments'] == [{
+        'phone': '+25779000001', 'amount': 5000.0, 'currency': 'BIF', 'pump_id': 'PUMP001',
+        'status': 'confirmed', 'timestamp': result['recorded_payments'][0]['timestamp']
+    }]
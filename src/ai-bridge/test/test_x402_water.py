@@ -0,0 +1,100 @@
+import sqlite3
+import time
+
+import pytest
+from eth_account import Account
+
+import x402_water
+from stub_chain_rpc import StubChainRPC
+from x402_payments import sign_payment
+
+BUYER_KEY = '0x' + '42' * 32
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    node = StubChainRPC().start()
+
+    # One water event plus minute rollups inside the re-read overlap, so every
+    # refresh goes over this pump's data
+    now = int(time.time())
+    conn = sqlite3.connect('majisafe_dkg.db', isolation_level=None)
+    conn.execute('CREATE TABLE water_events (id INTEGER PRIMARY KEY, pump_id TEXT, '
+                 'liters_dispensed REAL, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)')
+    conn.execute("INSERT INTO water_events (pump_id, liters_dispensed) VALUES ('PUMP001', 10)")
+    conn.execute('CREATE TABLE telemetry_rollups (pump_id TEXT, resolution TEXT, bucket INTEGER, liters REAL)')
+    for minute in range(10):
+        conn.execute("INSERT INTO telemetry_rollups VALUES ('PUMP001', 'minute', ?, 2.5)",
+                     (now // 60 * 60 - 60 * minute,))
+    conn.close()
+
+    monkeypatch.setenv('X402_RPC_URL', node.url)
+    monkeypatch.setenv('WATER_BROKER_ADDRESS', node.contract_address)
+    monkeypatch.setenv('ANALYTICS_REFRESH', '0.05')
+    app = x402_water.create_app()
+    yield app.test_client(), node
+    stop_bridge()
+    node.stop()
+
+
+def stop_bridge():
+    x402_water.shutdown()
+    x402_water.analytics = x402_water.cache = x402_water.payments = None
+
+
+def test_repeat_query_in_unchanged_window_is_cached(client):
+    client, node = client
+    tx_hash = node.purchase(Account.from_key(BUYER_KEY).address, 'PUMP001', 1)
+    url = '/water-data/PUMP001?since=0&until=4102444800'
+
+    def get(nonce, **headers):
+        return client.get(url, headers={'X-Payment': sign_payment(BUYER_KEY, 'PUMP001', tx_hash, nonce),
+                                        **headers})
+
+    first = get(1)
+    assert first.status_code == 200
+    assert first.headers['X-Cache'] == 'MISS'
+
+    # Many refreshes later, with no new rows, the pump's data has not changed
+    refreshes = x402_water.analytics.refreshes
+    while x402_water.analytics.refreshes < refreshes + 5:
+        time.sleep(0.05)
+
+    repeat = get(2)
+    assert repeat.status_code == 200
+    assert repeat.headers['X-Cache'] == 'HIT'
+    assert repeat.headers['ETag'] == first.headers['ETag']
+
+    revalidated = get(3, **{'If-None-Match': first.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert x402_water.cache.metrics()['invalidations'] == 0
+
+
+def test_etag_follows_content_across_restarts(client):
+    client, node = client
+    tx_hash = node.purchase(Account.from_key(BUYER_KEY).address, 'PUMP001', 1)
+    url = '/water-data/PUMP001?since=0&until=4102444800'
+
+    def get(client, nonce, **headers):
+        return client.get(url, headers={'X-Payment': sign_payment(BUYER_KEY, 'PUMP001', tx_hash, nonce),
+                                        **headers})
+
+    first = get(client, 1)
+    assert first.status_code == 200
+
+    # Another worker (or this one after a restart) with the same data agrees on the tag
+    stop_bridge()
+    restarted = x402_water.create_app().test_client()
+    assert get(restarted, 2, **{'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    # After a restart with new data the pump's version counter starts over at
+    # the same value, but the body differs, so the old tag must not match
+    stop_bridge()
+    conn = sqlite3.connect('majisafe_dkg.db', isolation_level=None)
+    conn.execute("INSERT INTO water_events (pump_id, liters_dispensed) VALUES ('PUMP001', 20)")
+    conn.close()
+    restarted = x402_water.create_app().test_client()
+    changed = get(restarted, 3, **{'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != first.headers['ETag']
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Transaction Throughput Benchmark - Sequential buyWater vs the nonce-managed pipeline
+Against the project's Hardhat network:
+    cd src/blockchain && npx hardhat node
+    npx hardhat run scripts/deploy.js --network localhost
+    python tx_throughput_benchmark.py <WaterBroker address> [count] [rpc_url]
+"""
+
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from web3 import Web3
+from web3.exceptions import TransactionNotFound
+
+from nonce_manager import BUY_WATER_ABI, TransactionPipeline
+
+# Hardhat's first well-known dev account - never use outside a local node
+HARDHAT_KEY = '0xac0974bec39a17e36ba4a6b4d238ff944bacb478cbed5efcae784d7bf4f2ff80'
+
+
+def wait_for_receipts(w3, tx_hashes, timeout=300):
+    remaining = set(tx_hashes)
+    deadline = time.monotonic() + timeout
+    while remaining and time.monotonic() < deadline:
+        for tx_hash in list(remaining):
+            try:
+                w3.eth.get_transaction_receipt(tx_hash)
+                remaining.discard(tx_hash)
+            except TransactionNotFound:
+                pass
+        if remaining:
+            time.sleep(0.2)
+    return len(tx_hashes) - len(remaining)
+
+
+def bench_sequential(w3, contract_address, count, private_key):
+    """The original flow: fetch nonce, send, wait for the receipt, repeat"""
+    account = w3.eth.account.from_key(private_key)
+    contract = w3.eth.contract(address=contract_address, abi=BUY_WATER_ABI)
+    pump_id = w3.keccak(text='PUMP001')
+
+    start = time.perf_counter()
+    for _ in range(count):
+        tx = contract.functions.buyWater(pump_id).build_transaction({
+            'from': account.address,
+            'value': w3.to_wei(0.001, 'ether'),
+            'gas': 200000,
+            'gasPrice': w3.eth.gas_price,
+            'nonce': w3.eth.get_transaction_count(account.address)
+        })
+        signed = account.sign_transaction(tx)
+        w3.eth.wait_for_transaction_receipt(w3.eth.send_raw_transaction(signed.rawTransaction))
+    return count, time.perf_counter() - start
+
+
+def bench_pipeline(w3, contract_address, count, private_key, workers=16):
+    pipeline = TransactionPipeline(w3, private_key, contract_address)
+    pump_id = w3.keccak(text='PUMP001')
+    value = w3.to_wei(0.001, 'ether')
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        tx_hashes = list(pool.map(lambda _: pipeline.buy_water(pump_id, value), range(count)))
+    confirmed = wait_for_receipts(w3, tx_hashes)
+    return confirmed, time.perf_counter() - start
+
+
+def benchmark(w3, contract_address, count=100, private_key=HARDHAT_KEY):
+    contract_address = Web3.to_checksum_address(contract_address)
+
+    confirmed, elapsed = bench_sequential(w3, contract_address, count, private_key)
+    print(f"🐢 Sequential: {confirmed / elapsed:8.1f} tx/s ({confirmed}/{count} confirmed in {elapsed:.2f}s)")
+
+    confirmed, elapsed = bench_pipeline(w3, contract_address, count, private_key)
+    print(f"🚀 Pipeline:   {confirmed / elapsed:8.1f} tx/s ({confirmed}/{count} confirmed in {elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    contract_address = sys.argv[1]
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    rpc_url = sys.argv[3] if len(sys.argv) > 3 else 'http://127.0.0.1:8545'
+
+    w3 = Web3(Web3.HTTPProvider(rpc_url))
+    print(f"🔗 {rpc_url} (chain {w3.eth.chain_id}), {count} buyWater transactions each")
+    benchmark(w3, contract_address, count)
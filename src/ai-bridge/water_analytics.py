@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+Water Analytics - Per-pump analytics for the x402 /water-data endpoint
+Columnar NumPy arrays per pump, refreshed incrementally from water_events,
+sms_payments and the telemetry rollups; queries slice them with searchsorted
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from storage import connect
+
+PERCENTILES = (50, 90, 99)
+
+
+def to_epoch(timestamps):
+    """SQLite CURRENT_TIMESTAMP strings -> int64 epoch seconds, in one call"""
+    return np.array(timestamps, dtype='datetime64[s]').astype(np.int64)
+
+
+class Column:
+    """Append-only float64/int64 array with amortized doubling"""
+
+    def __init__(self, dtype):
+        self.data = np.empty(64, dtype=dtype)
+        self.size = 0
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self.data.dtype)
+        needed = self.size + len(values)
+        if needed > len(self.data):
+            grown = np.empty(max(needed, 2 * len(self.data)), dtype=self.data.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:needed] = values
+        self.size = needed
+
+    def truncate(self, size):
+        self.size = size
+
+    def view(self):
+        return self.data[:self.size]
+
+    def last(self, default=0):
+        return self.data[self.size - 1] if self.size else default
+
+
+class PumpSeries:
+    """Everything known about one pump, as parallel sorted columns plus prefix sums"""
+
+    def __init__(self):
+        # Dispensing events (water_events)
+        self.event_ts = Column(np.int64)
+        self.event_liters = Column(np.float64)
+        self.event_liters_cum = Column(np.float64)
+        # Materialized liters per clock hour (hours with usage only)
+        self.hour_bucket = Column(np.int64)
+        self.hour_liters = Column(np.float64)
+
+        # Confirmed payments (sms_payments): currency as a small int code
+        self.payment_ts = Column(np.int64)
+        self.payment_amount = Column(np.float64)
+        self.payment_currency = Column(np.int16)
+
+        # Measured flow: liters per minute bucket from the telemetry rollups
+        self.flow_bucket = Column(np.int64)
+        self.flow_liters = Column(np.float64)
+
+        self.version = 0
+
+    def replace_events_from(self, start, ts, liters):
+        """Re-read tail of events from start (an hour boundary); False if nothing changed
+
+        Liters are updated in place when the pump reports its completion, so
+        recent events are compared rather than only appended.
+        """
+        order = np.argsort(ts, kind='stable')
+        ts, liters = ts[order], liters[order]
+        keep = int(np.searchsorted(self.event_ts.view(), start, side='left'))
+        if (np.array_equal(self.event_ts.view()[keep:], ts)
+                and np.array_equal(self.event_liters.view()[keep:], liters)):
+            return False
+
+        base = self.event_liters_cum.data[keep - 1] if keep else 0.0
+        for column in (self.event_ts, self.event_liters, self.event_liters_cum):
+            column.truncate(keep)
+        self.event_ts.extend(ts)
+        self.event_liters.extend(liters)
+        self.event_liters_cum.extend(base + np.cumsum(liters))
+
+        # start is on an hour boundary, so every hour from it on is rebuilt whole
+        hour_keep = int(np.searchsorted(self.hour_bucket.view(), start // 3600, side='left'))
+        self.hour_bucket.truncate(hour_keep)
+        self.hour_liters.truncate(hour_keep)
+        if ts.size:
+            hours, starts = np.unique(ts // 3600, return_index=True)
+            self.hour_bucket.extend(hours)
+            self.hour_liters.extend(np.add.reduceat(liters, starts))
+        self.version += 1
+        return True
+
+    def replace_payments_from(self, start, ts, amounts, currencies):
+        """Re-read tail of confirmed payments from start; False if nothing changed
+
+        An SMS payment only counts once it is confirmed, which can be minutes
+        after its row was written.
+        """
+        order = np.argsort(ts, kind='stable')
+        ts, amounts, currencies = ts[order], amounts[order], currencies[order]
+        columns = (self.payment_ts, self.payment_amount, self.payment_currency)
+        keep = int(np.searchsorted(self.payment_ts.view(), start, side='left'))
+        if all(np.array_equal(column.view()[keep:], values)
+               for column, values in zip(columns, (ts, amounts, currencies))):
+            return False
+
+        for column, values in zip(columns, (ts, amounts, currencies)):
+            column.truncate(keep)
+            column.extend(values)
+        self.version += 1
+        return True
+
+    def replace_flow_from(self, start_bucket, buckets, liters):
+        """Rollup buckets change in place, so the tail from start_bucket is re-read
+
+        Returns False (and keeps the version) when the re-read tail is unchanged.
+        """
+        keep = int(np.searchsorted(self.flow_bucket.view(), start_bucket, side='left'))
+        if (np.array_equal(self.flow_bucket.view()[keep:], buckets)
+                and np.array_equal(self.flow_liters.view()[keep:], liters)):
+            return False
+        self.flow_bucket.truncate(keep)
+        self.flow_liters.truncate(keep)
+        self.flow_bucket.extend(buckets)
+        self.flow_liters.extend(liters)
+        self.version += 1
+        return True
+
+
+class WaterAnalytics:
+    def __init__(self, events_db='majisafe_dkg.db', payments_db='majisafe_payments.db',
+                 refresh_interval=5.0, flow_overlap=3600, event_overlap=3600, payment_overlap=3600):
+        """
+        refresh_interval: seconds between incremental refreshes in the background
+        flow_overlap: seconds of minute rollups re-read on each refresh (still being filled)
+        event_overlap: seconds of water events re-read on each refresh (liters are
+            corrected when the pump reports its completion)
+        payment_overlap: seconds of payments re-read on each refresh (they are
+            confirmed after their row is written)
+        """
+        self.events_db = events_db
+        self.payments_db = payments_db
+        self.refresh_interval = refresh_interval
+        self.flow_overlap = flow_overlap
+        self.event_overlap = event_overlap
+        self.payment_overlap = payment_overlap
+
+        self.lock = threading.Lock()
+        self.pumps = {}
+        self.currencies = []
+        self.currency_codes = {}
+
+        # High-water marks for the incremental refresh
+        self.last_event_ts = 0
+        self.last_payment_ts = 0
+        self.last_flow_bucket = 0
+        self.refreshes = 0
+        self.last_refresh = None
+
+        # Called with the set of pump ids whose data changed on a refresh
+        self.listeners = []
+        self.changed = set()
+
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.refresh()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="water-analytics")
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+
+    def on_change(self, callback):
+        """callback(pump_ids) after each refresh that changed some pump's data"""
+        self.listeners.append(callback)
+
+    def refresh(self):
+        """Pull rows added or changed since the last refresh
+
+        Returns the number of rows read for pumps whose data changed.
+        """
+        self.changed = set()
+        added = 0
+        if os.path.exists(self.events_db):
+            conn = connect(self.events_db)
+            try:
+                added += self._refresh_events(conn)
+                added += self._refresh_flow(conn)
+            finally:
+                conn.close()
+        if os.path.exists(self.payments_db):
+            conn = connect(self.payments_db)
+            try:
+                added += self._refresh_payments(conn)
+            finally:
+                conn.close()
+
+        self.refreshes += 1
+        self.last_refresh = time.time()
+        if self.changed:
+            for callback in self.listeners:
+                callback(self.changed)
+        return added
+
+    def pump_ids(self):
+        return sorted(self.pumps)
+
+    def version(self, pump_id):
+        series = self.pumps.get(pump_id.upper())
+        return series.version if series else 0
+
+    def pump_report(self, pump_id, since=None, until=None, now=None):
+        """Analytics for one pump over [since, until); None if the pump is unknown"""
+        series = self.pumps.get(pump_id.upper())
+        if series is None:
+            return None
+
+        now = now or time.time()
+        until = until or now
+        since = since if since is not None else until - 30 * 86400
+
+        with self.lock:
+            events = self._events_report(series, since, until)
+            flow = self._flow_report(series, since, until)
+            revenue = self._revenue_report(series, since, until)
+            anomalies = self._anomalies(series, now)
+
+        return {
+            "pump_id": pump_id.upper(),
+            "window": {"since": int(since), "until": int(until)},
+            "flow_rate": f"{flow['p50']} L/min" if flow else None,
+            "flow_rate_lpm": flow,
+            "usage": events,
+            "revenue": revenue,
+            "anomalies": anomalies
+        }
+
+    def status(self):
+        return {
+            "pumps": len(self.pumps),
+            "events": sum(s.event_ts.size for s in self.pumps.values()),
+            "payments": sum(s.payment_ts.size for s in self.pumps.values()),
+            "flow_minutes": sum(s.flow_bucket.size for s in self.pumps.values()),
+            "refreshes": self.refreshes,
+            "last_refresh": self.last_refresh
+        }
+
+    def _series(self, pump_id):
+        series = self.pumps.get(pump_id)
+        if series is None:
+            series = self.pumps[pump_id] = PumpSeries()
+        return series
+
+    def _currency_code(self, currency):
+        code = self.currency_codes.get(currency)
+        if code is None:
+            code = self.currency_codes[currency] = len(self.currencies)
+            self.currencies.append(currency)
+        return code
+
+    def _timestamp(self, epoch):
+        """Epoch seconds in SQLite's CURRENT_TIMESTAMP format (UTC)"""
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(epoch))
+
+    def _query(self, conn, sql, params):
+        # The bridge that owns the table may not have created it yet
+        try:
+            return conn.execute(sql, params).fetchall()
+        except sqlite3.OperationalError:
+            return []
+
+    def _refresh_events(self, conn):
+        # Whole hours, so the hourly totals from start on can be rebuilt
+        start = max(self.last_event_ts - self.event_overlap, 0) // 3600 * 3600
+        rows = self._query(conn, '''
+            SELECT pump_id, liters_dispensed, timestamp FROM water_events
+            WHERE timestamp >= ? ORDER BY timestamp, id
+        ''', (self._timestamp(start),))
+        if not rows:
+            return 0
+
+        pumps, liters, stamps = zip(*rows)
+        ts = to_epoch(stamps)
+        liters = np.array(liters, dtype=np.float64)
+        pumps = np.array(pumps)
+
+        changed = 0
+        with self.lock:
+            for pump_id in np.unique(pumps):
+                mask = pumps == pump_id
+                if self._series(str(pump_id)).replace_events_from(start, ts[mask], liters[mask]):
+                    self.changed.add(str(pump_id))
+                    changed += int(mask.sum())
+            self.last_event_ts = int(ts.max())
+        return changed
+
+    def _refresh_payments(self, conn):
+        start = max(self.last_payment_ts - self.payment_overlap, 0)
+        rows = self._query(conn, '''
+            SELECT pump_id, amount, currency, timestamp FROM sms_payments
+            WHERE status = 'confirmed' AND timestamp >= ? ORDER BY timestamp, id
+        ''', (self._timestamp(start),))
+        if not rows:
+            return 0
+
+        pumps, amounts, currencies, stamps = zip(*rows)
+        ts = to_epoch(stamps)
+        amounts = np.array(amounts, dtype=np.float64)
+        pumps = np.array(pumps)
+
+        changed = 0
+        with self.lock:
+            codes = np.array([self._currency_code(c) for c in currencies], dtype=np.int16)
+            for pump_id in np.unique(pumps):
+                mask = pumps == pump_id
+                if self._series(str(pump_id)).replace_payments_from(start, ts[mask], amounts[mask], codes[mask]):
+                    self.changed.add(str(pump_id))
+                    changed += int(mask.sum())
+            self.last_payment_ts = int(ts.max())
+        return changed
+
+    def _refresh_flow(self, conn):
+        start = max(self.last_flow_bucket - self.flow_overlap, 0)
+        rows = self._query(conn, '''
+            SELECT pump_id, bucket, liters FROM telemetry_rollups
+            WHERE resolution = 'minute' AND bucket >= ?
+            ORDER BY pump_id, bucket
+        ''', (start,))
+        if not rows:
+            return 0
+
+        pumps, buckets, liters = zip(*rows)
+        pumps = np.array(pumps)
+        buckets = np.array(buckets, dtype=np.int64)
+        liters = np.array(liters, dtype=np.float64)
+
+        changed = 0
+        with self.lock:
+            for pump_id in np.unique(pumps):
+                mask = pumps == pump_id
+                if self._series(str(pump_id)).replace_flow_from(start, buckets[mask], liters[mask]):
+                    self.changed.add(str(pump_id))
+                    changed += int(mask.sum())
+            self.last_flow_bucket = int(buckets.max())
+        return changed
+
+    def _events_report(self, series, since, until):
+        ts = series.event_ts.view()
+        lo, hi = np.searchsorted(ts, [since, until])
+        cum = series.event_liters_cum.view()
+        # Prefix sums: total liters in the window without touching each event
+        total = (cum[hi - 1] if hi else 0.0) - (cum[lo - 1] if lo else 0.0)
+
+        hours = (ts[lo:hi] // 3600) % 24
+        per_hour = np.bincount(hours, weights=series.event_liters.view()[lo:hi], minlength=24)
+        return {
+            "events": int(hi - lo),
+            "liters": round(float(total), 3),
+            "liters_per_hour_of_day": [round(float(v), 3) for v in per_hour],
+            "peak_hour": int(per_hour.argmax()) if hi > lo else None
+        }
+
+    def _flow_report(self, series, since, until):
+        buckets = series.flow_bucket.view()
+        lo, hi = np.searchsorted(buckets, [since, until])
+        if hi <= lo:
+            return None
+        values = np.percentile(series.flow_liters.view()[lo:hi], PERCENTILES)
+        report = {f"p{p}": round(float(v), 3) for p, v in zip(PERCENTILES, values)}
+        report["minutes"] = int(hi - lo)
+        return report
+
+    def _revenue_report(self, series, since, until):
+        ts = series.payment_ts.view()
+        lo, hi = np.searchsorted(ts, [since, until])
+        codes = series.payment_currency.view()[lo:hi]
+        totals = np.bincount(codes, weights=series.payment_amount.view()[lo:hi],
+                             minlength=len(self.currencies))
+        counts = np.bincount(codes, minlength=len(self.currencies))
+        return {
+            self.currencies[code]: {"amount": round(float(totals[code]), 2), "payments": int(counts[code])}
+            for code in np.flatnonzero(counts)
+        }
+
+    def _anomalies(self, series, now):
+        flags = []
+
+        # Flow in the last hour well under the past week's: clogged filter or leak
+        buckets = series.flow_bucket.view()
+        flow = series.flow_liters.view()
+        week, recent = np.searchsorted(buckets, [now - 7 * 86400, now - 3600])
+        if flow.size - recent >= 5 and recent - week >= 60:
+            usual = np.median(flow[week:recent])
+            if usual > 0 and np.median(flow[recent:]) < 0.5 * usual:
+                flags.append("low_flow")
+
+        # Liters this hour far above the last 30 days of active hours
+        hours = series.hour_bucket.view()
+        hourly = series.hour_liters.view()
+        if hours.size > 24 and hours[-1] == int(now // 3600):
+            history = hourly[-721:-1]
+            if hourly[-1] > history.mean() + 3 * history.std():
+                flags.append("usage_spike")
+
+        # Recent events dispensing much less than usual
+        liters = series.event_liters.view()
+        if liters.size >= 20:
+            typical = np.median(liters[-500:])
+            if typical > 0 and np.mean(liters[-20:] < 0.5 * typical) > 0.25:
+                flags.append("short_dispense")
+
+        # Paid events in the last day but no flow recorded: sensor or pump fault
+        ts = series.event_ts.view()
+        if ts.size and ts[-1] >= now - 86400:
+            if not buckets.size or buckets[-1] < now - 86400:
+                flags.append("no_flow_telemetry")
+
+        return flags
+
+    def _run(self):
+        while self.running:
+            time.sleep(self.refresh_interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"❌ Analytics refresh error: {e}")
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+x402 Payments - Verifies X-Payment proofs for paid water-data queries
+A WaterBroker purchase is looked up on chain once, then spent from a local quota
+"""
+
+import base64
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from eth_account import Account
+from eth_account.messages import encode_defunct
+from web3 import Web3
+from web3.exceptions import TransactionNotFound
+
+from chain_watcher import decode_purchase, pump_id_keys
+
+TX_HASH = re.compile(r'^0x[0-9a-f]{64}$')
+
+NOT_FOUND = "Payment not found on chain"
+NOT_CONFIRMED = "Payment not confirmed yet"
+LOOKUP_FAILED = "Payment lookup failed"
+
+
+def payment_message(pump_id, tx_hash, nonce):
+    """Text the payer signs (EIP-191) for one query against one purchase"""
+    return f"MajiSafe x402 {pump_id.upper()} {tx_hash.lower()} {nonce}"
+
+
+def sign_payment(private_key, pump_id, tx_hash, nonce):
+    """X-Payment header value for a client holding the buyer's key"""
+    signed = Account.sign_message(encode_defunct(text=payment_message(pump_id, tx_hash, nonce)), private_key)
+    payload = {'tx_hash': tx_hash.lower(), 'nonce': nonce, 'signature': signed.signature.hex()}
+    return base64.b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_payment(header):
+    """(tx_hash, nonce, signature) from an X-Payment header; raises ValueError"""
+    try:
+        payload = json.loads(base64.b64decode(header, validate=True))
+        tx_hash = str(payload['tx_hash']).lower()
+        nonce = int(payload['nonce'])
+        signature = str(payload['signature'])
+    except Exception:
+        raise ValueError("Malformed X-Payment header")
+    if not TX_HASH.match(tx_hash) or nonce < 1:
+        raise ValueError("Malformed X-Payment header")
+    return tx_hash, nonce, signature
+
+
+class PaymentVerifier:
+    def __init__(self, w3, contract_address, store, queries_per_credit=100, confirmations=1,
+                 receipt_ttl=86400, retry_after=5, capacity=10000):
+        """
+        store: SQLiteStore holding x402_receipts; usage is counted there so
+               restarts and sibling workers cannot replay a spent query
+        queries_per_credit: paid queries per WaterBroker credit bought
+        receipt_ttl: seconds a verified purchase can be spent after first use
+        retry_after: seconds an unknown or unconfirmed tx is not re-fetched
+        """
+        self.w3 = w3
+        self.contract_address = Web3.to_checksum_address(contract_address)
+        self.store = store
+        self.queries_per_credit = queries_per_credit
+        self.confirmations = confirmations
+        self.receipt_ttl = receipt_ttl
+        self.retry_after = retry_after
+        self.capacity = capacity
+
+        self.lock = threading.Lock()
+        # tx_hash -> verified receipt (immutable facts only; usage lives in SQLite)
+        self.receipts = OrderedDict()
+        # tx_hash -> (retry_at, error) for purchases that did not verify
+        self.rejected = OrderedDict()
+        # tx_hash -> Future, so concurrent first uses share one chain lookup
+        self.inflight = {}
+
+        self.accepted = 0
+        self.cache_hits = 0
+        self.chain_lookups = 0
+        self.rejections = {}
+
+        self.init_db()
+
+    def init_db(self):
+        self.store.execute('''
+            CREATE TABLE IF NOT EXISTS x402_receipts (
+                tx_hash TEXT PRIMARY KEY,
+                payer TEXT NOT NULL,
+                pump_key TEXT NOT NULL,
+                pump_id TEXT,
+                credits INTEGER NOT NULL,
+                quota INTEGER NOT NULL,
+                used INTEGER NOT NULL DEFAULT 0,
+                last_nonce INTEGER NOT NULL DEFAULT 0,
+                block_number INTEGER,
+                verified_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            ) WITHOUT ROWID
+        ''')
+
+    def verify(self, header, pump_id):
+        """Spend one query of the purchase in an X-Payment header
+
+        Returns (receipt, None) with 'remaining' filled in, or (None, error).
+        Only the first use of a purchase touches the chain; after that it is
+        a signature recovery and one conditional UPDATE.
+        """
+        try:
+            tx_hash, nonce, signature = decode_payment(header)
+            payer = Account.recover_message(
+                encode_defunct(text=payment_message(pump_id, tx_hash, nonce)), signature=signature)
+        except ValueError as e:
+            return self._reject(str(e))
+        except Exception:
+            return self._reject("Invalid payment signature")
+
+        receipt, error = self._receipt(tx_hash)
+        if error:
+            return self._reject(error)
+        if payer != receipt['payer']:
+            return self._reject("Payment was signed by someone other than the buyer")
+        if bytes.fromhex(receipt['pump_key']) not in pump_id_keys(pump_id.upper()):
+            return self._reject("Payment was for another pump")
+
+        # Atomic across threads and worker processes: each nonce and each unit
+        # of quota can be spent exactly once
+        now = time.time()
+        spent = self.store.execute('''
+            UPDATE x402_receipts SET used = used + 1, last_nonce = ?
+            WHERE tx_hash = ? AND used < quota AND last_nonce < ? AND expires_at > ?
+        ''', (nonce, tx_hash, nonce, now)).rowcount
+        if not spent:
+            return self._reject(self._spend_error(tx_hash, nonce, now))
+
+        used, quota = self.store.query(
+            'SELECT used, quota FROM x402_receipts WHERE tx_hash = ?', (tx_hash,))[0]
+        with self.lock:
+            self.accepted += 1
+        return {**receipt, 'nonce': nonce, 'remaining': quota - used}, None
+
+    def stats(self):
+        with self.lock:
+            return {
+                'accepted': self.accepted,
+                'receipt_cache_hits': self.cache_hits,
+                'chain_lookups': self.chain_lookups,
+                'cached_receipts': len(self.receipts),
+                'rejected': dict(self.rejections)
+            }
+
+    def _receipt(self, tx_hash):
+        """Verified receipt for a purchase: memory, then SQLite, then the chain"""
+        now = time.time()
+        with self.lock:
+            receipt = self.receipts.get(tx_hash)
+            if receipt:
+                self.receipts.move_to_end(tx_hash)
+                self.cache_hits += 1
+                return receipt, None
+            rejected = self.rejected.get(tx_hash)
+            if rejected and rejected[0] > now:
+                return None, rejected[1]
+
+            future = self.inflight.get(tx_hash)
+            leader = future is None
+            if leader:
+                future = self.inflight[tx_hash] = Future()
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = self._load(tx_hash)
+        except Exception as e:
+            print(f"❌ x402 payment lookup error: {e}")
+            result = (None, LOOKUP_FAILED)
+        with self.lock:
+            receipt, error = result
+            if receipt:
+                self._remember(self.receipts, tx_hash, receipt)
+            elif error != LOOKUP_FAILED:
+                # Pending transactions get another look soon; bad ones do not
+                retry = self.retry_after if error in (NOT_FOUND, NOT_CONFIRMED) else self.receipt_ttl
+                self._remember(self.rejected, tx_hash, (now + retry, error))
+            del self.inflight[tx_hash]
+        future.set_result(result)
+        return result
+
+    def _load(self, tx_hash):
+        rows = self.store.query('''
+            SELECT payer, pump_key, pump_id, credits, quota, block_number, expires_at
+            FROM x402_receipts WHERE tx_hash = ?
+        ''', (tx_hash,))
+        if rows:
+            payer, pump_key, pump_id, credits, quota, block_number, expires_at = rows[0]
+            return {
+                'tx_hash': tx_hash, 'payer': payer, 'pump_key': pump_key, 'pump_id': pump_id,
+                'credits': credits, 'quota': quota, 'block_number': block_number,
+                'expires_at': expires_at
+            }, None
+
+        with self.lock:
+            self.chain_lookups += 1
+        try:
+            tx_receipt = self.w3.eth.get_transaction_receipt(tx_hash)
+        except TransactionNotFound:
+            return None, NOT_FOUND
+        if tx_receipt['status'] != 1:
+            return None, "Payment transaction reverted"
+        if self.w3.eth.block_number - tx_receipt['blockNumber'] + 1 < self.confirmations:
+            return None, NOT_CONFIRMED
+
+        event = decode_purchase(tx_receipt, self.contract_address)
+        if not event:
+            return None, "Transaction is not a WaterBroker purchase"
+
+        credits = event['credits']
+        now = time.time()
+        receipt = {
+            'tx_hash': tx_hash,
+            'payer': event['user'],
+            'pump_key': event['pump_id_bytes'].hex(),
+            'pump_id': event['pump_id'],
+            'credits': credits,
+            'quota': credits * self.queries_per_credit,
+            'block_number': tx_receipt['blockNumber'],
+            'expires_at': now + self.receipt_ttl
+        }
+        # Another worker may have verified it first; its row (and usage) wins
+        self.store.execute('''
+            INSERT OR IGNORE INTO x402_receipts
+                (tx_hash, payer, pump_key, pump_id, credits, quota, block_number, verified_at, expires_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (tx_hash, receipt['payer'], receipt['pump_key'], receipt['pump_id'], credits,
+              receipt['quota'], receipt['block_number'], now, receipt['expires_at']))
+        print(f"🔗 x402 purchase verified: {tx_hash[:12]}... {credits} credits for {receipt['pump_id']}")
+        return receipt, None
+
+    def _spend_error(self, tx_hash, nonce, now):
+        used, quota, last_nonce, expires_at = self.store.query(
+            'SELECT used, quota, last_nonce, expires_at FROM x402_receipts WHERE tx_hash = ?',
+            (tx_hash,))[0]
+        if expires_at <= now:
+            return "Payment has expired"
+        if nonce <= last_nonce:
+            return "Payment nonce already used"
+        return f"Payment quota of {quota} queries used up"
+
+    def _reject(self, error):
+        with self.lock:
+            self.rejections[error] = self.rejections.get(error, 0) + 1
+        return None, error
+
+    def _remember(self, entries, tx_hash, value):
+        """Bounded insert into an LRU map (caller holds the lock)"""
+        entries[tx_hash] = value
+        entries.move_to_end(tx_hash)
+        while len(entries) > self.capacity:
+            entries.popitem(last=False)
+
+
+if __name__ == "__main__":
+    # Local check: npx hardhat node, deploy WaterBroker, buyWater(pump) from an account, then
+    # curl -H "X-Payment: $(python x402_payments.py <key> PUMP001 <tx hash> 1)" \
+    #      http://localhost:5003/water-data/PUMP001
+    import sys
+    key, pump, tx, nonce = sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4]) if len(sys.argv) > 4 else 1
+    print(sign_payment(key, pump, tx, nonce))
@@ -1,32 +1,136 @@
 #!/usr/bin/env python3
 """x402 Micropayments for Premium Water Data Access"""
 
-from flask import Flask, request, jsonify
-import hashlib
+from flask import Blueprint, Flask, current_app, request, jsonify
+import base64
+import json
+import os
+import time
 
-app = Flask(__name__)
+bp = Blueprint('x402_water', __name__)
 
-@app.route('/water-data/<pump_id>')
+from lazy import web3_client
+from storage import SQLiteStore
+from water_analytics import WaterAnalytics
+from response_cache import ResponseCache, make_etag
+from x402_payments import PaymentVerifier, payment_message
+from metrics import instrument
+
+# Built by create_app() in the worker process, so importing this module opens nothing
+analytics = None
+cache = None
+payments = None
+
+def create_app():
+    global analytics, cache, payments
+    if analytics is None:
+        # Reads the bridges' databases; refreshed incrementally in the background
+        analytics = WaterAnalytics(
+            events_db=os.environ.get('WATER_EVENTS_DB', 'majisafe_dkg.db'),
+            payments_db=os.environ.get('PAYMENTS_DB', 'majisafe_payments.db'),
+            refresh_interval=float(os.environ.get('ANALYTICS_REFRESH', 5))
+        ).start()
+
+        # Paid queries repeat; identical ones are served from here until the pump gets new data
+        cache = ResponseCache(
+            capacity=int(os.environ.get('X402_CACHE_SIZE', 2048)),
+            ttl=float(os.environ.get('X402_CACHE_TTL', 60))
+        )
+        analytics.on_change(cache.invalidate)
+
+        # Queries are paid for by WaterBroker purchases; each one is checked on chain once
+        payments = PaymentVerifier(
+            w3=web3_client(os.environ.get('X402_RPC_URL', 'https://sepolia.base.org')),
+            contract_address=os.environ.get('WATER_BROKER_ADDRESS', '0x4933781A5DDC86bdF9c9C9795647e763E0429E28'),
+            store=SQLiteStore(os.environ.get('X402_DB', 'majisafe_x402.db')),
+            queries_per_credit=int(os.environ.get('X402_QUERIES_PER_CREDIT', 100)),
+            confirmations=int(os.environ.get('X402_CONFIRMATIONS', 1))
+        )
+    app = Flask(__name__)
+    app.register_blueprint(bp)
+    return instrument(app, 'x402_water')
+
+def shutdown():
+    """Stop the analytics refresh and commit queued quota updates"""
+    if analytics:
+        analytics.stop()
+        payments.store.close()
+
+def payment_required(pump_id, error="Payment required"):
+    return jsonify({
+        "error": error,
+        "x402": {
+            "amount": "0.001",
+            "currency": "ETH",
+            "contract": payments.contract_address,
+            "method": "buyWater(bytes32 pumpId)",
+            "queries_per_credit": payments.queries_per_credit,
+            "header": "X-Payment",
+            "sign": payment_message(pump_id, "<tx_hash>", "<nonce>")
+        }
+    }), 402
+
+def query_window(args):
+    """since/until as epoch seconds, or days back from until (default 30)
+
+    An open-ended window runs to the end of the current minute, so repeat
+    queries share a cache key.
+    """
+    until = float(args['until']) if args.get('until') else (time.time() // 60 + 1) * 60
+    if args.get('since'):
+        return float(args['since']), until
+    return until - float(args.get('days', 30)) * 86400, until
+
+@bp.route('/water-data/<pump_id>')
 def get_water_data(pump_id):
+    pump_id = pump_id.upper()
+    try:
+        since, until = query_window(request.args)
+    except ValueError:
+        return jsonify({"error": "since, until and days must be numbers"}), 400
+    # Unknown pumps are turned away before any quota is spent
+    if not analytics.version(pump_id):
+        return jsonify({"error": f"No data for pump {pump_id}"}), 404
+
     # Check x402 payment header
-    payment_header = request.headers.get('X-Payment-Required')
+    payment_header = request.headers.get('X-Payment')
     if not payment_header:
-        return jsonify({
-            "error": "Payment required",
-            "x402": {
-                "amount": "0.001",
-                "currency": "TRAC",
-                "endpoint": f"/pay/{pump_id}"
-            }
-        }), 402
-    
-    # Return premium water analytics
-    return jsonify({
-        "pump_id": pump_id,
-        "flow_rate": "10.5 L/min",
-        "quality_score": 0.95,
-        "maintenance_due": "2024-12-15"
+        return payment_required(pump_id)
+    receipt, error = payments.verify(payment_header, pump_id)
+    if error:
+        return payment_required(pump_id, error)
+    payment_response = base64.b64encode(json.dumps({
+        "tx_hash": receipt['tx_hash'],
+        "remaining": receipt['remaining']
+    }).encode()).decode()
+
+    key = (pump_id, since, until)
+    cached = cache.get(key)
+    if cached:
+        etag, body = cached
+    else:
+        # Premium water analytics from the in-memory aggregates
+        report = analytics.pump_report(pump_id, since, until)
+        if report is None:
+            return jsonify({"error": f"No data for pump {pump_id}"}), 404
+        body = jsonify(report).get_data()
+        etag = make_etag(body)
+        cache.put(key, etag, body)
+
+    if request.if_none_match.contains(etag):
+        cache.record_not_modified()
+        return '', 304, {'ETag': f'"{etag}"', 'X-Payment-Response': payment_response}
+
+    return current_app.response_class(body, mimetype='application/json', headers={
+        'ETag': f'"{etag}"',
+        'X-Cache': 'HIT' if cached else 'MISS',
+        'X-Payment-Response': payment_response
     })
 
+@bp.route('/analytics-status')
+def analytics_status():
+    return jsonify({**analytics.status(), "cache": cache.metrics(), "payments": payments.stats()})
+
 if __name__ == "__main__":
-    app.run(port=5003)
+    from serve import main
+    main('x402_water')
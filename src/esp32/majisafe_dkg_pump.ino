@@ -17,12 +17,14 @@
 #include <SoftwareSerial.h>
 #include <WiFi.h>
 #include <HTTPClient.h>
+#include <WebServer.h>
 #include <ArduinoJson.h>
 #include <TinyGPS++.h>
 
 SoftwareSerial SerialAT(MODEM_RX, MODEM_TX);
 SoftwareSerial SerialGPS(GPS_RX, GPS_TX);
 TinyGPSPlus gps;
+WebServer server(80);
 
 // Network configuration
 const char* ssid = "YOUR_WIFI_SSID";
@@ -36,6 +38,19 @@ String pumpId = "PUMP001";
 unsigned long pumpStartTime = 0;
 bool pumpActive = false;
 
+// Water event the current pump run belongs to (from the DKG Bridge response)
+String currentEventId = "";
+
+// Per-second flow samples for the telemetry batch sent when the pump stops
+#define MAX_FLOW_SAMPLES 120
+float flowSamples[MAX_FLOW_SAMPLES];
+unsigned long flowSampleMillis[MAX_FLOW_SAMPLES];
+int flowSampleCount = 0;
+
+// Bridge commands: acked at once, run from loop() so the ack is never held up
+String lastCommandId = "";
+int pendingPumpSeconds = 0;
+
 // GPS coordinates
 double latitude = 0.0;
 double longitude = 0.0;
@@ -53,12 +68,22 @@ void setup() {
   initModem();
   initWiFi();
   initGPS();
+  initWebServer();
   
   Serial.println("🌊 MajiSafe DKG Pump Controller Ready");
   Serial.println("🔗 OriginTrail DKG Integration Active");
 }
 
 void loop() {
+  server.handleClient();
+  
+  // Run a pump command acked by /activate or /confirm-web3
+  if (pendingPumpSeconds > 0 && !pumpActive) {
+    int seconds = pendingPumpSeconds;
+    pendingPumpSeconds = 0;
+    activatePump(seconds);
+  }
+  
   // Update GPS coordinates
   updateGPS();
   
@@ -84,6 +109,65 @@ void initWiFi() {
   Serial.println("📶 WiFi Connected: " + WiFi.localIP().toString());
 }
 
+void sendAck(String commandId, bool duplicate) {
+  DynamicJsonDocument ack(256);
+  ack["status"] = "ack";
+  ack["command_id"] = commandId;
+  ack["pump_id"] = pumpId;
+  ack["duplicate"] = duplicate;
+  
+  String response;
+  serializeJson(ack, response);
+  server.send(200, "application/json", response);
+}
+
+void initWebServer() {
+  // Bridge activation command: {"pump_id", "duration", "command", "command_id"}
+  server.on("/activate", HTTP_POST, []() {
+    DynamicJsonDocument command(512);
+    if (deserializeJson(command, server.arg("plain"))) {
+      server.send(400, "application/json", "{\"status\":\"error\",\"message\":\"Invalid JSON\"}");
+      return;
+    }
+    
+    String commandId = command["command_id"] | "";
+    String targetPump = command["pump_id"] | "";
+    if (targetPump != pumpId) {
+      server.send(404, "application/json", "{\"status\":\"error\",\"message\":\"Unknown pump\"}");
+      return;
+    }
+    
+    // A retried command whose ack was lost: ack again, do not run twice
+    if (commandId.length() > 0 && commandId == lastCommandId) {
+      sendAck(commandId, true);
+      return;
+    }
+    if (pumpActive || pendingPumpSeconds > 0) {
+      server.send(503, "application/json", "{\"status\":\"error\",\"message\":\"Pump busy\"}");
+      return;
+    }
+    
+    lastCommandId = commandId;
+    pendingPumpSeconds = command["duration"] | 10;
+    Serial.println("📡 Command " + commandId + ": activate for " + String(pendingPumpSeconds) + "s");
+    sendAck(commandId, false);
+  });
+  
+  // Web3 payment confirmation forwarded by the bridge (form fields)
+  server.on("/confirm-web3", HTTP_POST, []() {
+    if (!server.hasArg("tx_hash") || !server.hasArg("event_id")) {
+      server.send(400, "application/json", "{\"status\":\"error\",\"message\":\"Missing parameters\"}");
+      return;
+    }
+    
+    Serial.println("✅ Web3 payment confirmed: " + server.arg("tx_hash"));
+    server.send(200, "application/json", "{\"status\":\"success\",\"message\":\"Payment confirmed\"}");
+  });
+  
+  server.begin();
+  Serial.println("🌐 Command server listening on " + WiFi.localIP().toString());
+}
+
 void initModem() {
   pinMode(MODEM_PWKEY, OUTPUT);
   pinMode(MODEM_RST, OUTPUT);
@@ -189,6 +273,7 @@ void sendToDKGBridge(DynamicJsonDocument& smsData) {
       deserializeJson(responseDoc, response);
       
       if (responseDoc["success"]) {
+        currentEventId = responseDoc["event_id"].as<String>();
         Serial.println("🔗 Knowledge Asset UAL: " + responseDoc["ual"].as<String>());
         Serial.println("🔐 Verification Hash: " + responseDoc["verification_hash"].as<String>());
       }
@@ -210,8 +295,19 @@ void activatePump(int seconds) {
   digitalWrite(PUMP_PIN, HIGH);
   Serial.println("⚡ Pump ON");
   
-  // Run pump for specified duration
-  delay(seconds * 1000);
+  // Run pump for specified duration, sampling the flow sensor every second
+  flowSampleCount = 0;
+  int lastPulses = 0;
+  for (int s = 0; s < seconds; s++) {
+    delay(1000);
+    int pulses = flowPulses;
+    if (flowSampleCount < MAX_FLOW_SAMPLES) {
+      flowSamples[flowSampleCount] = (pulses - lastPulses) * 0.1; // 0.1L per pulse
+      flowSampleMillis[flowSampleCount] = millis();
+      flowSampleCount++;
+    }
+    lastPulses = pulses;
+  }
   
   digitalWrite(PUMP_PIN, LOW);
   pumpActive = false;
@@ -229,8 +325,9 @@ void activatePump(int seconds) {
 }
 
 void sendPumpCompletionData(float liters, int duration) {
-  DynamicJsonDocument completionData(512);
+  DynamicJsonDocument completionData(512 + MAX_FLOW_SAMPLES * 48);
   completionData["event"] = "pump_completion";
+  completionData["event_id"] = currentEventId;
   completionData["pump_id"] = pumpId;
   completionData["liters_dispensed"] = liters;
   completionData["duration_seconds"] = duration;
@@ -239,6 +336,15 @@ void sendPumpCompletionData(float liters, int duration) {
   completionData["coordinates"]["lng"] = longitude;
   completionData["timestamp"] = millis();
   
+  // No wall clock on the ESP32: each sample says how long before sending it was taken
+  JsonArray readings = completionData.createNestedArray("readings");
+  unsigned long now = millis();
+  for (int i = 0; i < flowSampleCount; i++) {
+    JsonObject reading = readings.createNestedObject();
+    reading["age_ms"] = now - flowSampleMillis[i];
+    reading["liters"] = flowSamples[i];
+  }
+  
   // Send to DKG Bridge for Knowledge Asset update
   if (WiFi.status() == WL_CONNECTED) {
     HTTPClient http;
@@ -65,7 +65,7 @@ void connectWiFi() {
 }
 
 // --- Process Payment SMS with MajiSafe AI ---
-String processPayment(String smsContent, String sender) {
+String processPayment(String smsContent, String sender, String sentAt) {
   if (WiFi.status() != WL_CONNECTED) {
     Serial.println("❌ WiFi disconnected");
     return "Network error. Try again.";
@@ -76,8 +76,8 @@ String processPayment(String smsContent, String sender) {
   http.addHeader("Content-Type", "application/json");
   http.setTimeout(30000);
 
-  // Create JSON payload for MajiSafe AI
-  String jsonData = "{\"phone\":\"" + sender + "\",\"message\":\"" + smsContent + "\"}";
+  // Create JSON payload for MajiSafe AI (sent_at lets the bridge spot retries)
+  String jsonData = "{\"phone\":\"" + sender + "\",\"message\":\"" + smsContent + "\",\"sent_at\":\"" + sentAt + "\"}";
   Serial.println("📡 Sending to AI: " + jsonData);
 
   int httpCode = http.POST(jsonData);
@@ -228,6 +228,7 @@ void loop() {
 
           String smsContent = "";
           String sender = "";
+          String sentAt = "";
           bool readingContent = false;
           bool okReceived = false;
 
@@ -248,6 +249,12 @@ void loop() {
                     sender = line.substring(q3 + 1, q4);
                     Serial.println("📞 From: " + sender);
                   }
+                  // Last quoted field is the SMSC timestamp, e.g. "24/01/15,10:30:00+08"
+                  int t2 = line.lastIndexOf('"');
+                  int t1 = line.lastIndexOf('"', t2 - 1);
+                  if (t1 > q4 && t2 > t1) {
+                    sentAt = line.substring(t1 + 1, t2);
+                  }
                   readingContent = true;
                 } else if (readingContent && !line.startsWith("OK")) {
                   if (smsContent.length() > 0) smsContent += "\n";
@@ -271,7 +278,7 @@ void loop() {
             smsContent.toUpperCase(); // Fix: toUpperCase() modifies in place
             if (smsContent.startsWith("PAY")) {
               Serial.println("💰 Processing payment...");
-              String reply = processPayment(smsContent, sender);
+              String reply = processPayment(smsContent, sender, sentAt);
               sendSMS(sender, reply);
             } else {
               // Not a payment SMS
@@ -23,6 +23,7 @@ let signer = null;
 let contract = null;
 let pumpActive = false;
 let smsPaymentReceived = false; // Track SMS payment status
+let smsPaymentPump = null; // Pump the pending SMS payment is for
 
 // Sci-fi status messages
 const statusMessages = [
@@ -125,30 +126,58 @@ async function switchToNetwork() {
 }
 
 async function checkForSMSPayments() {
-    // Check AI Bridge for SMS payment status
+    // Subscribe to AI Bridge push events; fall back to polling without EventSource
     console.log('Starting SMS payment monitoring...');
     
-    setInterval(async () => {
-        try {
-            console.log('Checking SMS status...');
-            const response = await fetch('http://localhost:5001/sms-status');
-            const data = await response.json();
-            
-            console.log('SMS Status:', data);
-            
-            if (data.payment_received && !smsPaymentReceived) {
-                console.log('SMS Payment detected!');
-                smsPaymentReceived = true;
-                updatePurchaseButton();
-                
-                document.getElementById('status').innerHTML = 
-                    `SMS PAYMENT RECEIVED! 📱<br>FROM: ${data.phone}<br>AMOUNT: ${data.amount}<br>READY FOR BLOCKCHAIN CONFIRMATION`;
-            }
-        } catch (error) {
-            console.error('SMS check error:', error);
-            // AI Bridge not responding, keep checking
+    if (typeof EventSource === 'undefined') {
+        setInterval(pollSMSStatus, 5000);
+        return;
+    }
+    
+    const events = new EventSource('http://localhost:5001/events');
+    
+    events.addEventListener('sms_status', (event) => {
+        const data = JSON.parse(event.data);
+        if (data.payment_received) {
+            handleSMSPayment(data.phone, data.amount, data.pump_id);
         }
-    }, 2000); // Check every 2 seconds
+    });
+    
+    events.addEventListener('sms_received', (event) => {
+        const data = JSON.parse(event.data);
+        handleSMSPayment(data.phone, `${data.amount} ${data.currency}`, data.pump_id);
+    });
+    
+    events.onerror = () => {
+        // EventSource reconnects on its own
+        console.error('AI Bridge event stream disconnected, retrying...');
+    };
+}
+
+async function pollSMSStatus() {
+    try {
+        const response = await fetch('http://localhost:5001/sms-status');
+        const data = await response.json();
+        
+        if (data.payment_received) {
+            handleSMSPayment(data.phone, data.amount, data.pump_id);
+        }
+    } catch (error) {
+        console.error('SMS check error:', error);
+        // AI Bridge not responding, keep checking
+    }
+}
+
+function handleSMSPayment(phone, amount, pumpId) {
+    if (smsPaymentReceived) return;
+    
+    console.log('SMS Payment detected!');
+    smsPaymentReceived = true;
+    smsPaymentPump = pumpId || 'PUMP001';
+    updatePurchaseButton();
+    
+    document.getElementById('status').innerHTML = 
+        `SMS PAYMENT RECEIVED! 📱<br>FROM: ${phone}<br>AMOUNT: ${amount}<br>READY FOR BLOCKCHAIN CONFIRMATION`;
 }
 
 function updatePurchaseButton() {
@@ -179,7 +208,8 @@ async function buyWater() {
     try {
         document.getElementById('status').innerHTML = 'PROCESSING BLOCKCHAIN TRANSACTION...';
         
-        const pumpId = ethers.utils.formatBytes32String("PUMP001");
+        const paidPump = smsPaymentPump;
+        const pumpId = ethers.utils.formatBytes32String(paidPump);
         const tx = await contract.buyWater(pumpId, {
             value: ethers.utils.parseEther("0.001")
         });
@@ -198,7 +228,7 @@ async function buyWater() {
         fetch('http://localhost:5001/blockchain-confirmed', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ tx_hash: tx.hash })
+            body: JSON.stringify({ tx_hash: tx.hash, pump_id: paidPump })
         });
         
         // Animate success
@@ -8,7 +8,7 @@ echo "==============================="
 
 # Kill any existing processes
 echo "🧹 Cleaning up existing processes..."
-pkill -f "majisafe_dkg_bridge.py" 2>/dev/null
+pkill -f "serve.py majisafe_dkg_bridge" 2>/dev/null
 pkill -f "python3 -m http.server" 2>/dev/null
 sleep 2
 
@@ -16,12 +16,16 @@ sleep 2
 echo "🔗 Starting DKG Bridge..."
 cd src/ai-bridge
 source venv/bin/activate
-python majisafe_dkg_bridge.py &
+# gunicorn worker pool; SIGTERM lets in-flight SMS finish (see serve.py)
+python serve.py majisafe_dkg_bridge &
 DKG_PID=$!
 cd ../..
 
-# Wait for DKG Bridge to start
-sleep 3
+# Wait for DKG Bridge to answer
+for i in $(seq 1 30); do
+    curl -sf http://localhost:5002/status > /dev/null && break
+    sleep 1
+done
 
 # Start Web Server in background
 echo "🌐 Starting Web Server..."
@@ -56,9 +60,10 @@ echo "Press Ctrl+C to stop all services..."
 cleanup() {
     echo ""
     echo "🛑 Stopping MajiSafe services..."
-    kill $DKG_PID 2>/dev/null
     kill $WEB_PID 2>/dev/null
-    pkill -f "majisafe_dkg_bridge.py" 2>/dev/null
+    # Graceful: the bridge drains in-flight requests and flushes its queues
+    kill -TERM $DKG_PID 2>/dev/null
+    wait $DKG_PID 2>/dev/null
     pkill -f "python3 -m http.server" 2>/dev/null
     echo "✅ All services stopped"
     exit 0